@@ -1,26 +1,82 @@
 import csv
+import itertools
 import os
+import re
 import shutil
+import time
 from datetime import datetime
 from config import logger
 
 
 CSV_FILE = "missed_opportunities.csv"
 LOSS_REVIEW_FILE = "loss_review.csv"
+OUTCOME_FILE = "missed_outcomes.csv"
+TRADE_FILE = "trades.csv"
 MAX_FILE_SIZE_MB = 50
 
+MISSED_HEADER = [
+    '시간', '심볼', '탈락사유', '현재가',
+    'RSI', '거래량배수', 'MA40이격도(%)', 'MA185이격도(%)',
+    'MA40값', 'MA185값', '185선기울기(%)', '골든크로스봉수', '등급',
+    '패턴태그', '기록ID', '마지막시간', '반복횟수', '마지막사유'
+]
+TRADE_HEADER = ['시간', '주문ID', '심볼', '방향', '수량', '평균가', '상태', '분할횟수', '사유']
+OUTCOME_HEADER = ['기록ID', '심볼', '기록시간', '기록가', '구간(분)', '확인시간', '확인가', '수익률(%)', '확인지연(초)']
+
+_record_seq = itertools.count()
+
+# [변화분 기록] 같은 종목의 탈락 상태가 이전 기록과 같으면 새 행 대신 구간(최초/마지막 시각·횟수)만 늘리고,
+# 상태가 바뀌거나 MISSED_RUN_FLUSH_SEC가 지나면 구간 1행으로 기록 (시간=최초, 마지막시간·반복횟수 포함)
+# 구간은 정규화한 사유 범주로 묶으므로 탈락사유=최초 원문, 마지막사유=마지막 반복의 원문
+MISSED_RLE_ENABLED = True
+MISSED_RUN_FLUSH_SEC = 3600
+MISSED_PRICE_EPS_PCT = 0.5  # 현재가·이평값: 구간 첫 기록 대비 변화율(%)이 이 이상이면 새 기록
+MISSED_VALUE_EPS = {  # 지표: 구간 첫 기록 대비 절대 변화가 이 이상이면 새 기록
+    'rsi': 2.0,
+    'vol_ratio': 0.2,
+    'disparity_40_pct': 0.3,
+    'disparity_185_pct': 0.3,
+    'slope_rate': 0.01,
+    'bars_since_gold': 1,
+}
+_PRICE_FIELDS = ('current_price', 'ma40_val', 'ma185_val')
+_open_runs = {}  # symbol -> 진행 중 구간
+_missed_header_checked = False  # 이번 실행에서 기존 파일 헤더를 확인했는지
+
+_DETAIL_RE = re.compile(r'\(.*?\)')
+_NUMBER_RE = re.compile(r'[-+]?\d[\d,.]*(?=\s*(?:봉|%|원|배))')  # 봉수·비율 같은 가변 수치만 (185일선 등 이름은 유지)
+
+
+def normalize_reason(reason):
+    """탈락 사유의 괄호 속 수치·가변 숫자를 걷어내 범주로 묶음 (예: '185일선 하락 조건 불만족(기울기:-0.02%)' → '185일선 하락 조건 불만족')"""
+    if not isinstance(reason, str) or not reason:
+        return '(사유없음)'
+    reason = _NUMBER_RE.sub('#', _DETAIL_RE.sub('', reason)).strip()
+    return reason or '(사유없음)'
+
 
 def ensure_csv_exists():
-    """CSV 파일이 없으면 헤더와 함께 생성 (패턴태그·등급 등 확장 컬럼 포함)"""
+    """CSV 파일이 없으면 헤더와 함께 생성 (패턴태그·등급·기록ID 등 확장 컬럼 포함)"""
+    global _missed_header_checked
     if not os.path.exists(CSV_FILE):
         with open(CSV_FILE, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow([
-                '시간', '심볼', '탈락사유', '현재가',
-                'RSI', '거래량배수', 'MA40이격도(%)', 'MA185이격도(%)',
-                'MA40값', 'MA185값', '185선기울기(%)', '골든크로스봉수', '등급',
-                '패턴태그'
-            ])
+            csv.writer(f).writerow(MISSED_HEADER)
+        _missed_header_checked = True
+        return
+    if _missed_header_checked:
+        return
+    # [확장 컬럼] 이전 헤더로 만들어진 파일은 헤더만 교체 (기존 행의 새 컬럼은 빈칸). 최대 50MB라 스트리밍으로 복사
+    with open(CSV_FILE, 'r', newline='', encoding='utf-8') as f:
+        header = next(csv.reader([f.readline()]), None)
+        if header != MISSED_HEADER:
+            tmp_path = CSV_FILE + ".tmp"
+            with open(tmp_path, 'w', newline='', encoding='utf-8') as out:
+                csv.writer(out).writerow(MISSED_HEADER)
+                shutil.copyfileobj(f, out)
+    if header != MISSED_HEADER:
+        os.replace(tmp_path, CSV_FILE)
+        logger.info(f"[헤더갱신] {CSV_FILE} 헤더 {len(header or [])} → {len(MISSED_HEADER)}컬럼")
+    _missed_header_checked = True
 
 
 def check_and_backup_file():
@@ -37,33 +93,81 @@ def check_and_backup_file():
                 
                 # 새 파일 생성 (헤더만)
                 with open(CSV_FILE, 'w', newline='', encoding='utf-8') as f:
-                    writer = csv.writer(f)
-                    writer.writerow([
-                        '시간', '심볼', '탈락사유', '현재가',
-                        'RSI', '거래량배수', 'MA40이격도(%)', 'MA185이격도(%)',
-                        'MA40값', 'MA185값', '185선기울기(%)', '골든크로스봉수', '등급',
-                        '패턴태그'
-                    ])
+                    csv.writer(f).writerow(MISSED_HEADER)
                 logger.info(f"[파일재생성] {CSV_FILE} 새로 생성됨")
     except Exception as e:
         logger.error(f"File Backup Error: {e}")
 
 
+def _is_same_state(run, key, values):
+    """진행 중 구간과 같은 상태인지 (사유 범주·등급·태그 동일 + 수치가 구간 첫 기록 대비 허용 오차 이내)"""
+    if run['key'] != key:
+        return False
+    first = run['values']
+    for name, value in values.items():
+        old = first.get(name)
+        if value == old:
+            continue
+        if not isinstance(value, (int, float)) or not isinstance(old, (int, float)):
+            return False
+        if name in _PRICE_FIELDS:
+            if not old or abs(value - old) / abs(old) * 100 >= MISSED_PRICE_EPS_PCT:
+                return False
+        elif abs(value - old) >= MISSED_VALUE_EPS.get(name, 0):
+            return False
+    return True
+
+
+def _write_run(run):
+    ensure_csv_exists()
+    check_and_backup_file()
+    with open(CSV_FILE, 'a', newline='', encoding='utf-8') as f:
+        csv.writer(f).writerow(run['row'] + [run['last'], run['count'], run.get('last_reason', run['row'][2])])
+
+
+def flush_missed_runs(max_age_sec=None):
+    """
+    진행 중 구간을 파일에 기록하고 닫음. max_age_sec가 있으면 그보다 오래 열린 구간만 (주기 호출용),
+    없으면 전부 (종료 시 호출)
+    """
+    now = time.time()
+    for symbol, run in list(_open_runs.items()):
+        if max_age_sec is not None and now - run['opened_at'] < max_age_sec:
+            continue
+        try:
+            _write_run(run)
+        except Exception as e:
+            logger.error(f"Missed Run Flush Error ({symbol}): {e}")
+        del _open_runs[symbol]
+
+
+def missed_runs_snapshot():
+    """상태 스냅샷용 진행 중 구간 (종료 처리 없이 죽어도 재시작 후 이어서 집계)"""
+    return _open_runs
+
+
+def restore_missed_runs(saved):
+    _open_runs.clear()
+    for symbol, run in (saved or {}).items():
+        _open_runs[symbol] = {**run, 'key': tuple(run['key'])}  # JSON에서 list로 바뀐 상태 키를 비교 가능한 tuple로
+
+
 def record_missed_opportunity(symbol, reason, current_price, data_dict=None):
     """
     매수 신호가 오지 않은 종목 또는 미지 패턴(조건 1개라도 만족/3분 내 3% 급등) 정보를 CSV에 기록.
     조건 탈락 여부와 관계없이 계산된 모든 수치(RSI, 이격도, 기울기 등)를 빈칸 없이 기록.
+    직전 기록과 상태가 같으면 구간 반복으로만 집계하고 행은 구간이 끝날 때 1번 씁니다.
     
     Args:
         symbol: 종목 심볼 (예: BTC/KRW)
         reason: 탈락 사유 또는 패턴 요약
         current_price: 현재가
         data_dict: 판단 근거 수치 딕셔너리 (rsi, vol_ratio, disparity_40_pct, pattern_labels 등)
+
+    Returns:
+        str: 새 구간의 기록ID (사후 수익률 결과를 이 행과 연결하는 키). 기존 구간 반복이거나 기록 실패 시 None
     """
     try:
-        ensure_csv_exists()
-        check_and_backup_file()
-        
         timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         
         if data_dict is None:
@@ -82,6 +186,21 @@ def record_missed_opportunity(symbol, reason, current_price, data_dict=None):
         # [신규] 패턴 태그: 정배열 / 단기역습 / 바닥탈출
         pattern_labels = data_dict.get('pattern_labels', [])
         pattern_tag = '|'.join(pattern_labels) if isinstance(pattern_labels, (list, tuple)) else str(pattern_labels or '')
+
+        # [변화분 기록] 진행 중 구간과 같은 상태면 반복 횟수만 증가
+        key = (normalize_reason(reason), grade, pattern_tag)
+        values = {
+            'current_price': current_price, 'rsi': rsi, 'vol_ratio': vol_ratio,
+            'disparity_40_pct': disparity_40_pct, 'disparity_185_pct': disparity_185_pct,
+            'ma40_val': ma40_val, 'ma185_val': ma185_val, 'slope_rate': slope_rate, 'bars_since_gold': bars_since_gold,
+        }
+        run = _open_runs.get(symbol)
+        if MISSED_RLE_ENABLED and run and time.time() - run['opened_at'] < MISSED_RUN_FLUSH_SEC \
+                and _is_same_state(run, key, values):
+            run['last'] = timestamp
+            run['last_reason'] = reason
+            run['count'] += 1
+            return None
         
         # 수치 포맷팅 (조건 탈락 여부와 관계없이 끝까지 계산된 값 사용)
         rsi_str = f"{rsi:.2f}" if isinstance(rsi, (int, float)) else str(rsi)
@@ -92,36 +211,64 @@ def record_missed_opportunity(symbol, reason, current_price, data_dict=None):
         ma185_str = f"{ma185_val:,.0f}" if isinstance(ma185_val, (int, float)) else str(ma185_val)
         slope_str = f"{slope_rate:.4f}" if isinstance(slope_rate, (int, float)) else str(slope_rate)
         bars_str = str(bars_since_gold) if bars_since_gold != '' and bars_since_gold is not None else ''
-        
-        with open(CSV_FILE, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow([
+
+        record_id = f"{int(time.time() * 1000)}-{next(_record_seq) % 1000:03d}"
+        new_run = {
+            'row': [
                 timestamp, symbol, reason, f"{current_price:,.0f}",
                 rsi_str, vol_ratio_str, disparity_40_str, disparity_185_str,
                 ma40_str, ma185_str, slope_str, bars_str, grade,
-                pattern_tag
-            ])
+                pattern_tag, record_id
+            ],
+            'key': key, 'values': values, 'last': timestamp, 'last_reason': reason, 'count': 1, 'opened_at': time.time(),
+        }
+        if run:
+            _write_run(run)
+        if MISSED_RLE_ENABLED:
+            _open_runs[symbol] = new_run
+        else:
+            _open_runs.pop(symbol, None)
+            _write_run(new_run)
         
-        logger.info(f"[분석기록] {symbol} | 사유: {reason} | RSI: {rsi_str} | 거래량배수: {vol_ratio_str} | 태그: {pattern_tag}")
+        logger.info(
+            f"[분석기록] {symbol} | 사유: {reason} | RSI: {rsi_str} | 거래량배수: {vol_ratio_str} | 태그: {pattern_tag}",
+            extra={'fields': {'symbol': symbol, 'reason': key[0], 'grade': grade, 'price': current_price,
+                              'rsi': rsi, 'vol_ratio': vol_ratio, 'tag': pattern_tag, 'record_id': record_id}}
+        )
+        return record_id
         
     except Exception as e:
         logger.error(f"Missed Opportunity Record Error ({symbol}): {e}")
+        return None
+
+
+LOSS_REVIEW_HEADER = [
+    '시간', '심볼', '손절가', '목표손절가', '슬리피지(%)', '슬리피지_2pct이상',
+    '직전1분_시가', '직전1분_종가', '직전1분_하락속도(%)',
+    '집행직전_최우선호가', '호가기준_예상체결가', '예상슬리피지(%)', '실현슬리피지(%)', '분할횟수'
+]
 
 
 def ensure_loss_review_exists():
-    """loss_review.csv 헤더 생성 (손절 슬리피지·직전 1분 하락속도)"""
+    """loss_review.csv 헤더 생성 (손절 슬리피지·직전 1분 하락속도·호가 기준 예상/실현 슬리피지)"""
     if not os.path.exists(LOSS_REVIEW_FILE):
         with open(LOSS_REVIEW_FILE, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow([
-                '시간', '심볼', '손절가', '목표손절가', '슬리피지(%)', '슬리피지_2pct이상',
-                '직전1분_시가', '직전1분_종가', '직전1분_하락속도(%)'
-            ])
+            csv.writer(f).writerow(LOSS_REVIEW_HEADER)
+        return
+    # [확장 컬럼] 이전 헤더로 만들어진 파일은 헤더만 교체 (기존 행의 새 컬럼은 빈칸)
+    with open(LOSS_REVIEW_FILE, 'r', newline='', encoding='utf-8') as f:
+        rows = list(csv.reader(f))
+    if rows and rows[0] != LOSS_REVIEW_HEADER:
+        rows[0] = LOSS_REVIEW_HEADER
+        with open(LOSS_REVIEW_FILE, 'w', newline='', encoding='utf-8') as f:
+            csv.writer(f).writerows(rows)
 
 
-def record_loss_review(symbol, sell_price, target_stop_price, slippage_pct, last_1m_open, last_1m_close):
+def record_loss_review(symbol, sell_price, target_stop_price, slippage_pct, last_1m_open, last_1m_close,
+                       ref_price=None, est_price=None, est_slippage_pct=None, realized_slippage_pct=None, slices=None):
     """
     손절 시 복기 데이터: -2% 이상 슬리피지 여부, 손절 직전 1분간 하락 속도를 loss_review.csv에 기록.
+    주문 엔진이 호가로 계산한 예상 슬리피지와 같은 기준(집행 직전 최우선호가)의 실현 슬리피지도 함께 기록.
     """
     try:
         ensure_loss_review_exists()
@@ -134,22 +281,55 @@ def record_loss_review(symbol, sell_price, target_stop_price, slippage_pct, last
                 symbol, f"{sell_price:,.0f}", f"{target_stop_price:,.0f}",
                 f"{slippage_pct:.2f}", slip_over_2,
                 f"{last_1m_open:,.0f}" if last_1m_open else '', f"{last_1m_close:,.0f}" if last_1m_close else '',
-                f"{drop_speed_1m:.4f}" if isinstance(drop_speed_1m, (int, float)) else drop_speed_1m
+                f"{drop_speed_1m:.4f}" if isinstance(drop_speed_1m, (int, float)) else drop_speed_1m,
+                f"{ref_price:,.0f}" if ref_price else '', f"{est_price:,.0f}" if est_price else '',
+                f"{est_slippage_pct:.2f}" if est_slippage_pct is not None else '',
+                f"{realized_slippage_pct:.2f}" if realized_slippage_pct is not None else '',
+                slices if slices else ''
             ])
-        logger.info(f"[손절복기] {symbol} | 슬리피지: {slippage_pct:.2f}% | 직전1분하락: {drop_speed_1m}")
+        logger.info(f"[손절복기] {symbol} | 슬리피지: {slippage_pct:.2f}% | 직전1분하락: {drop_speed_1m} | 예상/실현: {est_slippage_pct}/{realized_slippage_pct}")
     except Exception as e:
         logger.error(f"Loss Review Record Error ({symbol}): {e}")
 
 
-def update_missed_opportunity_return(symbol, record_time_str, price_at_record, price_60m_later):
+def update_missed_opportunity_return(symbol, record_time_str, price_at_record, price_60m_later,
+                                     record_id='', horizon_min=60, check_delay_sec=0.0):
     """
-    기록된 종목의 60분 후 가격을 조회하여 실제 수익률을 로그에 업데이트.
-    (CSV 행을 직접 수정하지 않고, 로그로 남겨 analyzer가 나중에 매칭할 수 있도록 함)
+    기록된 종목의 60분 후 가격을 조회하여 실제 수익률을 기록.
+    원본 CSV 행은 수정하지 않고, 기록ID로 조인할 수 있는 결과 테이블(missed_outcomes.csv)에 한 줄 추가.
     """
     try:
         if not price_at_record or price_at_record == 0:
             return
         ret_60m = (price_60m_later - price_at_record) / price_at_record * 100
-        logger.info(f"[60분수익률] {symbol} | 기록시점: {record_time_str} | 기록가: {price_at_record:,.0f} | 60분후: {price_60m_later:,.0f} | 수익률: {ret_60m:+.2f}%")
+        if not os.path.exists(OUTCOME_FILE):
+            with open(OUTCOME_FILE, 'w', newline='', encoding='utf-8') as f:
+                csv.writer(f).writerow(OUTCOME_HEADER)
+        with open(OUTCOME_FILE, 'a', newline='', encoding='utf-8') as f:
+            csv.writer(f).writerow([
+                record_id, symbol, record_time_str, f"{price_at_record:.8g}", horizon_min,
+                datetime.now().strftime('%Y-%m-%d %H:%M:%S'), f"{price_60m_later:.8g}",
+                f"{ret_60m:.4f}", f"{check_delay_sec:.1f}"
+            ])
+        logger.info(f"[60분수익률] {symbol} | 기록시점: {record_time_str} | 기록가: {price_at_record:,.0f} | 60분후: {price_60m_later:,.0f} | 수익률: {ret_60m:+.2f}% | ID: {record_id}")
     except Exception as e:
         logger.error(f"Update Missed Return Error ({symbol}): {e}")
+
+
+def record_trade(order):
+    """주문 엔진의 체결 완료 주문 1건을 trades.csv에 기록 (오프라인 라벨링의 체결 기록 원천)"""
+    try:
+        if not order.get('filled'):
+            return
+        if not os.path.exists(TRADE_FILE):
+            with open(TRADE_FILE, 'w', newline='', encoding='utf-8') as f:
+                csv.writer(f).writerow(TRADE_HEADER)
+        with open(TRADE_FILE, 'a', newline='', encoding='utf-8') as f:
+            csv.writer(f).writerow([
+                datetime.fromtimestamp(order.get('submitted_at') or time.time()).strftime('%Y-%m-%d %H:%M:%S'),
+                order['client_id'], order['symbol'], order['side'], f"{order['filled']:.8g}",
+                f"{order['average']:.8g}" if order.get('average') else '', order['status'],
+                len(order.get('legs') or []), order.get('reason', '')
+            ])
+    except Exception as e:
+        logger.error(f"Trade Record Error ({order.get('symbol')}): {e}")
@@ -0,0 +1,102 @@
+import glob
+import os
+import numpy as np
+import pandas as pd
+from config import logger
+
+
+# [캔들 저장소] 스캔 중 받은 OHLCV의 확정봉을 종목·타임프레임별 CSV에 이어 붙여 둡니다. (오프라인 라벨링용, 거래소 재조회 없음)
+# 마지막 봉은 아직 진행 중이므로 저장하지 않고, 이미 저장된 시각 이후 봉만 추가합니다.
+# append는 메모리 버퍼에 모으기만 하고, 파일 쓰기는 스캔 1회분을 write_batch로 한꺼번에 (메인은 asyncio.to_thread로 호출)
+CANDLE_STORE_ENABLED = True
+CANDLE_DIR = "candle_data"
+STORE_TIMEFRAMES = ('30m', '1m')
+
+_last_ts = {}  # (symbol, timeframe) -> 버퍼에 넣은 마지막 봉 시각(ms) (같은 봉 중복 버퍼링 방지)
+_file_last_ts = {}  # (symbol, timeframe) -> 파일에 저장된 마지막 봉 시각(ms) (write_batch에서만 사용)
+_pending = {}  # (symbol, timeframe) -> 아직 파일에 쓰지 않은 확정봉 [[ts, o, h, l, c, v], ...]
+
+
+def _path(symbol, timeframe):
+    return os.path.join(CANDLE_DIR, f"{symbol.replace('/', '_')}_{timeframe}.csv")
+
+
+def _read_last_ts(path):
+    """파일 마지막 줄의 봉 시각 (프로세스 시작 후 첫 저장 때 1회)"""
+    try:
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 256))
+            tail = f.read().decode('utf-8', 'ignore').strip().splitlines()
+        return int(float(tail[-1].split(',')[0])) if tail else 0
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def append(symbol, timeframe, ohlcv):
+    """[[ts, o, h, l, c, v], ...] 응답 중 새 확정봉만 버퍼에 추가 (파일 I/O 없음)"""
+    if not CANDLE_STORE_ENABLED or timeframe not in STORE_TIMEFRAMES or not ohlcv or len(ohlcv) < 2:
+        return
+    key = (symbol, timeframe)
+    last = _last_ts.get(key, 0)
+    rows = [r for r in ohlcv[:-1] if r[0] > last]
+    if rows:
+        _pending.setdefault(key, []).extend(rows)
+        _last_ts[key] = int(rows[-1][0])
+
+
+def take_pending():
+    """버퍼를 떼어 내 반환 (이벤트 루프에서 호출해 write_batch 스레드로 넘김)"""
+    global _pending
+    batch, _pending = _pending, {}
+    return batch
+
+
+def write_batch(batch):
+    """take_pending()으로 떼어 낸 확정봉을 파일마다 한 번씩 열어 이어 씀 (파일에 이미 있는 시각 이하는 제외)"""
+    for key, rows in batch.items():
+        symbol, timeframe = key
+        path = _path(symbol, timeframe)
+        try:
+            last = _file_last_ts.get(key)
+            if last is None:
+                os.makedirs(CANDLE_DIR, exist_ok=True)
+                last = _file_last_ts[key] = _read_last_ts(path)
+            rows = [r for r in rows if r[0] > last]
+            if not rows:
+                continue
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(''.join(f"{int(r[0])},{r[1]},{r[2]},{r[3]},{r[4]},{r[5]}\n" for r in rows))
+            _file_last_ts[key] = int(rows[-1][0])
+        except Exception as e:
+            logger.error(f"Candle Store Error ({symbol} {timeframe}): {e}")
+
+
+def flush():
+    """버퍼를 바로 기록 (스캔 워커 프로세스·종료 시 동기 호출용)"""
+    write_batch(take_pending())
+
+
+def load(timeframe, symbols=None):
+    """
+    저장된 캔들을 한 DataFrame으로 (symbol, time 정렬).
+    Columns: symbol(category), time(datetime64, UTC), open, high, low, close, vol
+    """
+    frames = []
+    suffix = f"_{timeframe}.csv"
+    for path in glob.glob(os.path.join(CANDLE_DIR, f"*{suffix}")):
+        symbol = os.path.basename(path)[:-len(suffix)].replace('_', '/', 1)
+        if symbols is not None and symbol not in symbols:
+            continue
+        arr = np.loadtxt(path, delimiter=',', ndmin=2, dtype=np.float64)
+        if not len(arr):
+            continue
+        frame = pd.DataFrame(arr[:, 1:], columns=['open', 'high', 'low', 'close', 'vol'])
+        frame.insert(0, 'time', pd.to_datetime(arr[:, 0].astype(np.int64), unit='ms'))
+        frame.insert(0, 'symbol', symbol)
+        frames.append(frame)
+    if not frames:
+        return None
+    df = pd.concat(frames, ignore_index=True)
+    df['symbol'] = df['symbol'].astype('category')
+    return df.drop_duplicates(['symbol', 'time'], keep='last').sort_values(['symbol', 'time'], ignore_index=True)
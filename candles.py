@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+
+
+CANDLE_COLUMNS = ['time', 'open', 'high', 'low', 'close', 'vol']
+
+
+class Candles:
+    """
+    [경량 캔들] 거래소 OHLCV 응답을 ndarray 하나로 받아 두는 컨테이너.
+    - 가격/거래량: float64 (n, 5) 배열, 시각: int64 (n,) 배열
+    - to_frame(): 같은 메모리를 공유하는 DataFrame 뷰 (기존 pandas 기반 로직 호환용, 1회 생성 후 재사용)
+    """
+    __slots__ = ('time', 'values', '_frame')
+
+    def __init__(self, time, values):
+        self.time = time
+        self.values = values
+        self._frame = None
+
+    @classmethod
+    def from_ohlcv(cls, ohlcv):
+        """[[ts, o, h, l, c, v], ...] 응답을 한 번의 배열 할당으로 변환 (ms 시각은 float64로 손실 없이 표현됨)"""
+        arr = np.asarray(ohlcv, dtype=np.float64)
+        if arr.ndim != 2 or len(arr) == 0:
+            arr = np.empty((0, 6), dtype=np.float64)
+        return cls(arr[:, 0].astype(np.int64), arr[:, 1:])
+
+    def __len__(self):
+        return len(self.values)
+
+    def with_tail(self, ohlcv):
+        """
+        최근 봉 몇 개만 다시 받은 응답으로 꼬리를 갱신한 새 Candles (길이는 그대로 유지).
+        응답 첫 봉 시각부터는 새 값으로 교체하고(진행 중 봉 포함), 앞쪽은 기존 배열을 재사용
+        """
+        tail = Candles.from_ohlcv(ohlcv)
+        if not len(tail):
+            return self
+        keep = int(np.searchsorted(self.time, tail.time[0], side='left'))
+        time = np.concatenate((self.time[:keep], tail.time))
+        values = np.concatenate((self.values[:keep], tail.values))
+        n = max(len(self), len(tail))
+        return Candles(time[-n:], values[-n:])
+
+    @property
+    def open(self):
+        return self.values[:, 0]
+
+    @property
+    def high(self):
+        return self.values[:, 1]
+
+    @property
+    def low(self):
+        return self.values[:, 2]
+
+    @property
+    def close(self):
+        return self.values[:, 3]
+
+    @property
+    def vol(self):
+        return self.values[:, 4]
+
+    def last_close(self):
+        return float(self.values[-1, 3])
+
+    def sma_last(self, period):
+        """마지막 봉 기준 단순이동평균 (rolling(period).mean().iloc[-1]과 동일, 봉 부족 시 NaN)"""
+        if len(self.values) < period:
+            return float('nan')
+        return float(self.values[-period:, 3].mean())
+
+    def to_frame(self):
+        """복사 없는 DataFrame 뷰. 전략 함수가 추가하는 지표 컬럼도 이 뷰에 남습니다."""
+        if self._frame is None:
+            frame = pd.DataFrame(self.values, columns=CANDLE_COLUMNS[1:], copy=False)
+            frame.insert(0, 'time', self.time)
+            self._frame = frame
+        return self._frame
+
+
+def as_frame(data):
+    """Candles 또는 DataFrame을 받아 DataFrame으로 돌려줍니다. (None은 그대로)"""
+    if isinstance(data, Candles):
+        return data.to_frame()
+    return data
@@ -0,0 +1,145 @@
+import argparse
+import os
+import time
+import numpy as np
+import pandas as pd
+import analyzer
+import candle_store
+import missed_report
+
+
+# [오프라인 라벨링] 미지 기록(missed_opportunities*)과 체결 기록(trades.csv)을 저장된 캔들에 as-of 조인해
+# 구간별 이후 수익률 / 최대 유리 움직임(MFE) / 최대 불리 움직임(MAE)을 붙입니다. 거래소 호출 없음.
+#   사용 예: python label_signals.py --tf 30m --out signal_labels.csv
+HORIZONS = {'15m': 15, '60m': 60, '4h': 240, '24h': 1440}  # 라벨명 -> 분
+TF_MINUTES = {'1m': 1, '30m': 30}
+LABEL_FILE = "signal_labels.csv"
+LOCAL_UTC_OFFSET = pd.Timedelta(seconds=-time.timezone)  # 기록 시각(로컬) ↔ 캔들 시각(UTC) 보정
+
+
+def load_missed_records(directory="."):
+    """미지 기록 전 컬럼 + record_type/record_id/time/entry_price"""
+    frames = []
+    for path in missed_report.find_missed_files(directory):
+        for chunk in pd.read_csv(path, names=missed_report.COLUMNS, header=None, skiprows=1, dtype=str,
+                                 chunksize=missed_report.CHUNK_ROWS, on_bad_lines='skip', encoding='utf-8'):
+            # 기록ID가 없는 이전 행은 파일명#행번호로 식별
+            fallback = os.path.basename(path) + '#' + (chunk.index + 2).astype(str)
+            chunk['record_id'] = chunk['기록ID'].fillna(pd.Series(fallback, index=chunk.index))
+            frames.append(chunk)
+    if not frames:
+        return None
+    df = pd.concat(frames, ignore_index=True)
+    df['time'] = pd.to_datetime(df['시간'], errors='coerce', format='%Y-%m-%d %H:%M:%S')
+    df['entry_price'] = missed_report._to_number(df['현재가'])
+    df['symbol'] = df['심볼']
+    df['record_type'] = 'missed'
+    return df[df['time'].notna()]
+
+
+def load_trade_records(directory="."):
+    path = os.path.join(directory, analyzer.TRADE_FILE)
+    if not os.path.exists(path):
+        return None
+    df = pd.read_csv(path, dtype=str, encoding='utf-8')
+    df['time'] = pd.to_datetime(df['시간'], errors='coerce', format='%Y-%m-%d %H:%M:%S')
+    df['entry_price'] = pd.to_numeric(df['평균가'], errors='coerce')
+    df['symbol'] = df['심볼']
+    df['record_id'] = df['주문ID']
+    df['record_type'] = 'trade_' + df['방향']
+    return df[df['time'].notna()]
+
+
+def _range_extremes(high, low, first, last):
+    """
+    행마다 봉 구간 [first, last]의 최고가·최저가 (last < first면 NaN).
+    구간 길이(봉 수)는 라벨 구간/봉 길이 정도라 오프셋별로 한 번씩 벡터 연산
+    """
+    span = np.where(last >= first, last - first + 1, 0)
+    top = np.full(len(first), np.nan)
+    bottom = np.full(len(first), np.nan)
+    for k in range(int(span.max()) if len(span) else 0):
+        take = span > k
+        idx = first[take] + k
+        top[take] = np.fmax(top[take], high[idx])
+        bottom[take] = np.fmin(bottom[take], low[idx])
+    return top, bottom
+
+
+def label(records, candles, tf_minutes, horizons=HORIZONS):
+    """
+    records(symbol, time, entry_price 포함)에 구간별 ret_/mfe_/mae_ 컬럼(%)을 붙여 반환.
+    봉 시각은 시가 시각이라 조인은 봉 마감 시각(시각+tf) 기준 → 기록 시각에 아직 안 끝난 봉의 값은 쓰지 않음
+    - 기준 봉: 기록 시각까지 마감된 마지막 봉 (as-of, 봉 2개 이상 비어 있으면 라벨 없음)
+    - 수익률: 기록 시각+구간 시점까지 마감된 마지막 봉의 종가 / 기록가 - 1
+    - MFE/MAE: 기준 봉 다음 봉부터 수익률에 쓴 봉까지의 최고가/최저가 기준
+    - 그 사이에 마감된 봉이 없으면(구간이 봉 길이보다 짧은 경우 등) 세 값 모두 NaN → --tf 1m 사용
+    """
+    candles = candles.copy()
+    candles['close_time'] = candles['time'] + LOCAL_UTC_OFFSET + pd.Timedelta(minutes=tf_minutes)
+    candles['bar'] = np.arange(len(candles))
+    tolerance = pd.Timedelta(minutes=tf_minutes * 2)
+
+    symbols = candles['symbol'].cat.categories
+    recs = records[records['symbol'].isin(symbols)].copy()
+    recs['symbol'] = pd.Categorical(recs['symbol'], categories=symbols)
+    recs = recs.sort_values('time', kind='stable')
+    ordered = candles.sort_values('close_time', kind='stable')[['close_time', 'symbol', 'bar']]
+
+    def bar_at(times):
+        """종목별로 times까지 마감된 마지막 봉 번호 (없으면 -1)"""
+        found = pd.merge_asof(pd.DataFrame({'close_time': times.to_numpy(), 'symbol': recs['symbol'].array}),
+                              ordered, on='close_time', by='symbol', direction='backward', tolerance=tolerance)['bar']
+        return found.fillna(-1).to_numpy(dtype=np.int64)
+
+    base = bar_at(recs['time'])
+    entry = recs['entry_price'].to_numpy(dtype=np.float64)
+    close = candles['close'].to_numpy(dtype=np.float64)
+    high = candles['high'].to_numpy(dtype=np.float64)
+    low = candles['low'].to_numpy(dtype=np.float64)
+
+    for name, minutes in horizons.items():
+        later = bar_at(recs['time'] + pd.Timedelta(minutes=minutes))
+        # 같은 종목 봉은 bar 번호가 연속 → (기준 봉, 이후 봉] 구간이 곧 그 사이 마감된 봉들
+        complete = (base >= 0) & (later > base) & (entry > 0)
+        fwd_high, fwd_low = _range_extremes(high, low, np.where(complete, base + 1, 0), np.where(complete, later, -1))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            recs[f'ret_{name}'] = np.where(complete, (close[np.where(complete, later, 0)] / entry - 1) * 100, np.nan)
+            recs[f'mfe_{name}'] = np.where(complete, (fwd_high / entry - 1) * 100, np.nan)
+            recs[f'mae_{name}'] = np.where(complete, (fwd_low / entry - 1) * 100, np.nan)
+    recs['symbol'] = recs['symbol'].astype(str)
+    return recs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="기록된 신호 다중 구간 라벨링 (저장된 캔들 기준)")
+    parser.add_argument('--dir', default='.', help="기록 파일 폴더")
+    parser.add_argument('--tf', default='30m', choices=sorted(TF_MINUTES), help="라벨 계산에 쓸 저장 캔들 타임프레임")
+    parser.add_argument('--out', default=LABEL_FILE)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    records = [r for r in (load_missed_records(args.dir), load_trade_records(args.dir)) if r is not None]
+    if not records:
+        print("기록 없음")
+        return
+    records = pd.concat(records, ignore_index=True)
+    candles = candle_store.load(args.tf)
+    if candles is None:
+        print(f"저장된 {args.tf} 캔들 없음: {candle_store.CANDLE_DIR}/")
+        return
+    t_load = time.perf_counter() - t0
+
+    labeled = label(records, candles, TF_MINUTES[args.tf])
+    labeled.drop(columns=['시간', '심볼']).to_csv(args.out, index=False, encoding='utf-8')
+    elapsed = time.perf_counter() - t0
+
+    print(f"📂 기록 {len(records):,}건 | 캔들 {len(candles):,}봉 ({args.tf}) | 로드 {t_load:.2f}초 | 전체 {elapsed:.2f}초 → {args.out}")
+    for name in HORIZONS:
+        col = labeled[f'ret_{name}']
+        print(f"  {name:>4}: 라벨 {col.notna().sum():,}건 | 평균 {col.mean():+.2f}% | "
+              f"MFE 평균 {labeled[f'mfe_{name}'].mean():+.2f}% | MAE 평균 {labeled[f'mae_{name}'].mean():+.2f}%")
+
+
+if __name__ == "__main__":
+    main()
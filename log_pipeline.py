@@ -0,0 +1,174 @@
+import atexit
+import glob
+import json
+import logging
+import os
+import queue
+import re
+import time
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+
+# [비동기 로깅] 로거 호출은 큐에 넣기만 하고, 파일/콘솔 쓰기는 백그라운드 리스너 스레드가 처리 (이벤트 루프에서 파일 I/O 없음)
+# - 기존 핸들러(콘솔·텍스트 로그)는 리스너 뒤로 옮겨 그대로 유지하고, JSON 한 줄 로그를 추가로 남김
+# - 메시지 앞 [태그]를 카테고리로 보고, JSON 로그에서만 대량 카테고리를 N건 중 1건만 남김 (WARNING 이상은 항상 기록,
+#   콘솔·텍스트 로그는 기존대로 전부 기록)
+# - JSON 로그는 날짜가 바뀌거나 크기 상한을 넘으면 회전 (trading_bot.jsonl.YYYY-MM-DD[.n])
+LOG_JSON_FILE = "trading_bot.jsonl"
+LOG_MAX_BYTES = 50 * 1024 * 1024
+LOG_BACKUP_DAYS = 14
+LOG_QUEUE_SIZE = 100_000  # 가득 차면 버림 (로깅 때문에 호출부가 막히지 않도록)
+LOG_SAMPLE_EVERY = {  # 카테고리 -> JSON 로그에 N건 중 1건 기록
+    '분석기록': 10,
+}
+
+_TAG_RE = re.compile(r'^\[([^\]]+)\]')
+_listener = None
+_dropped = 0
+
+
+def category_of(message):
+    m = _TAG_RE.match(message) if isinstance(message, str) else None
+    return m.group(1) if m else ''
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """카테고리를 붙여 큐에 넣음. 큐가 가득 차면 대기하지 않고 버림"""
+
+    def emit(self, record):
+        global _dropped
+        record.category = category_of(record.msg)
+        try:
+            self.enqueue(self.prepare(record))
+        except queue.Full:
+            _dropped += 1
+        except Exception:
+            self.handleError(record)
+
+
+class CategorySampler(logging.Filter):
+    """핸들러 필터: 카테고리별 N건 중 1건만 통과 (WARNING 이상은 항상 통과). 리스너 스레드 1개에서만 호출됨"""
+
+    def __init__(self, sample_every):
+        super().__init__()
+        self.sample_every = dict(sample_every or {})
+        self._counts = {}
+
+    def filter(self, record):
+        category = getattr(record, 'category', None)
+        if category is None:
+            category = category_of(record.msg)
+        every = self.sample_every.get(category)
+        if not every or every <= 1 or record.levelno >= logging.WARNING:
+            return True
+        n = self._counts.get(category, 0)
+        self._counts[category] = n + 1
+        if n % every:
+            return False
+        record.sampled = every
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """한 줄 JSON: ts, level, cat, msg (+ sampled, extra={'fields': {...}}로 넘긴 값)"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'cat': getattr(record, 'category', '') or category_of(record.getMessage()),
+            'msg': record.getMessage(),
+        }
+        if getattr(record, 'sampled', None):
+            entry['sampled'] = record.sampled
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(fields)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DailySizeRotatingHandler(RotatingFileHandler):
+    """날짜 변경 또는 크기 상한 초과 시 회전. 백업은 base.YYYY-MM-DD, 같은 날 추가분은 .1, .2 ..."""
+
+    def __init__(self, filename, max_bytes=LOG_MAX_BYTES, backup_days=LOG_BACKUP_DAYS):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=0, encoding='utf-8')
+        self.backup_days = backup_days
+        self.day = self._file_day()
+
+    def _file_day(self):
+        try:
+            return time.strftime('%Y-%m-%d', time.localtime(os.path.getmtime(self.baseFilename)))
+        except OSError:
+            return time.strftime('%Y-%m-%d')
+
+    def shouldRollover(self, record):
+        if time.strftime('%Y-%m-%d') != self.day:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename):
+            dest = f"{self.baseFilename}.{self.day}"
+            n = 0
+            while os.path.exists(dest):
+                n += 1
+                dest = f"{self.baseFilename}.{self.day}.{n}"
+            os.rename(self.baseFilename, dest)
+        self.day = time.strftime('%Y-%m-%d')
+        self._cleanup()
+        self.stream = self._open()
+
+    def _cleanup(self):
+        cutoff = time.strftime('%Y-%m-%d', time.localtime(time.time() - self.backup_days * 86400))
+        for path in glob.glob(f"{self.baseFilename}.*"):
+            day = path[len(self.baseFilename) + 1:][:10]
+            if day < cutoff:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+def install(target=None, json_file=LOG_JSON_FILE, sample_every=None):
+    """
+    target 로거(기본: config.logger)의 핸들러를 백그라운드 리스너로 옮기고 큐 핸들러로 교체. 여러 번 호출해도 1회만 적용.
+    sample_every(기본: LOG_SAMPLE_EVERY)는 JSON 로그에만 적용
+    Returns: QueueListener
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+    if target is None:
+        from config import logger as target
+    handlers = list(target.handlers)
+    if not handlers and target.propagate:
+        # basicConfig 등 루트 핸들러로 출력하던 경우: 그 핸들러를 리스너로 옮기고 전파를 끊어 중복 출력 방지
+        handlers = list(logging.getLogger().handlers)
+        target.propagate = False
+    if json_file:
+        json_handler = DailySizeRotatingHandler(json_file)
+        json_handler.setFormatter(JsonFormatter())
+        json_handler.addFilter(CategorySampler(LOG_SAMPLE_EVERY if sample_every is None else sample_every))
+        handlers.append(json_handler)
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    for h in list(target.handlers):
+        target.removeHandler(h)
+    target.addHandler(NonBlockingQueueHandler(log_queue))
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop)
+    return _listener
+
+
+def stop():
+    """큐에 남은 로그를 모두 쓰고 리스너 종료"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+        if _dropped:
+            print(f"[로깅] 큐 포화로 버린 로그: {_dropped}건")
@@ -1,9 +1,13 @@
 import asyncio
-import pandas as pd
+import heapq
+import resource
+import signal
 import sys
 import json
 import os
-import strategy, config, telegram_ui, analyzer
+import time
+import strategy, config, telegram_ui, analyzer, market_cache, state_store, scanner_pool, node_lease, order_engine, order_book, outcome_tracker, candle_store, log_pipeline, rate_governor, position_ledger, session_replay
+from candles import Candles
 from datetime import datetime, timedelta
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import Application, CallbackQueryHandler, ContextTypes, MessageHandler, filters
@@ -20,12 +24,42 @@ notified_symbols = {}
 pending_approvals = {}
 profit_alerts = {}
 pending_s_buys = {}
-# [사후분석] 미지 패턴 기록 종목의 60분 후 수익률 추적용 { symbol: (recorded_at, price_at_record) }
-missed_60m_tracker = {}
+s_track_heap = []  # [S급 추적] (만기 ts, 순번, 종목, 추적 시작 ts, 경과 분)
+s_track_candles = {}  # 종목 -> Candles (S급 추적 재확인용, 꼬리만 갱신)
+_s_track_seq = 0
+_s_track_wakeup = None
+grace_heap = []  # [매도 유예] (만기 ts, 순번, 종목, 유예 시작 ts)
+_grace_seq = 0
+_grace_wakeup = None
+_grace_firing = set()  # 만기 처리(매도 집행) 중인 종목 → 그동안 회복 취소 판정 안 함
+asset_cache = None  # [버튼 즉시응답] 마지막 get_my_assets 결과 (None: 아직 조회 전)
+last_grades = {}  # [버튼 즉시응답] 종목 -> (마지막 매수 판단 등급, 판단 시각 ts)
+scan_checkpoint = None  # [스캔 재개] 중단된 스캔의 {'bar_ts': 확정봉 시각, 'done': 처리 완료 종목 set, 'left': 남은 종목 수}
 
 # [평단가 로컬 관리용]
 INV_FILE = "inventory.json"
 
+# [스캔 주기] 30분봉 경계(:00/:30)에 맞춰 떨어지는 주기로 스캔 (1800의 약수여야 함)
+SCAN_INTERVAL_SEC = 600
+BAR_CLOSE_DELAY_SEC = 3  # 봉 마감 직후 거래소 캔들 확정 대기
+S_RECHECK_MIN = 10  # [S급 추적] 지표 재확인 간격(분)
+S_FORCE_MIN = 30  # [S급 추적] 강제 매수 시점(분)
+S_TAIL_BARS = 3  # 재확인 때 다시 받는 최근 30분봉 수 (앞쪽은 캐시 재사용)
+S_RETRY_SEC = 60  # 강제 매수 단계가 주문 전 오류(캔들 조회 등)로 끝나면 이 간격 뒤 재시도
+S_RETRY_MAX = 3  # 강제 매수 단계 재시도 횟수 한도
+S_RETRY_MAX_DELAY_SEC = 300  # 강제 매수 만기 후 이 시간이 지나면 재시도하지 않음 (30분 창을 한참 넘긴 매수 방지)
+GRACE_PRICE_CHECK_SEC = 1.0  # [매도 유예] 유예 중 종목의 수익률 회복 확인 간격 (호가 미러 기준, REST 호출 없음)
+GRACE_RETRY_SEC = 180  # 만기 매도가 접수되지 않으면 이 간격마다 재시도 + 긴급 권고
+GRACE_RETRY_MAX = 3  # 만기 매도 재시도 횟수 한도 (넘으면 유예 종료, 잔고 없음은 재시도 없이 종료)
+GRADE_CACHE_SEC = SCAN_INTERVAL_SEC * 2  # 수동 매수 버튼이 재계산 없이 쓰는 마지막 판단 등급의 유효 시간
+
+
+def seconds_until_next_scan(now_ts=None):
+    """다음 스캔 경계(봉 마감 시각 포함)까지 남은 초. 스캔 소요시간만큼 밀리지 않도록 벽시계 기준으로 계산"""
+    now_ts = time.time() if now_ts is None else now_ts
+    next_boundary = (int(now_ts // SCAN_INTERVAL_SEC) + 1) * SCAN_INTERVAL_SEC
+    return max(1.0, next_boundary + BAR_CLOSE_DELAY_SEC - now_ts)
+
 
 def load_inventory():
     """저장된 인벤토리 파일을 불러옵니다."""
@@ -39,7 +73,7 @@ def load_inventory():
     return {}
 
 
-def save_inventory(symbol, avg_price, quantity, grade="A"):
+def save_inventory(symbol, avg_price, quantity, grade="A", buy_type=1):
     """평단가, 수량, 그리고 [진입 등급]을 로컬 파일에 안전하게 저장합니다."""
     try:
         inv = load_inventory()
@@ -64,18 +98,89 @@ def save_inventory(symbol, avg_price, quantity, grade="A"):
 manual_inventory = load_inventory()
 
 
+def collect_runtime_state():
+    """스냅샷 대상 런타임 상태 (섹션명 -> 현재 값)"""
+    return {
+        'buy_mute_mode': buy_mute_mode,
+        'sell_mute_status': sell_mute_status,
+        'buy_individual_status': buy_individual_status,
+        'pending_approvals': pending_approvals,
+        'pending_s_buys': pending_s_buys,
+        'notified_symbols': notified_symbols,
+        'profit_alerts': profit_alerts,
+        'missed_60m_tracker': outcome_tracker.pending(),
+        'emergency_mode': strategy.emergency_mode,
+        'position_ledger': position_ledger.snapshot(),
+        'missed_runs': analyzer.missed_runs_snapshot(),
+        'warning_list': strategy.warning_list_snapshot(),
+    }
+
+
+def restore_runtime_state():
+    """
+    재시작 시 스냅샷에서 런타임 상태 복구 (히스토리 재조회 없음).
+    유예 타이머(pending_approvals, pending_s_buys)는 다운타임만큼 시작 시각을 밀어 남은 유예를 보존하고,
+    중복 알림 방지·60분 추적 시각은 실제 경과 시간 기준 그대로 둡니다.
+    """
+    global buy_mute_mode
+    saved_at, sections = state_store.load_snapshot()
+    if saved_at is None:
+        return
+    downtime = timedelta(seconds=max(0.0, time.time() - saved_at))
+
+    for name, target in (
+        ('sell_mute_status', sell_mute_status),
+        ('buy_individual_status', buy_individual_status),
+        ('pending_approvals', pending_approvals),
+        ('pending_s_buys', pending_s_buys),
+        ('notified_symbols', notified_symbols),
+        ('profit_alerts', profit_alerts),
+        ('emergency_mode', strategy.emergency_mode),
+    ):
+        target.clear()
+        target.update(sections.get(name) or {})
+
+    outcome_tracker.restore(sections.get('missed_60m_tracker'))
+    position_ledger.restore(sections.get('position_ledger'))
+    analyzer.restore_missed_runs(sections.get('missed_runs'))
+    strategy.restore_warning_list(sections.get('warning_list'))
+
+    for info in list(pending_approvals.values()) + list(pending_s_buys.values()):
+        if isinstance(info.get('start_time'), datetime):
+            info['start_time'] += downtime
+    for sym in pending_s_buys:
+        schedule_s_track(sym)
+    for sym in pending_approvals:
+        schedule_grace(sym)
+
+    buy_mute_mode = sections.get('buy_mute_mode')
+    print(f"♻️ [상태복구] 다운타임 {int(downtime.total_seconds())}초 | 매도유예 {len(pending_approvals)} | S급추적 {len(pending_s_buys)} | 알림이력 {len(notified_symbols)}")
+
+
+async def state_snapshot_task():
+    """런타임 상태가 바뀐 경우에만 주기적으로 스냅샷 파일 갱신"""
+    while True:
+        await asyncio.sleep(state_store.SNAPSHOT_INTERVAL_SEC)
+        try:
+            # 직렬화는 이벤트 루프에서(상태 일관성), 디스크 쓰기는 스레드에서
+            payload = state_store.build_snapshot(collect_runtime_state())
+            if payload:
+                await asyncio.to_thread(state_store.write_snapshot, payload)
+        except Exception as e:
+            logger.error(f"State Snapshot Error: {e}")
+
+
 async def safe_market_buy(symbol, cost, grade="A", buy_type=1):
     """시장가 매수 집행 및 진입 등급(grade) 기록 보강. KRW 초과 오류 방지용 보수적 한도 적용."""
     try:
-        balance = await asyncio.to_thread(exchange.fetch_balance)
-        free_krw = float(balance['free'].get('KRW', 0))
+        free_krw = await order_engine.get_free_balance('KRW')
         # [KRW 초과 방지] 수수료·슬리피지·호가 반올림 대비 85% 한도 (bithumb 주문량 초과 오류 방지)
         safe_cost = min(cost, int(free_krw * 0.85))
         if safe_cost < 1000:
             return False, "잔액 부족"
 
         # [수정 부분] Ticker 정보가 None인 경우를 대비한 방어 로직
-        ticker = await asyncio.to_thread(exchange.fetch_ticker, symbol)
+        ticker = await rate_governor.call(rate_governor.PRIORITY_ORDER, exchange.fetch_ticker, symbol)
 
         # last가 없으면 close를, 그것도 없으면 info의 last_price를 시도
         curr_p = ticker.get('last') or ticker.get('close') or float(ticker.get('info', {}).get('last_price', 0))
@@ -93,25 +198,14 @@ async def safe_market_buy(symbol, cost, grade="A", buy_type=1):
 
         print(f"🛒 [매수집행] {symbol} | 금액: {safe_cost} | 수량: {amount} | 등급: {grade}")
 
-        # 3. 시장가 매수 실행 (cost 파라미터로 주문 금액 상한 전달)
-        await asyncio.to_thread(
-            exchange.create_order,
-            symbol,
-            'market',
-            'buy',
-            amount,
-            None,
-            {'cost': safe_cost}
-        )
-
-        # 4. 인벤토리 저장 로직 (기존 유지 + grade 인자 추가)
-        inv = load_inventory()
-        old = inv.get(symbol, {"avg_price": 0, "total_quantity": 0})
-        old_p, old_q = float(old['avg_price']), float(old['total_quantity'])
-        final_avg = ((old_p * old_q) + (curr_p * amount)) / (old_q + amount)
-
-        # [수정] 보강된 save_inventory를 호출하여 등급까지 저장
-        save_inventory(symbol, final_avg, old_q + amount, grade, buy_type)
+        # 3. 시장가 매수 실행 (주문 엔진 경유, cost 파라미터로 주문 금액 상한 전달)
+        order = await order_engine.submit(symbol, 'buy', amount, reason=f"매수({grade})", params={'cost': safe_cost})
+        await order_engine.wait_ack(order)
+        if not order_engine.is_accepted(order):
+            return False, order['error'] or "주문 실패"
+        # [체결 확인] 실제 체결가/수량이 확인되면 그 값으로 평단 기록 (미확인 시 주문 직전 현재가)
+        await order_engine.wait_fill(order, timeout=5)
+        record_buy_inventory(symbol, order['average'] or curr_p, order['filled'] or amount, grade, buy_type)
 
         return True, "성공"
     except Exception as e:
@@ -119,10 +213,77 @@ async def safe_market_buy(symbol, cost, grade="A", buy_type=1):
         return False, str(e)
 
 
+def record_buy_inventory(symbol, fill_price, fill_qty, grade="A", buy_type=1):
+    """매수 체결분을 기존 보유분과 가중평균해 인벤토리에 저장 (등급 포함)"""
+    inv = load_inventory()
+    old = inv.get(symbol, {})
+    old_p = float(old.get('purchase_price') or old.get('avg_price') or 0)
+    old_q = float(old.get('total_quantity') or 0)
+    final_avg = ((old_p * old_q) + (fill_price * fill_qty)) / (old_q + fill_qty)
+
+    # [수정] 보강된 save_inventory를 호출하여 등급까지 저장
+    save_inventory(symbol, final_avg, old_q + fill_qty, grade, buy_type)
+    position_ledger.set_meta(symbol, grade, buy_type)  # 수량·평단은 주문 엔진 체결 때 이미 반영
+
+
+FAST_BUY_LATENCY_KEEP = 50
+fast_buy_latencies = []  # 최근 고속 매수의 신호→접수 지연(ms)
+
+
+async def fast_market_buy(symbol, cost, price, grade="S", buy_type=1, signal_ts=None):
+    """
+    [S급 고속 매수] 신호 판단에 쓴 가격과 미리 받아 둔 잔고 스냅샷으로 바로 주문 → 접수 후 반환.
+    잔고/현재가/호가 조회 없이 create_order 1회만 왕복하고, 체결 확인·인벤토리 기록은 백그라운드에서 처리.
+    """
+    signal_ts = signal_ts or time.time()
+    free_krw = order_engine.cached_free_balance('KRW')
+    if free_krw is None:
+        free_krw = await order_engine.get_free_balance('KRW')
+    safe_cost = min(cost, int(free_krw * 0.85))
+    if safe_cost < 1000:
+        return False, "잔액 부족"
+    if not price or price <= 0:
+        return False, "현재가 없음"
+
+    import math
+    amount = math.floor((safe_cost / price) * 10000) / 10000
+    if amount <= 0:
+        return False, "수량 계산 오류(금액/가격)"
+
+    order = await order_engine.submit(symbol, 'buy', amount, reason=f"고속매수({grade})",
+                                      params={'cost': safe_cost}, fast=True)
+    await order_engine.wait_ack(order)
+    if not order_engine.is_accepted(order):
+        return False, order['error'] or "주문 실패"
+
+    # [지연 계측] 신호 → 주문 전송 → 거래소 접수
+    to_send_ms = (order['sent_at'] - signal_ts) * 1000
+    total_ms = (order['submitted_at'] - signal_ts) * 1000
+    fast_buy_latencies.append(total_ms)
+    del fast_buy_latencies[:-FAST_BUY_LATENCY_KEEP]
+    median_ms = sorted(fast_buy_latencies)[len(fast_buy_latencies) // 2]
+    logger.info(f"[지연계측] {symbol} 신호→접수 {total_ms:.0f}ms (전송까지 {to_send_ms:.0f}ms, 거래소 {total_ms - to_send_ms:.0f}ms) | 최근 {len(fast_buy_latencies)}건 중앙값 {median_ms:.0f}ms")
+
+    asyncio.create_task(_record_fast_buy(order, price, amount, grade, buy_type))
+    return True, "성공"
+
+
+async def _record_fast_buy(order, price, amount, grade, buy_type):
+    """고속 매수 후처리: 체결 확인 후 인벤토리 기록 (파일 I/O는 스레드에서)"""
+    try:
+        await order_engine.wait_fill(order, timeout=order_engine.FILL_TIMEOUT_SEC)
+        await asyncio.to_thread(record_buy_inventory, order['symbol'], order['average'] or price,
+                                order['filled'] or amount, grade, buy_type)
+    except Exception as e:
+        logger.error(f"Fast Buy Bookkeeping Error ({order['symbol']}): {e}")
+
+
 async def get_my_assets():
     """[수익률 해결] inventory.json(로컬)을 API보다 우선 참조하여 -100% 원천 차단"""
+    global asset_cache
     try:
-        balance = await asyncio.to_thread(exchange.fetch_balance)
+        balance = await rate_governor.call(rate_governor.PRIORITY_MONITOR, exchange.fetch_balance)
+        order_engine.update_balance(balance)  # 주문 엔진 잔고 스냅샷도 함께 갱신 (S급 고속 매수용)
         inv = load_inventory()
         assets = {}
 
@@ -170,17 +331,26 @@ async def get_my_assets():
                 'purchase_time': local_item.get('purchase_time') or local_item.get('buy_time') or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             }
 
+        asset_cache = dict(assets)
+        position_ledger.reconcile(assets, inv)  # [포지션장부] 감시 주기마다 잔고와 대조
         return assets
     except Exception as e:
         logger.error(f"Asset Fetch Error: {e}")
         return {}
 
 
-async def get_buy_cost():
-    """[기능 20] 가용 원화 기반 안전한 투입 금액 산출 (오류 방지용)"""
+async def get_cached_assets():
+    """버튼 처리용 보유 자산: 감시 루프가 마지막으로 받은 결과 (시작 직후 아직 없으면 1회 조회)"""
+    if asset_cache is None:
+        return await get_my_assets()
+    return asset_cache
+
+
+async def get_buy_cost(free_krw=None):
+    """[기능 20] 가용 원화 기반 안전한 투입 금액 산출 (오류 방지용). free_krw를 주면 잔고 조회 생략"""
     try:
-        balance = await asyncio.to_thread(exchange.fetch_balance)
-        free_krw = float(balance['free'].get('KRW', 0))
+        if free_krw is None:
+            free_krw = await order_engine.get_free_balance('KRW')
 
         # 사용자 설정 금액 (기본 1만)
         target_cost = config.DEFAULT_TEST_BUY
@@ -199,200 +369,362 @@ async def get_buy_cost():
         return 0
 
 
-async def buy_scan_task(app):
-    """매수 스캔 태스크: 들여쓰기 교정 및 S급 추적 로직 정상화 + 1분봉 수급/미지패턴/60분수익률 연동"""
-    global buy_mute_mode, notified_symbols, buy_individual_status, pending_s_buys, missed_60m_tracker
-    while True:
-        try:
-            assets = await get_my_assets()
-            owned_symbols = set(assets.keys())
-            is_night = config.is_sleeping_time()
-            w_list = strategy.get_warning_list()
-            markets = await asyncio.to_thread(exchange.fetch_markets)
-            current_display_mode = "AUTO (야간)" if is_night else (buy_mute_mode or "WATCH")
+async def handle_buy_scan_result(app, symbol, is_buy, reason, grade, data_dict, current_price, is_night, candles=None):
+    """
+    스캔 결과 1건 처리 (미지 기록 + 매수 알림/집행). 메인 프로세스 스캔과 워커 스캔이 공통으로 사용.
+    candles(판단에 쓴 30분봉)를 주면 S급 추적 재확인 때 꼬리만 갱신해 재사용
+    """
+    global notified_symbols, pending_s_buys
+    signal_ts = time.time()
+    last_grades[symbol] = (grade_from_signal(is_buy, reason, grade), signal_ts)
+    # [분석 봇] 매수하지 않더라도 탈락 사유·패턴태그·등급 포함 상세 수치 기록 (조건 1개라도 만족/3분 내 3% 급등 포함)
+    if not is_buy and reason:
+        record_id = analyzer.record_missed_opportunity(symbol, reason, current_price, data_dict)
+        # [사후분석] 기록 ID별 60분 후 수익률 확인 예약 (조건 만족/3%급등 포함 모든 미지 기록)
+        if record_id:
+            outcome_tracker.schedule(record_id, symbol, current_price)
+
+    if is_buy:
+        if symbol in notified_symbols and (datetime.now() - notified_symbols[symbol]) < timedelta(hours=1):
+            return
+        notified_symbols[symbol] = datetime.now()
+
+        # [고속 경로] 잔고는 스캔 시작 때 받아 둔 스냅샷, 가격은 신호 판단에 쓴 현재가 사용
+        free_krw = order_engine.cached_free_balance('KRW')
+        if free_krw is None:
+            free_krw = await order_engine.get_free_balance('KRW')
+        buy_cost = await get_buy_cost(free_krw)
+
+        # [개선] grade 값 우선 사용, 없으면 reason에서 추출
+        is_s_class_check = (grade and grade.startswith("S")) or any(x in reason for x in ["S급", "[S]", "[S+]"])
+        indiv_mode_check = buy_individual_status.get(symbol)
+        curr_mode_check = indiv_mode_check if indiv_mode_check else ("AUTO" if is_night else buy_mute_mode)
+
+        # [매수 집행/알림 로직]
+        indiv_mode = buy_individual_status.get(symbol)
+        curr_mode = indiv_mode if indiv_mode else ("AUTO" if is_night else buy_mute_mode)
+        is_s_class = (grade and grade.startswith("S")) or "S급" in reason
+
+        # S급 자동매수는 주문을 먼저 내고 알림·추적 등록은 그 뒤에 처리
+        bought = False
+        if curr_mode == "AUTO" and is_s_class:
+            if free_krw < 1000:
+                await app.bot.send_message(config.CHAT_ID, f"❌ [S급 자동매수 실패] {symbol}\n사유: 잔액 부족")
+            else:
+                bought, msg = await fast_market_buy(symbol, buy_cost, current_price, "S", signal_ts=signal_ts)
+                if bought:
+                    await app.bot.send_message(
+                        config.CHAT_ID,
+                        f"🤖 [S급 즉시매수 완료] {symbol}\n💡 사유: {reason}\n💰 투입: {buy_cost:,.0f}원"
+                    )
+                    if symbol in pending_s_buys: del pending_s_buys[symbol]
 
-            krw_filtered = [
-                m for m in markets
-                if m['quote'] == 'KRW' and m['active']
-                   and m['symbol'].split('/')[0] not in w_list
-                   and m['symbol'] not in owned_symbols
-            ]
-
-            # [사후분석] 60분 경과한 미지 기록 종목 수익률 로그 업데이트 (기존 로직과 겹치지 않도록 먼저 처리)
-            now = datetime.now()
-            for sym in list(missed_60m_tracker.keys()):
-                rec_at, price_at = missed_60m_tracker[sym]
-                if (now - rec_at).total_seconds() >= 3600:
-                    try:
-                        ticker = await asyncio.to_thread(exchange.fetch_ticker, sym)
-                        price_60m = float(ticker.get('last') or ticker.get('close') or 0)
-                        if price_60m:
-                            analyzer.update_missed_opportunity_return(sym, rec_at.strftime('%Y-%m-%d %H:%M:%S'), price_at, price_60m)
-                    except Exception as e:
-                        logger.error(f"60m return check error {sym}: {e}")
-                    del missed_60m_tracker[sym]
+        # [S급 추적 등록] (즉시매수가 체결되지 않은 경우에만)
+        if is_s_class_check and curr_mode_check == "AUTO" and not bought:
+            if symbol not in pending_s_buys:
+                pending_s_buys[symbol] = {
+                    'start_time': datetime.now(),
+                    'last_check_min': 0,
+                    'reason': reason,
+                    'cost': buy_cost
+                }
+                if candles is not None:
+                    s_track_candles[symbol] = candles
+                schedule_s_track(symbol)
+                await app.bot.send_message(
+                    config.CHAT_ID,
+                    f"🔔 [S급 포착] 30분 자동매수 추적 시작\n종목: {symbol}\n사유: {reason}\n\n※ 10분마다 지표 재확인 후 30분 뒤 강제 매수합니다.",
+                    reply_markup=telegram_ui.get_buy_inline_kb(symbol, buy_cost, False)
+                )
 
-            print(f"\n🔎 [매수 스캔] {len(krw_filtered)}종목 시작 | 모드: {current_display_mode}")
+        if not (curr_mode == "AUTO" and is_s_class):
+            status_tag = "💎 [매수포착 - A급]" if not is_s_class else "🔥 [S급 포착/수동대기]"
+            is_auto_btn = (indiv_mode == 'AUTO')
+            await app.bot.send_message(
+                config.CHAT_ID,
+                f"{status_tag} {symbol}\n💡 등급: {reason}\n💰 설정금액: {buy_cost:,.0f}원\n💳 가용잔액: {free_krw:,.0f}원",
+                reply_markup=telegram_ui.get_buy_inline_kb(symbol, buy_cost, is_auto_btn)
+            )
 
-            # 1. 전 종목 스캔 루프
-            for idx, m in enumerate(krw_filtered):
-                symbol = m['symbol']
-                sys.stdout.write(f"\r▶ 스캔 중: [{idx + 1}/{len(krw_filtered)}] {symbol:<12}")
-                sys.stdout.flush()
-
-                await asyncio.sleep(0.05)
-                # [예외 처리] 지원하지 않는 마켓(symbollist 미포함) 방어
-                markets_dict = getattr(exchange, 'markets', None)
-                if markets_dict is not None and symbol not in markets_dict:
-                    logger.info(f"지원하지 않는 마켓: {symbol}")
-                    continue
 
-                ohlcv = await asyncio.to_thread(exchange.fetch_ohlcv, symbol, '30m', limit=200)
-                if len(ohlcv) < 185: continue
+async def scan_symbol(app, symbol, w_list, w_version, is_night):
+    """종목 1개 스캔 (순차 스캔 경로). 판단 입력(확정봉·진행 중 봉·1분봉)이 그대로라 메모를 재사용했으면 True"""
+    bar_ts = strategy.get_last_closed_bar_ts()
+    # [수급 돌파] 1분봉 거래량 20봉 평균 300% + 3분 내 3% 급등 체크용 + 진행 중 30분봉 합성용 (매 스캔 조회)
+    ohlcv_1m = None
+    try:
+        ohlcv_1m = await rate_governor.call(rate_governor.PRIORITY_SCAN, exchange.fetch_ohlcv, symbol, '1m', limit=strategy.LIVE_1M_LIMIT)
+        candle_store.append(symbol, '1m', ohlcv_1m)
+    except Exception:
+        pass
+
+    candles = strategy.get_scan_candles(symbol, bar_ts)
+    if candles is not None:
+        candles = strategy.with_live_bar(candles, ohlcv_1m, bar_ts)
+    if candles is None:
+        ohlcv = await rate_governor.call(rate_governor.PRIORITY_SCAN, exchange.fetch_ohlcv, symbol, '30m', limit=200)
+        candle_store.append(symbol, '30m', ohlcv)
+        if len(ohlcv) < 185:
+            return False
+        candles = Candles.from_ohlcv(ohlcv)
+        strategy.put_scan_candles(symbol, bar_ts, candles)
+
+    memo_key = strategy.make_buy_signal_key(symbol, bar_ts, w_version, strategy.live_signature(candles, ohlcv_1m))
+    if strategy.get_memo_buy_signal(memo_key) is not None:
+        return True
+
+    df_1m = Candles.from_ohlcv(ohlcv_1m) if ohlcv_1m and len(ohlcv_1m) >= 21 else None
+    is_buy, reason, grade, data_dict = strategy.check_buy_signal(candles, symbol, w_list, df_1m)
+    strategy.put_memo_buy_signal(memo_key, (is_buy, reason, grade, data_dict))
+
+    current_price = candles.last_close()
+    await handle_buy_scan_result(app, symbol, is_buy, reason, grade, data_dict, current_price, is_night, candles)
+    return False
+
+
+def schedule_s_track(symbol):
+    """S급 추적 1건의 재확인(10·20분)·강제 매수(30분) 시각을 힙에 등록 (이미 지난 재확인 단계는 제외)"""
+    global _s_track_seq
+    info = pending_s_buys.get(symbol)
+    if not info:
+        return
+    start_ts = info['start_time'].timestamp()
+    for mark in range(S_RECHECK_MIN, S_FORCE_MIN + 1, S_RECHECK_MIN):
+        if mark < S_FORCE_MIN and mark <= info.get('last_check_min', 0):
+            continue
+        _s_track_seq += 1
+        heapq.heappush(s_track_heap, (start_ts + mark * 60, _s_track_seq, symbol, start_ts, mark))
+    if _s_track_wakeup is not None:
+        _s_track_wakeup.set()
+
+
+async def get_s_track_candles(symbol):
+    """S급 재확인용 30분봉: 캐시가 있으면 최근 S_TAIL_BARS봉만 받아 갱신, 없으면 200봉 1회 조회 후 캐시"""
+    cached = s_track_candles.get(symbol)
+    if cached is not None and len(cached) >= 185:
+        tail = await rate_governor.call(rate_governor.PRIORITY_MONITOR, exchange.fetch_ohlcv, symbol, '30m', limit=S_TAIL_BARS)
+        candles = cached.with_tail(tail)
+    else:
+        ohlcv = await rate_governor.call(rate_governor.PRIORITY_MONITOR, exchange.fetch_ohlcv, symbol, '30m', limit=200)
+        candles = Candles.from_ohlcv(ohlcv)
+    s_track_candles[symbol] = candles
+    return candles
+
+
+def _end_s_track(symbol):
+    pending_s_buys.pop(symbol, None)
+    s_track_candles.pop(symbol, None)
+
+
+async def run_s_track_step(app, symbol, mark):
+    """만기 도착한 S급 추적 단계 1건: mark < 30이면 지표 재확인, 30이면 최종 확인 후 강제 매수"""
+    info = pending_s_buys[symbol]
+    if (order_engine.cached_free_balance(symbol.split('/')[0]) or 0) > 0.0001:
+        _end_s_track(symbol)  # 그 사이 (수동 매수 등으로) 보유 중
+        return
+
+    candles = await get_s_track_candles(symbol)
+    still_buy, now_reason, now_grade, now_data_dict = strategy.check_buy_signal(candles, symbol, strategy.get_warning_list())
+    last_grades[symbol] = (grade_from_signal(still_buy, now_reason, now_grade), time.time())
+
+    if mark < S_FORCE_MIN:
+        if still_buy:
+            info['last_check_min'] = mark
+            await app.bot.send_message(config.CHAT_ID, f"ℹ️ [S급 추적] {symbol} {mark}분 경과. 지표 양호 유지 중.")
+        else:
+            await app.bot.send_message(config.CHAT_ID, f"⚠️ [S급 취소] {symbol} 지표 이탈로 자동 매수 대기를 취소합니다.")
+            _end_s_track(symbol)
+        return
+
+    # 주문을 시도하는 순간 추적 종료 (이후 알림 전송 등이 실패해도 재시도로 다시 매수하지 않도록)
+    _end_s_track(symbol)
+    if still_buy:
+        success, msg = await safe_market_buy(symbol, info['cost'], "S")
+        if success:
+            logger.info(f"REPORT_DATA|{symbol}|S|{info['cost']}")
+            await app.bot.send_message(config.CHAT_ID, f"🤖 [S급 강제집행] 30분 경과 및 지표 유지로 자동 매수 완료: {symbol}")
+        else:
+            await app.bot.send_message(config.CHAT_ID, f"❌ [강제집행 실패] {symbol} 사유: {msg}")
+    else:
+        await app.bot.send_message(config.CHAT_ID, f"⚠️ [S급 취소] 30분 경과 시점 지표 부적합으로 취소합니다.")
+
 
-                df = pd.DataFrame(ohlcv, columns=['time', 'open', 'high', 'low', 'close', 'vol'])
-                # [수급 돌파] 1분봉 거래량 20봉 평균 300% + 3분 내 3% 급등 체크용 (옵션: 1m 있으면 전략에 전달)
-                df_1m = None
+async def _s_track_step_task(app, symbol, mark, late):
+    global _s_track_seq
+    try:
+        await run_s_track_step(app, symbol, mark)
+        logger.info(f"[S급추적] {symbol} {mark}분 단계 처리 (만기 대비 {late * 1000:.0f}ms)")
+    except Exception as e:
+        logger.error(f"S Track Error ({symbol} {mark}분): {e}")
+        info = pending_s_buys.get(symbol)
+        if mark == S_FORCE_MIN and info:  # 재확인 단계는 다음 단계가 남아 있으므로 최종 단계만 재시도 (주문 전 실패만 여기 도달)
+            info['force_retries'] = info.get('force_retries', 0) + 1
+            overdue = time.time() - (info['start_time'].timestamp() + S_FORCE_MIN * 60)
+            if info['force_retries'] > S_RETRY_MAX or overdue + S_RETRY_SEC > S_RETRY_MAX_DELAY_SEC:
+                _end_s_track(symbol)
+                logger.warning(f"[S급추적] {symbol} 강제 매수 재시도 한도 초과 ({info['force_retries'] - 1}회, 만기 후 {overdue:.0f}초) → 추적 종료")
                 try:
-                    ohlcv_1m = await asyncio.to_thread(exchange.fetch_ohlcv, symbol, '1m', limit=25)
-                    if ohlcv_1m and len(ohlcv_1m) >= 21:
-                        df_1m = pd.DataFrame(ohlcv_1m, columns=['time', 'open', 'high', 'low', 'close', 'vol'])
+                    await app.bot.send_message(config.CHAT_ID, f"❌ [강제집행 포기] {symbol} 최종 확인 오류 반복으로 자동 매수를 취소합니다. 사유: {e}")
                 except Exception:
                     pass
-                is_buy, reason, grade, data_dict = strategy.check_buy_signal(df, symbol, w_list, df_1m)
-                
-                # [분석 봇] 매수하지 않더라도 탈락 사유·패턴태그·등급 포함 상세 수치 기록 (조건 1개라도 만족/3분 내 3% 급등 포함)
-                current_price = float(df.iloc[-1]['close'])
-                if not is_buy and reason:
-                    analyzer.record_missed_opportunity(symbol, reason, current_price, data_dict)
-                    # [사후분석] 기록된 종목 60분 후 수익률 로그 업데이트용 등록 (조건 만족/3%급등 포함 모든 미지 기록)
-                    missed_60m_tracker[symbol] = (datetime.now(), current_price)
-
-                if is_buy:
-                    if symbol in notified_symbols and (datetime.now() - notified_symbols[symbol]) < timedelta(hours=1):
-                        continue
-                    notified_symbols[symbol] = datetime.now()
-
-                    balance = await asyncio.to_thread(exchange.fetch_balance)
-                    free_krw = float(balance['free'].get('KRW', 0))
-                    buy_cost = await get_buy_cost()
+                return
+            _s_track_seq += 1
+            heapq.heappush(s_track_heap, (time.time() + S_RETRY_SEC, _s_track_seq, symbol, info['start_time'].timestamp(), mark))
+            if _s_track_wakeup is not None:
+                _s_track_wakeup.set()
 
-                    # [개선] grade 값 우선 사용, 없으면 reason에서 추출
-                    is_s_class_check = (grade and grade.startswith("S")) or any(x in reason for x in ["S급", "[S]", "[S+]"])
-                    indiv_mode_check = buy_individual_status.get(symbol)
-                    curr_mode_check = indiv_mode_check if indiv_mode_check else ("AUTO" if is_night else buy_mute_mode)
 
-                    # [S급 추적 등록]
-                    if is_s_class_check and curr_mode_check == "AUTO":
-                        if symbol not in pending_s_buys:
-                            pending_s_buys[symbol] = {
-                                'start_time': datetime.now(),
-                                'last_check_min': 0,
-                                'reason': reason,
-                                'cost': buy_cost
-                            }
-                            await app.bot.send_message(
-                                config.CHAT_ID,
-                                f"🔔 [S급 포착] 30분 자동매수 추적 시작\n종목: {symbol}\n사유: {reason}\n\n※ 10분마다 지표 재확인 후 30분 뒤 강제 매수합니다.",
-                                reply_markup=telegram_ui.get_buy_inline_kb(symbol, buy_cost, False)
-                            )
-
-                    # [매수 집행/알림 로직]
-                    indiv_mode = buy_individual_status.get(symbol)
-                    curr_mode = indiv_mode if indiv_mode else ("AUTO" if is_night else buy_mute_mode)
-                    is_s_class = (grade and grade.startswith("S")) or "S급" in reason
-
-                    if curr_mode == "AUTO" and is_s_class:
-                        if free_krw < 1000:
-                            await app.bot.send_message(config.CHAT_ID, f"❌ [S급 자동매수 실패] {symbol}\n사유: 잔액 부족")
-                        else:
-                            success, msg = await safe_market_buy(symbol, buy_cost, "S")
-                            if success:
-                                await app.bot.send_message(
-                                    config.CHAT_ID,
-                                    f"🤖 [S급 즉시매수 완료] {symbol}\n💡 사유: {reason}\n💰 투입: {buy_cost:,.0f}원"
-                                )
-                                if symbol in pending_s_buys: del pending_s_buys[symbol]
-                    else:
-                        status_tag = "💎 [매수포착 - A급]" if not is_s_class else "🔥 [S급 포착/수동대기]"
-                        is_auto_btn = (indiv_mode == 'AUTO')
-                        await app.bot.send_message(
-                            config.CHAT_ID,
-                            f"{status_tag} {symbol}\n💡 등급: {reason}\n💰 설정금액: {buy_cost:,.0f}원\n💳 가용잔액: {free_krw:,.0f}원",
-                            reply_markup=telegram_ui.get_buy_inline_kb(symbol, buy_cost, is_auto_btn)
-                        )
+async def s_track_task(app):
+    """
+    [S급 추적 타이머] 스캔 주기와 무관하게 재확인·강제 매수를 만기 정각에 실행.
+    추적이 취소·재등록돼 시작 시각이 달라진 힙 항목은 버리고, 만기 단계는 각각 별도 태스크로 처리
+    """
+    global _s_track_wakeup
+    _s_track_wakeup = asyncio.Event()
+    while True:
+        try:
+            _s_track_wakeup.clear()
+            if not s_track_heap:
+                await _s_track_wakeup.wait()
+                continue
+            delay = s_track_heap[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(_s_track_wakeup.wait(), timeout=delay)
+                    continue  # 더 이른 만기가 들어옴 → 다시 계산
+                except asyncio.TimeoutError:
+                    pass
 
-            # 2. S급 강제 매수 추적기 (스캔 루프 종료 후 독립 실행 - 들여쓰기 교정됨)
-            # ---------------------------------------------------------
-            for sym, info in list(pending_s_buys.items()):
-                if sym in owned_symbols:
-                    if sym in pending_s_buys: del pending_s_buys[sym]
-                    continue
+            due = []
+            now = time.time()
+            while s_track_heap and s_track_heap[0][0] <= now:
+                due_ts, _, symbol, start_ts, mark = heapq.heappop(s_track_heap)
+                info = pending_s_buys.get(symbol)
+                if info and info['start_time'].timestamp() == start_ts:
+                    due.append((symbol, mark, now - due_ts))
+                elif not info:
+                    s_track_candles.pop(symbol, None)  # 수동 매수·취소 등으로 추적이 끝난 종목
+            for symbol, mark, late in due:
+                # 단계 처리(캔들 조회·주문)는 별도 태스크로 → 타이머는 바로 다음 만기를 기다림
+                asyncio.create_task(_s_track_step_task(app, symbol, mark, late))
+        except Exception as e:
+            logger.error(f"S Track Task Error: {e}")
+            await asyncio.sleep(1)
 
-                elapsed = (datetime.now() - info['start_time']).total_seconds() / 60
 
-                # 지표 재확인
-                current_mark = int(elapsed // 10) * 10
-                if 0 < current_mark < 30 and current_mark > info['last_check_min']:
-                    ohlcv_now = await asyncio.to_thread(exchange.fetch_ohlcv, sym, '30m', limit=200)
-                    df_now = pd.DataFrame(ohlcv_now, columns=['time', 'open', 'high', 'low', 'close', 'vol'])
-                    still_buy, now_reason, now_grade, now_data_dict = strategy.check_buy_signal(df_now, sym, w_list)
+async def buy_scan_task(app):
+    """매수 스캔 태스크: 들여쓰기 교정 및 S급 추적 로직 정상화 + 1분봉 수급/미지패턴/60분수익률 연동"""
+    global buy_mute_mode, notified_symbols, buy_individual_status, pending_s_buys, scan_checkpoint
+    while True:
+        try:
+            assets = await get_my_assets()
+            owned_symbols = set(assets.keys())
+            is_night = config.is_sleeping_time()
+            w_list = strategy.get_warning_list()
+            current_display_mode = "AUTO (야간)" if is_night else (buy_mute_mode or "WATCH")
 
-                    if still_buy:
-                        info['last_check_min'] = current_mark
-                        await app.bot.send_message(config.CHAT_ID, f"ℹ️ [S급 추적] {sym} {current_mark}분 경과. 지표 양호 유지 중.")
-                    else:
-                        await app.bot.send_message(config.CHAT_ID, f"⚠️ [S급 취소] {sym} 지표 이탈로 자동 매수 대기를 취소합니다.")
-                        if sym in pending_s_buys: del pending_s_buys[sym]
-                        continue
+            # [마켓캐시] 활성 KRW 목록은 market_cache가 미리 계산해 둔 값을 그대로 사용
+            krw_symbols = [s for s in market_cache.get_krw_symbols() if s not in owned_symbols]
+            # [멀티 노드] 이 노드가 리스를 보유한 샤드의 종목만 스캔
+            krw_symbols = [s for s in krw_symbols if node_lease.owns_symbol(s)]
 
-                # 30분 강제 집행
-                if elapsed >= 30:
-                    ohlcv_final = await asyncio.to_thread(exchange.fetch_ohlcv, sym, '30m', limit=200)
-                    df_final = pd.DataFrame(ohlcv_final, columns=['time', 'open', 'high', 'low', 'close', 'vol'])
-                    is_still_good, final_reason, final_grade, final_data_dict = strategy.check_buy_signal(df_final, sym, w_list)
-
-                    if is_still_good:
-                        success, msg = await safe_market_buy(sym, info['cost'], "S")
-                        if success:
-                            logger.info(f"REPORT_DATA|{sym}|S|{info['cost']}")
-                            await app.bot.send_message(config.CHAT_ID, f"🤖 [S급 강제집행] 30분 경과 및 지표 유지로 자동 매수 완료: {sym}")
-                        else:
-                            await app.bot.send_message(config.CHAT_ID, f"❌ [강제집행 실패] {sym} 사유: {msg}")
-                    else:
-                        await app.bot.send_message(config.CHAT_ID, f"⚠️ [S급 취소] 30분 경과 시점 지표 부적합으로 취소합니다.")
+            # [사전 스크리닝] 전 종목 티커 1회 조회로 가격/유의/거래대금/무변동 탈락 종목은 캔들 조회 생략
+            try:
+                tickers = await rate_governor.call(rate_governor.PRIORITY_SCAN, exchange.fetch_tickers)
+            except Exception as e:
+                logger.error(f"Prescreen Ticker Fetch Error: {e}")
+                tickers = {}
+            krw_filtered, prescreen_stats, price_filtered = strategy.prescreen_symbols(krw_symbols, tickers, w_list)
+            saved_requests = strategy.prescreen_saved_requests(prescreen_stats)
+            logger.info(
+                f"[사전스크리닝] 대상 {len(krw_symbols)} → 통과 {len(krw_filtered)} | "
+                + " | ".join(f"{k}: {v}" for k, v in prescreen_stats.items() if k != '통과')
+                + f" | OHLCV 절약: {saved_requests}회"
+            )
 
-                    if sym in pending_s_buys: del pending_s_buys[sym]
+            # [스캔 재개] 같은 확정봉 안에서 중단된 스캔이 있으면 이미 처리한 종목은 건너뛰고 이어서 (봉이 바뀌면 처음부터)
+            bar_ts = strategy.get_last_closed_bar_ts()
+            if scan_checkpoint and scan_checkpoint['bar_ts'] == bar_ts:
+                krw_filtered = [s for s in krw_filtered if s not in scan_checkpoint['done']]
+                logger.info(f"[스캔재개] 처리 완료 {len(scan_checkpoint['done'])}종목 건너뛰고 {len(krw_filtered)}종목 이어서 스캔")
+            else:
+                scan_checkpoint = {'bar_ts': bar_ts, 'done': set()}
+                # [가격필터 미지 기록] 사전 스크리닝 전에는 본 검사가 가격필터 사유로 기록하던 종목 → 캔들 조회 없이 같은 사유로 기록
+                for symbol, price in price_filtered.items():
+                    await handle_buy_scan_result(app, symbol, False, strategy.PRESCREEN_PRICE_REASON, "", {}, price, is_night)
+            scan_checkpoint['left'] = len(krw_filtered)
 
-            print(f"\n✅ 스캔 완료 | {datetime.now().strftime('%H:%M:%S')}")
-            await asyncio.sleep(600)
+            print(f"\n🔎 [매수 스캔] {len(krw_filtered)}종목 시작 | 모드: {current_display_mode}")
+            # [신호 메모] 유의목록 버전은 스캔당 1회 계산, 같은 봉 안에서는 30분봉 재조회 생략 + 입력이 그대로인 종목은 재평가 생략
+            w_version = strategy.get_warning_version(w_list)
+            memo_hits = 0
+            # [메모리 지표] 스캔 1회당 할당 블록 증감 / 프로세스 피크 RSS
+            blocks_before = sys.getallocatedblocks()
 
+            # 1. 전 종목 스캔 루프
+            if scanner_pool.SCAN_WORKERS > 0:
+                # [멀티프로세스 스캔] 워커가 보낸 판단 결과를 도착 순서대로 처리 (텔레그램/주문/상태는 메인에서만)
+                done = 0
+                async for symbol, is_buy, reason, grade, data_dict, current_price in scanner_pool.scan(krw_filtered, w_list):
+                    done += 1
+                    sys.stdout.write(f"\r▶ 스캔 결과: [{done}/{len(krw_filtered)}] {symbol:<12}")
+                    sys.stdout.flush()
+                    try:
+                        await handle_buy_scan_result(app, symbol, is_buy, reason, grade, data_dict, current_price, is_night)
+                        scan_checkpoint['done'].add(symbol)
+                        scan_checkpoint['left'] -= 1
+                    except Exception as e:
+                        logger.error(f"Scan Result Error ({symbol}): {e}")
+                memo_hits = scanner_pool.last_memo_hits
+            else:
+                for idx, symbol in enumerate(krw_filtered):
+                    sys.stdout.write(f"\r▶ 스캔 중: [{idx + 1}/{len(krw_filtered)}] {symbol:<12}")
+                    sys.stdout.flush()
+                    try:
+                        if await scan_symbol(app, symbol, w_list, w_version, is_night):
+                            memo_hits += 1
+                        scan_checkpoint['done'].add(symbol)
+                        scan_checkpoint['left'] -= 1
+                    except rate_governor.CircuitOpenError:
+                        raise  # 거래소 장애 → 스캔 중단, 남은 종목은 체크포인트에서 재개
+                    except Exception as e:
+                        # 한 종목 오류는 그 종목만 건너뜀 (완료 처리하지 않으므로 스캔이 재개되면 다시 시도)
+                        logger.error(f"Scan Symbol Error ({symbol}): {e}")
+
+            # 2. S급 강제 매수 추적은 s_track_task가 만기 시각에 따로 처리
+
+            scan_checkpoint = None  # 끝까지 돈 스캔은 체크포인트 불필요
+            analyzer.flush_missed_runs(analyzer.MISSED_RUN_FLUSH_SEC)  # 오래 유지된 반복 구간은 주기적으로 기록
+            await asyncio.to_thread(candle_store.write_batch, candle_store.take_pending())  # 스캔 중 모은 확정봉 일괄 저장
+            print(f"\n✅ 스캔 완료 | {datetime.now().strftime('%H:%M:%S')} | 메모 재사용: {memo_hits}종목")
+            peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Linux: KB 단위
+            logger.info(f"[API대기] {rate_governor.format_wait_stats(reset=True)}")
+            logger.info(f"[메모리] 피크 RSS: {peak_rss_mb:.1f}MB | 스캔 중 할당 블록 증감: {sys.getallocatedblocks() - blocks_before:+,}")
+            await asyncio.sleep(seconds_until_next_scan())
+
+        except rate_governor.CircuitOpenError as e:
+            left = scan_checkpoint['left'] if scan_checkpoint else 0
+            logger.warning(f"[스캔중단] {e} | 남은 {left}종목은 {rate_governor.BREAKER_OPEN_SEC}초 후 이어서 스캔")
+            await asyncio.sleep(rate_governor.BREAKER_OPEN_SEC)
         except Exception as e:
-            logger.error(f"Buy Task Error: {e}")
+            left = scan_checkpoint['left'] if scan_checkpoint else 0
+            logger.error(f"Buy Task Error: {e} (남은 {left}종목은 다음 회차에 이어서)")
             await asyncio.sleep(60)
 
 async def execute_sell(app, symbol, reason):
     """
     실제 거래소 매도 주문을 실행하고 사용자에게 알림을 보냅니다.
+    주문 엔진의 종목 청산 intent로 묶여 있어 여러 경로에서 동시에 불려도 주문은 1건만 나갑니다.
+    Returns: 주문 dict (접수 실패/잔고 없음 포함) 또는 None(예외)
     """
     try:
-        # [1] 실제 매도 실행 (이미 구현된 매도 로직이 있다면 그 함수를 호출)
-        # 예: await exchange.create_market_sell_order(symbol, quantity)
-        # 1. 현재 잔고 확인
-        balance = await asyncio.to_thread(exchange.fetch_balance)
-        base = symbol.split('/')[0]
-        quantity = float(balance['free'].get(base, 0))
-
-        # 2. 최소 주문 수량 체크 (잔고가 거의 없으면 무시)
-        if quantity <= 0:
-            logger.warning(f"⚠️ {symbol} 매도 실패: 잔고가 0입니다.")
-            return
+        # [1] 가용 수량 전량 시장가 매도 (잔고 조회·수량 산출은 주문 엔진이 집행 시점에 수행)
+        order = await order_engine.exit_position(symbol, reason)
+        if not order_engine.is_accepted(order):
+            logger.warning(f"⚠️ {symbol} 매도 실패: {order['error']}")
+            return order
 
-        # 3. 실제 시장가 매도 주문 던지기
-        # 주문이 완료될 때까지 await로 기다립니다.
-        order_result = await asyncio.to_thread(exchange.create_market_sell_order, symbol, quantity)
-        
-        logger.info(f"💰 {symbol} 매도 집행 완료: {reason} | 수량: {quantity}")
+        logger.info(f"💰 {symbol} 매도 집행 완료: {reason} | 수량: {order['amount']}")
 
         
         # [2] 텔레그램 알림
@@ -404,10 +736,193 @@ async def execute_sell(app, symbol, reason):
         # [3] 유예 목록에서 제거
         if symbol in pending_approvals:
             del pending_approvals[symbol]
+        return order
             
     except Exception as e:
         logger.error(f"❌ {symbol} 매도 집행 중 에러: {e}")
 
+
+async def execute_sell_with_review(app, symbol, reason, profit, avg_price, curr_price):
+    """execute_sell + 손절이면 직전 1분 봉(하락 속도)과 체결 슬리피지를 사후분석 기록. Returns: execute_sell 결과"""
+    # [사후분석] 손절 시 직전 1분 봉(하락 속도) 수집 후 매도 실행
+    last_1m_open, last_1m_close = None, None
+    if profit < 0:
+        try:
+            ohlcv_1m = await rate_governor.call(rate_governor.PRIORITY_MONITOR, exchange.fetch_ohlcv, symbol, '1m', limit=3)
+            if ohlcv_1m and len(ohlcv_1m) >= 2:
+                last_1m_open = float(ohlcv_1m[-2][1])
+                last_1m_close = float(ohlcv_1m[-2][4])
+        except Exception:
+            pass
+    # 주문 엔진의 종목 청산 intent로 1회만 집행 (같은 종목 재요청은 기존 주문을 돌려받음)
+    order = await execute_sell(app, symbol, reason)
+    if order_engine.is_accepted(order) and profit < 0 and avg_price and avg_price > 0:
+        await order_engine.wait_fill(order, timeout=5)
+        exec_price = float(order['average'] or curr_price)
+        target_stop = avg_price * 0.98
+        slippage_pct = (exec_price - target_stop) / target_stop * 100
+        analyzer.record_loss_review(
+            symbol, exec_price, target_stop, slippage_pct, last_1m_open, last_1m_close,
+            ref_price=order['ref_price'], est_price=order['est_price'],
+            est_slippage_pct=order['est_slippage_pct'],
+            realized_slippage_pct=order_engine.realized_slippage_pct(order),
+            slices=len(order['legs'])
+        )
+    return order
+
+
+def schedule_grace(symbol, due_ts=None):
+    """매도 유예 1건의 만기 시각(시작 + wait_limit분, 또는 due_ts)을 힙에 등록. 유예가 새로 시작될 때마다 호출"""
+    global _grace_seq
+    info = pending_approvals.get(symbol)
+    if not info or not isinstance(info.get('start_time'), datetime):
+        return
+    start_ts = info['start_time'].timestamp()
+    if due_ts is None:
+        due_ts = start_ts + info.get('wait_limit', 30) * 60
+    _grace_seq += 1
+    heapq.heappush(grace_heap, (due_ts, _grace_seq, symbol, start_ts))
+    if _grace_wakeup is not None:
+        _grace_wakeup.set()
+
+
+def _grace_recovered(info, price):
+    """유예 시작 시점 수익률 대비 +0.5%p 넘게 회복했는지 (평단가·가격을 모르면 False)"""
+    avg_price = info.get('avg_price') or 0
+    if avg_price <= 0 or not price:
+        return False
+    return (price - avg_price) / avg_price * 100 > info.get('entry_profit', 0) + 0.5
+
+
+def _book_bid(symbol):
+    book = order_book.get_book(symbol)
+    return book.best_bid() if book else None
+
+
+async def _cancel_recovered_grace(app, symbol):
+    del pending_approvals[symbol]
+    logger.info(f"[매도유예] {symbol} 수익률 회복으로 유예 취소")
+    await app.bot.send_message(config.CHAT_ID, f"✅ [매도 취소] {symbol} 수익률 회복")
+
+
+async def check_grace_recovery(app):
+    """유예 중 종목을 호가 미러의 최우선 매수호가로 확인해 수익률이 회복되면 바로 유예 취소"""
+    for symbol, info in list(pending_approvals.items()):
+        if symbol in _grace_firing or info.get('status') not in ('WAITING', 'NOTIFIED'):
+            continue
+        if _grace_recovered(info, _book_bid(symbol)):
+            await _cancel_recovered_grace(app, symbol)
+
+
+async def expire_grace(app, symbol, late):
+    """
+    만기 도착한 매도 유예 1건: 실시간 가격으로 회복 여부를 마지막으로 확인한 뒤 매도 집행.
+    AUTO 종목은 '무응답 자동 매도'로 매도하고 결과와 무관하게 유예 종료 (기존 감시 루프와 동일),
+    그 외에는 유예 사유로 매도하고 접수되지 않으면 긴급 매도 권고를 보낸 뒤 GRACE_RETRY_SEC 후 다시 시도
+    (잔고 없음이면 이미 청산된 종목이므로 바로 유예 종료, 재시도는 GRACE_RETRY_MAX회까지)
+    """
+    info = pending_approvals.get(symbol)
+    if info is None:  # 만기 태스크가 뜨기 전에 유예가 끝남 (신호 해제·즉시 매도·감시 전환 등)
+        return
+    price = _book_bid(symbol)
+    if price is None:
+        ticker = await rate_governor.call(rate_governor.PRIORITY_MONITOR, exchange.fetch_ticker, symbol)
+        price = float(ticker.get('last') or ticker.get('close') or 0)
+    if _grace_recovered(info, price):
+        await _cancel_recovered_grace(app, symbol)
+        return
+
+    elapsed_min = (datetime.now() - info['start_time']).total_seconds() / 60
+    logger.info(f"[매도유예] {symbol} {info.get('wait_limit', 30)}분 유예 만기 (만기 대비 {late * 1000:.0f}ms)")
+    avg_price = info.get('avg_price') or 0
+    profit = (price - avg_price) / avg_price * 100 if avg_price > 0 and price else 0
+    if sell_mute_status.get(symbol) == 'AUTO':
+        await execute_sell_with_review(app, symbol, f"무응답 자동 매도 ({int(elapsed_min)}분 경과)", profit, avg_price, price)
+        pending_approvals.pop(symbol, None)
+        return
+
+    order = await execute_sell_with_review(app, symbol, info.get('reason') or "매도 유예 만기", profit, avg_price, price)
+    if order_engine.is_accepted(order):
+        return
+    if order is not None and order['error'] == "잔고 없음":
+        # 거래소 앱 등에서 이미 청산됨 → 권고 없이 유예 종료
+        pending_approvals.pop(symbol, None)
+        logger.info(f"[매도유예] {symbol} 잔고 없음 → 유예 종료")
+        return
+    retrying = _retry_grace(symbol)
+    await app.bot.send_message(
+        config.CHAT_ID,
+        f"🚨🚨 [긴급 매도 권고] {symbol}\n"
+        f"유예 시간이 {int(elapsed_min)}분 경과했습니다!\n"
+        + ("" if retrying else f"자동 매도 재시도 {GRACE_RETRY_MAX}회 실패로 유예를 종료합니다.\n")
+        + f"직접 판단해 주세요! 🔔"
+    )
+
+
+def _retry_grace(symbol):
+    """접수되지 않은 만기 매도를 GRACE_RETRY_SEC 뒤로 재예약. 한도를 넘었거나 유예가 이미 끝났으면 False"""
+    info = pending_approvals.get(symbol)
+    if info is None:
+        return False
+    info['expire_retries'] = info.get('expire_retries', 0) + 1
+    if info['expire_retries'] > GRACE_RETRY_MAX:
+        pending_approvals.pop(symbol, None)
+        logger.warning(f"[매도유예] {symbol} 만기 매도 재시도 한도 초과 ({GRACE_RETRY_MAX}회) → 유예 종료")
+        return False
+    schedule_grace(symbol, time.time() + GRACE_RETRY_SEC)
+    return True
+
+
+async def _expire_grace_task(app, symbol, late):
+    """grace_task가 _grace_firing에 넣은 종목은 어떤 경로로 끝나든 여기서 뺌 (남으면 그 종목 유예가 다시 만기되지 않음)"""
+    try:
+        await expire_grace(app, symbol, late)
+    except Exception as e:
+        logger.error(f"Grace Expire Error ({symbol}): {e}")
+        _retry_grace(symbol)
+    finally:
+        _grace_firing.discard(symbol)
+
+
+async def grace_task(app):
+    """
+    [매도 유예 타이머] 감시 주기(3분)와 무관하게 유예 만기 정각에 매도/긴급 권고를 실행하고,
+    유예 중에는 GRACE_PRICE_CHECK_SEC마다 호가 미러로 수익률 회복을 확인해 즉시 취소.
+    유예가 취소·재시작돼 시작 시각이 달라진 힙 항목은 버림
+    """
+    global _grace_wakeup
+    _grace_wakeup = asyncio.Event()
+    while True:
+        try:
+            _grace_wakeup.clear()
+            if not grace_heap and not pending_approvals:
+                await _grace_wakeup.wait()
+                continue
+            delay = grace_heap[0][0] - time.time() if grace_heap else GRACE_PRICE_CHECK_SEC
+            if pending_approvals:
+                delay = min(delay, GRACE_PRICE_CHECK_SEC)
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(_grace_wakeup.wait(), timeout=delay)
+                    continue  # 더 이른 만기가 들어옴 → 다시 계산
+                except asyncio.TimeoutError:
+                    pass
+
+            now = time.time()
+            while grace_heap and grace_heap[0][0] <= now:
+                due_ts, _, symbol, start_ts = heapq.heappop(grace_heap)
+                info = pending_approvals.get(symbol)
+                if (info and symbol not in _grace_firing and info.get('status') in ('WAITING', 'NOTIFIED')
+                        and isinstance(info.get('start_time'), datetime) and info['start_time'].timestamp() == start_ts):
+                    # 매도 집행(잔고·주문·체결 대기)은 별도 태스크로 → 타이머는 바로 다음 만기를 기다림
+                    _grace_firing.add(symbol)
+                    asyncio.create_task(_expire_grace_task(app, symbol, now - due_ts))
+            await check_grace_recovery(app)
+        except Exception as e:
+            logger.error(f"Grace Task Error: {e}")
+            await asyncio.sleep(1)
+
+
 async def sell_monitor_task(app):
     """[최종 복구] 기존 유예/취소/0순위 로직 완전 유지 + 수익률 & 야간 모드 보정"""
     global last_report_time, sell_mute_status, pending_approvals, profit_alerts
@@ -417,33 +932,34 @@ async def sell_monitor_task(app):
             now_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
             assets = await get_my_assets()
-            # [추가] 등급 및 시간 정보를 정확히 가져오기 위해 인벤토리 로드
-            inv_data = load_inventory()
+            # [호가미러] 이 노드가 감시하는 보유 종목의 로컬 호가를 유지 (손절 시 REST 호가 조회 생략)
+            order_book.set_watched(s for s in assets if node_lease.owns_symbol(s))
 
             is_night = config.is_sleeping_time()
             report_lines = []
             symbol_buttons = []
 
             for symbol, data in list(assets.items()):
+                # [멀티 노드] 다른 노드 담당 종목은 그 노드가 감시/매도
+                if not node_lease.owns_symbol(symbol):
+                    continue
                 # 0단계: 기본 데이터 수집
-                ticker = await asyncio.to_thread(exchange.fetch_ticker, symbol)
+                ticker = await rate_governor.call(rate_governor.PRIORITY_MONITOR, exchange.fetch_ticker, symbol)
                 this_curr_p = float(ticker.get('last') or ticker.get('close') or 0)
-                this_avg_p = float(inv_item.get('purchase_price') or inv_item.get('avg_price') or data.get('avg_buy_price') or 0)
-                # 인벤토리 데이터 미리 로드 (평단가 보충 및 등급 확인용)
-                inv_item = inv_data.get(symbol) or inv_data.get(symbol.split('/')[0]) or {}
-
-                this_qty = float(data.get('total', 0))
-
-                # 수익률 계산 (보정된 평단가 사용)
-                this_profit = ((this_curr_p - this_avg_p) / this_avg_p * 100) if this_avg_p > 0 else 0
-                this_profit_krw = (this_curr_p - this_avg_p) * this_qty
-
-                # [수정] 인벤토리에서 등급 가져오기
-                this_grade = inv_item.get('grade', 'A')
+                # [포지션장부] 평단(인벤토리 우선으로 편입)·수량·등급·매수 시각은 장부에서, 손익은 현재가 틱으로 갱신
+                position_ledger.update_price(symbol, this_curr_p)
+                pos = position_ledger.get(symbol)
+                if pos is None:
+                    continue  # 잔고 대조 직후라 정상적으로는 없음 (다음 주기에 편입)
+                this_avg_p = pos['avg_price']
+                this_qty = pos['qty']
+                this_profit = position_ledger.profit_pct(pos)
+                this_profit_krw = pos['unrealized']
+                this_grade = pos['grade']
 
                 # 실시간 경과 시간 및 타입 추출
                 this_elapsed_bars = 0
-                buy_time_str = inv_item.get('purchase_time') or inv_item.get('buy_time') or inv_item.get('last_update') 
+                buy_time_str = pos['opened_at']
                 if buy_time_str:
                     try:
                         buy_time_dt = datetime.strptime(buy_time_str, '%Y-%m-%d %H:%M:%S')
@@ -455,7 +971,7 @@ async def sell_monitor_task(app):
                     this_elapsed_bars = 999
 
                 # 인벤토리에서 매수 당시 결정된 타입(1, 2, 3)을 가져옵니다.
-                this_buy_type = inv_item.get('buy_type', 1)
+                this_buy_type = pos['buy_type']
 
                 # 1단계: 수익 알람 (기존 로직 유지)
                 if this_profit >= 1.0:
@@ -472,32 +988,24 @@ async def sell_monitor_task(app):
                         )
 
                 # 2단계: 차트 데이터 및 익절 엔진 (기존 로직 보존)
-                ohlcv = await asyncio.to_thread(exchange.fetch_ohlcv, symbol, '30m', limit=100)
-                df = pd.DataFrame(ohlcv, columns=['time', 'open', 'high', 'low', 'close', 'vol'])
-                ma40_line = df['close'].rolling(40).mean().iloc[-1]
+                ohlcv = await rate_governor.call(rate_governor.PRIORITY_MONITOR, exchange.fetch_ohlcv, symbol, '30m', limit=100)
+                df = Candles.from_ohlcv(ohlcv)
+                ma40_line = df.sma_last(40)
 
                 tp_executed = False
                 # [기존 익절 로직 보존]
                 if this_profit >= 13.0:
-                    balance = await asyncio.to_thread(exchange.fetch_balance)
-                    base = symbol.split('/')[0]
-                    free_qty = float(balance['free'].get(base, 0))
-                    sell_qty = min(this_qty, free_qty)
-                    if sell_qty <= 0:
-                        logger.info(f"매도 건너뜀(잔고 부족): {symbol}")
+                    order = await order_engine.exit_position(symbol, "목표익절 13%", max_qty=this_qty)
+                    if not order_engine.is_accepted(order):
+                        logger.info(f"매도 건너뜀(잔고 부족): {symbol} ({order['error']})")
                     else:
-                        await asyncio.to_thread(exchange.create_market_sell_order, symbol, sell_qty)
                         await app.bot.send_message(config.CHAT_ID, f"🎯 [목표익절] {symbol} 13% 전량 매도")
                         tp_executed = True
                 elif this_profit >= 8.0 and this_curr_p < ma40_line:
-                    balance = await asyncio.to_thread(exchange.fetch_balance)
-                    base = symbol.split('/')[0]
-                    free_qty = float(balance['free'].get(base, 0))
-                    sell_qty = min(this_qty, free_qty)
-                    if sell_qty <= 0:
-                        logger.info(f"매도 건너뜀(잔고 부족): {symbol}")
+                    order = await order_engine.exit_position(symbol, "추적익절 8%구간 40선 이탈", max_qty=this_qty)
+                    if not order_engine.is_accepted(order):
+                        logger.info(f"매도 건너뜀(잔고 부족): {symbol} ({order['error']})")
                     else:
-                        await asyncio.to_thread(exchange.create_market_sell_order, symbol, sell_qty)
                         await app.bot.send_message(config.CHAT_ID, f"💰 [추적익절] {symbol} 8%구간 40선 이탈")
                         tp_executed = True
 
@@ -558,7 +1066,6 @@ async def sell_monitor_task(app):
                 else:
                     is_sell_final = False
 
-                elapsed_min = 0
                 if is_sell_signal:
                     if "0순위" in sell_reason or "절대익절" in sell_reason:
                         is_sell_final = True
@@ -569,8 +1076,10 @@ async def sell_monitor_task(app):
                                 'start_time': datetime.now(),
                                 'entry_profit': this_profit,
                                 'reason': sell_reason,
-                                'wait_limit': 10
+                                'wait_limit': 10,
+                                'avg_price': this_avg_p
                             }
+                            schedule_grace(symbol)
                     elif symbol not in pending_approvals:
                         # [기존 로직] 사유별 유예 시간 차등 (10분 vs 30분)
                         wait_limit = 10 if ("1순위" in sell_reason or "2음봉" in sell_reason) else 30
@@ -588,24 +1097,17 @@ async def sell_monitor_task(app):
                             'start_time': datetime.now(),
                             'entry_profit': this_profit,
                             'reason': sell_reason,
-                            'wait_limit': wait_limit
+                            'wait_limit': wait_limit,
+                            'avg_price': this_avg_p
                         }
-                    else:
+                        schedule_grace(symbol)
+                    elif symbol not in _grace_firing:
                         wait_data = pending_approvals[symbol]
-                        # [기존 로직] 수익률 회복 시 유예 취소
+                        wait_data['avg_price'] = this_avg_p  # 타이머의 실시간 회복 판정용 (복구된 유예 보충)
+                        # [기존 로직] 수익률 회복 시 유예 취소 (만기 매도·긴급 권고는 grace_task가 만기 시각에 처리)
                         if this_profit > wait_data.get('entry_profit', 0) + 0.5:
                             del pending_approvals[symbol]
                             await app.bot.send_message(config.CHAT_ID, f"✅ [매도 취소] {symbol} 수익률 회복")
-                        elif wait_data.get('status') in ['WAITING', 'NOTIFIED']:
-                            elapsed_min = (datetime.now() - wait_data['start_time']).total_seconds() / 60
-                            current_limit = wait_data.get('wait_limit', 30)
-                            if elapsed_min >= current_limit:
-                                is_sell_final = True
-                                # [추가] 자동 모드일 경우 여기서 직접 매도 호출
-                                if sell_mute_status.get(symbol) == 'AUTO':
-                                    await execute_sell(app, symbol, f"무응답 자동 매도 ({int(elapsed_min)}분 경과)")
-                                    if symbol in pending_approvals: del pending_approvals[symbol]
-                                    continue
 
                 else:
                     if symbol in pending_approvals: del pending_approvals[symbol]
@@ -634,61 +1136,13 @@ async def sell_monitor_task(app):
                 # 5단계: 최종 집행
                 # 감시 루프 하단부
                 if is_sell_final:
-                    # 이미 위에서 execute_sell을 했다면 중복 실행 방지 로직 필요
-                    await execute_sell(app, symbol, sell_reason)
-                    if symbol in pending_approvals: del pending_approvals[symbol]
-                    if status == 'AUTO' or is_night or "0순위" in sell_reason:
-                        balance = await asyncio.to_thread(exchange.fetch_balance)
-                        base = symbol.split('/')[0]
-                        free_qty = float(balance['free'].get(base, 0))
-                        sell_qty = min(this_qty, free_qty)
-                        if sell_qty <= 0:
-                            logger.info(f"매도 건너뜀(잔고 부족): {symbol}")
-                        else:
-                            # [사후분석] 손절 시 직전 1분 봉(하락 속도) 수집 후 매도 실행
-                            last_1m_open, last_1m_close = None, None
-                            if this_profit < 0:
-                                try:
-                                    ohlcv_1m = await asyncio.to_thread(exchange.fetch_ohlcv, symbol, '1m', limit=3)
-                                    if ohlcv_1m and len(ohlcv_1m) >= 2:
-                                        last_1m_open = float(ohlcv_1m[-2][1])
-                                        last_1m_close = float(ohlcv_1m[-2][4])
-                                except Exception:
-                                    pass
-                            order_result = await asyncio.to_thread(exchange.create_market_sell_order, symbol, sell_qty)
-                            ######### [신규 추가 시작: 매도 성공 시 중복 알람 차단 로직] #########
-                            # 1. 주문 성공 여부 확인 (id가 있으면 성공)
-                            if order_result and 'id' in order_result:
-                                
-                                # 2. 감시 목록(assets)에서 즉시 제거 (이게 있어야 아래쪽 알람이 안 뜸)
-                                if symbol in assets:
-                                    del assets[symbol]
-                                    logger.info(f"✅ {symbol} 매도 성공 확인: assets에서 제거됨")
-
-                                # 3. 매도 성공 알림 (기존에 아래 있던 메시지 코드를 이 안으로 이동)
-                                await app.bot.send_message(config.CHAT_ID, f"🔴 [매도 집행]\n{symbol} | 사유: {sell_reason}")
-
-                                # 4. 이번 종목 처리는 끝났으니 즉시 다음 종목으로 (아래쪽 '긴급 권고' 로직 스킵)
-                                continue 
-
-                            else:
-                                # 매도 주문이 실패했을 경우의 로그 (선택 사항)
-                                logger.error(f"❌ {symbol} 매도 주문 실패 또는 응답 없음: {order_result}")
-                            exec_price = float(order_result.get('average') or order_result.get('price') or this_curr_p)
-                            if this_profit < 0 and this_avg_p and this_avg_p > 0:
-                                target_stop = this_avg_p * 0.98
-                                slippage_pct = (exec_price - target_stop) / target_stop * 100
-                                analyzer.record_loss_review(symbol, exec_price, target_stop, slippage_pct, last_1m_open, last_1m_close)
-                            if symbol in pending_approvals: del pending_approvals[symbol]
-                    else:
-                        limit = pending_approvals.get(symbol, {}).get('wait_limit', 30)
-                        if elapsed_min >= limit:
-                            await app.bot.send_message(
-                                config.CHAT_ID,
-                                f"🚨🚨 [긴급 매도 권고] {symbol}\n"
-                                f"유예 시간이 {int(elapsed_min)}분 경과했습니다!\n"
-                                f"직접 판단해 주세요! 🔔"
-                            )
+                    order = await execute_sell_with_review(app, symbol, sell_reason, this_profit, this_avg_p, this_curr_p)
+                    if order_engine.is_accepted(order):
+                        # 감시 목록(assets)에서 즉시 제거
+                        if symbol in assets:
+                            del assets[symbol]
+                            logger.info(f"✅ {symbol} 매도 성공 확인: assets에서 제거됨")
+                        continue
 
             # 정기 리포트 발송 (기존 로직 유지)
             if (datetime.now() - last_report_time).total_seconds() >= config.REPORT_INTERVAL:
@@ -710,6 +1164,7 @@ async def sell_monitor_task(app):
                     msg_text = (
                         f"📊 [정기 리포트] ({now_str}){' (야간 AUTO)' if is_night else ''}\n"
                         f"{summary}\n"
+                        f"{format_portfolio_line()}\n"
                         f"━━━━━━━━━━━━\n"
                         + "\n".join(final_text_lines)
                     )
@@ -729,6 +1184,65 @@ async def sell_monitor_task(app):
             await asyncio.sleep(180)  # [변경] 에러 발생 시에도 3분 대기
 
 
+def dispatch_callback_job(context, coro, name):
+    """버튼 처리 중 거래소 작업(조회·주문)을 백그라운드 작업으로 넘김 → 핸들러는 바로 반환해 다음 탭을 받음"""
+    async def job():
+        try:
+            await coro
+        except Exception as e:
+            logger.error(f"Callback Job Error ({name}): {e}")
+    context.application.create_task(job(), name=name)
+
+
+async def _manual_buy_job(query, symbol, action):
+    try:
+        # 마지막 판단 등급 사용, 오래됐거나 없으면 캔들을 받아 재판단
+        current_grade = cached_grade(symbol)
+        if current_grade is None:
+            ohlcv = await rate_governor.call(rate_governor.PRIORITY_MONITOR, exchange.fetch_ohlcv, symbol, '30m', limit=200)
+            current_grade = get_current_grade(symbol, Candles.from_ohlcv(ohlcv))
+        cost = config.DEFAULT_TEST_BUY if action == "buy_now" else 1000000
+
+        print(f"📍 [수동매수 시작] {symbol} | 등급: {current_grade} | 금액: {cost}")
+        # 변수에 담긴 현재 등급을 전달
+        success, res_msg = await safe_market_buy(symbol, cost, current_grade)
+
+        if success:
+            display_msg = f"🚀 [{symbol.split('/')[0]}] 매수 성공! (금액: {cost:,}원)"
+        else:
+            display_msg = f"❌ [{symbol.split('/')[0]}] 매수 실패\n사유: {res_msg}"
+        await query.edit_message_text(display_msg)
+    except Exception as e:
+        logger.error(f"❌ 매수 프로세스 치명적 오류: {e}")
+        await query.edit_message_text(f"⚠️ 시스템 오류로 매수 실패: {e}")
+
+
+async def _manual_exit_job(query, symbol, reason, fail_text, done_text):
+    # 보유 여부는 버튼 캐시가 아니라 주문 엔진이 집행 시점 실잔고로 판단 (잔고 없으면 '잔고 없음'으로 실패)
+    order = await order_engine.exit_position(symbol, reason)
+    if not order_engine.is_accepted(order):
+        if order['error'] == "잔고 없음":
+            await query.edit_message_text(f"{fail_text}: 보유 중인 종목이 아닙니다.")
+            return
+        await query.edit_message_text(f"{fail_text}: {order['error']}")
+        return
+    if symbol in pending_approvals: del pending_approvals[symbol]
+    await query.edit_message_text(done_text)
+
+
+async def _sell_half_job(query, symbol):
+    qty = await order_engine.get_free_balance(symbol.split('/')[0])
+    if qty <= 0:
+        await query.edit_message_text(f"❌ {symbol} 분할 매도 실패: 보유 중인 종목이 아닙니다.")
+        return
+    order = await order_engine.submit(symbol, 'sell', qty * 0.5, reason="수동 50% 분할 매도")
+    await order_engine.wait_ack(order)
+    if not order_engine.is_accepted(order):
+        await query.edit_message_text(f"❌ {symbol} 분할 매도 실패: {order['error']}")
+        return
+    await query.edit_message_text(f"🟠 {symbol} 50% 분할 매도 완료.")
+
+
 async def handle_interaction(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """텔레그램 상호작용 (최종 반영: S급 자동매수 추적 해제 로직 추가)"""
     global buy_mute_mode, sell_mute_status, buy_individual_status, pending_s_buys
@@ -772,44 +1286,19 @@ async def handle_interaction(update: Update, context: ContextTypes.DEFAULT_TYPE)
             await query.edit_message_text(f"🟢 {symbol}\n매도 모드: [매도 무시/유지 🔒] 상태입니다.")
 
         elif action in ["buy_now", "buy_full"]:
-            await query.answer()
-            try:
-                # [추가] 수동 매수 집행 시 S급 자동매수 추적 리스트에서 즉시 제거
-                if symbol in pending_s_buys: del pending_s_buys[symbol]
-
-                ohlcv = await asyncio.to_thread(exchange.fetch_ohlcv, symbol, '30m', limit=200)
-                df = pd.DataFrame(ohlcv, columns=['time', 'open', 'high', 'low', 'close', 'vol'])
-
-                # 기존 get_current_grade 호출 및 매수 로직 유지
-                from main import get_current_grade  # 참조 확인
-                current_grade = get_current_grade(symbol, df)
-                cost = config.DEFAULT_TEST_BUY if action == "buy_now" else 1000000
-
-                print(f"📍 [수동매수 시작] {symbol} | 등급: {current_grade} | 금액: {cost}")
-                # 변수에 담긴 현재 등급을 전달
-                success, res_msg = await safe_market_buy(symbol, cost, current_grade)
-
-                if success:
-                    display_msg = f"🚀 [{symbol.split('/')[0]}] 매수 성공! (금액: {cost:,}원)"
-                else:
-                    display_msg = f"❌ [{symbol.split('/')[0]}] 매수 실패\n사유: {res_msg}"
-                await query.edit_message_text(display_msg)
-            except Exception as e:
-                logger.error(f"❌ 매수 프로세스 치명적 오류: {e}")
-                await query.edit_message_text(f"⚠️ 시스템 오류로 매수 실패: {e}")
+            # [추가] 수동 매수 집행 시 S급 자동매수 추적 리스트에서 즉시 제거
+            if symbol in pending_s_buys: del pending_s_buys[symbol]
+            # 등급 확인·주문은 백그라운드에서 (결과는 같은 메시지를 수정해 알림)
+            dispatch_callback_job(context, _manual_buy_job(query, symbol, action), f"buy:{symbol}")
 
         elif action == "sell_all":
-            assets = await get_my_assets()
-            if symbol in assets:
-                await asyncio.to_thread(exchange.create_market_sell_order, symbol, assets[symbol]['total'])
-                if symbol in pending_approvals: del pending_approvals[symbol]
-                await query.edit_message_text(f"✅ {symbol} 전량 매도 완료.")
+            # 자산 캐시는 최대 한 감시 주기만큼 늦으므로 보유 판단은 작업 안의 실잔고 조회에 맡김
+            dispatch_callback_job(context, _manual_exit_job(
+                query, symbol, "수동 전량 매도", f"❌ {symbol} 매도 실패", f"✅ {symbol} 전량 매도 완료."
+            ), f"sell_all:{symbol}")
 
         elif action == "sell_half":
-            assets = await get_my_assets()
-            if symbol in assets:
-                await asyncio.to_thread(exchange.create_market_sell_order, symbol, assets[symbol]['total'] * 0.5)
-                await query.edit_message_text(f"🟠 {symbol} 50% 분할 매도 완료.")
+            dispatch_callback_job(context, _sell_half_job(query, symbol), f"sell_half:{symbol}")
 
         elif action == "adj_amt":
             try:
@@ -842,13 +1331,13 @@ async def handle_interaction(update: Update, context: ContextTypes.DEFAULT_TYPE)
             current_all_auto = all(
                 status == 'AUTO' for status in sell_mute_status.values()) if sell_mute_status else False
             new_status = 'WATCH' if current_all_auto else 'AUTO'
-            assets = await get_my_assets()
+            assets = await get_cached_assets()
             for sym in assets.keys(): sell_mute_status[sym] = new_status
             await query.answer("🤖 자동 전환 완료" if new_status == 'AUTO' else "⏳ 감시 전환 완료")
             await query.edit_message_reply_markup(reply_markup=telegram_ui.get_report_inline_kb(not current_all_auto))
 
         elif action == "set_all_sell_watch":
-            assets = await get_my_assets()
+            assets = await get_cached_assets()
             for sym in assets.keys():
                 sell_mute_status[sym] = 'WATCH'
                 if sym in pending_approvals: del pending_approvals[sym]
@@ -860,8 +1349,7 @@ async def handle_interaction(update: Update, context: ContextTypes.DEFAULT_TYPE)
             await query.edit_message_text(f"{query.message.text}\n\n✅ [알림] 모든 매도 설정 초기화 완료")
 
         elif action == "request_instant_report":
-            from main import process_report_logic
-            await process_report_logic(update, context, query)
+            dispatch_callback_job(context, process_report_logic(update, context, query), "instant_report")
 
         elif action == "manage_asset":
             try:
@@ -873,14 +1361,10 @@ async def handle_interaction(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 logger.error(f"Manage Asset Error: {e}")
 
         elif action == "sell_now":
-            assets = await get_my_assets()
-            if symbol in assets:
-                qty = float(assets[symbol]['total'])
-                await asyncio.to_thread(exchange.create_market_sell_order, symbol, qty)
-                await query.edit_message_text(f"🔴 [{symbol.split('/')[0]}] 즉시 매도를 집행했습니다.")
-                if symbol in pending_approvals: del pending_approvals[symbol]
-            else:
-                await query.answer("보유 중인 종목이 아닙니다.")
+            dispatch_callback_job(context, _manual_exit_job(
+                query, symbol, "수동 즉시 매도", f"❌ [{symbol.split('/')[0]}] 매도 실패",
+                f"🔴 [{symbol.split('/')[0]}] 즉시 매도를 집행했습니다."
+            ), f"sell_now:{symbol}")
 
         elif action == "mute_30m":
             sell_mute_status[symbol] = 'MUTE'
@@ -894,6 +1378,7 @@ async def handle_interaction(update: Update, context: ContextTypes.DEFAULT_TYPE)
                     'start_time': datetime.now(),
                     'wait_limit': limit
                 })
+                schedule_grace(symbol)
                 icon = "🚨" if limit == 10 else "🟡"
                 await query.edit_message_text(
                     f"{icon} {symbol.split('/')[0]} 매도 유예 시작\n"
@@ -906,16 +1391,16 @@ async def handle_interaction(update: Update, context: ContextTypes.DEFAULT_TYPE)
     elif update.message and update.message.text:
         # 기존 텍스트 메시지 처리 로직 100% 유지
         if msg == "📊 실시간 리포트":
-            from main import process_report_logic
-            await process_report_logic(update, context)
+            dispatch_callback_job(context, process_report_logic(update, context), "instant_report")
         elif "평균매수가" in msg:
             try:
                 parts = msg.split()
                 coin, price = parts[0].upper(), float(parts[2])
                 sym = f"{coin}/KRW"
-                assets = await get_my_assets()
+                assets = await get_cached_assets()
                 qty = assets.get(sym, {}).get('total', 0)
                 save_inventory(sym, price, qty)
+                position_ledger.set_avg_price(sym, price)
                 await update.message.reply_text(f"✅ {sym} 평단가 {price:,.0f}원 설정 완료")
             except:
                 pass
@@ -935,14 +1420,20 @@ async def handle_interaction(update: Update, context: ContextTypes.DEFAULT_TYPE)
                                             reply_markup=telegram_ui.get_amt_kb(config.DEFAULT_TEST_BUY))
 
 
+def format_portfolio_line():
+    """리포트 상단 포트폴리오 합계 한 줄 (포지션 장부 합계, 종목별 재계산 없음)"""
+    p = position_ledger.portfolio()
+    return (f"💼 평가 {p['value']:,.0f}원 | 평가손익 {p['unrealized']:+,.0f}원({p['unrealized_pct']:+.2f}%) | "
+            f"실현 {p['realized']:+,.0f}원")
+
+
 async def process_report_logic(update, context, query=None):
     """[최종 복구] 실시간 리포트 - 11개 전 종목 노출 + 수익률 정상화 + 흰색 제거"""
     global pending_approvals, sell_mute_status
 
     try:
-        # [원본 로직] 자산 및 인벤토리 로드
+        # [원본 로직] 자산 로드 (잔고 대조 후 평단·등급·매수 시각은 포지션 장부에서)
         assets = await get_my_assets()
-        inv_data = load_inventory()
         is_night = config.is_sleeping_time()
 
         ##### [수정] 정렬과 집계를 위해 딕셔너리 구조 리스트로 변경 #####
@@ -951,31 +1442,22 @@ async def process_report_logic(update, context, query=None):
 
         # [핵심] 필터링(continue) 없이 assets에 있는 모든 종목을 순회
         for symbol, data in assets.items():
-            ticker = await asyncio.to_thread(exchange.fetch_ticker, symbol)
+            ticker = await rate_governor.call(rate_governor.PRIORITY_ANALYTICS, exchange.fetch_ticker, symbol)
             this_curr_p = float(ticker.get('last') or ticker.get('close') or 0)
             if this_curr_p == 0: continue
 
-            # [수정] 평단가 참조 키 보강 (-100% 및 종목 누락 방지)
-            this_avg_p = float(data.get('avg_buy_price') or data.get('avg_price') or 0)
-
-            # 인벤토리 데이터 미리 로드 (평단가 보충 및 등급 확인용)
-            inv_item = inv_data.get(symbol) or inv_data.get(symbol.split('/')[0]) or {}
-
-            # [보강] 거래소 데이터에 평단가가 없으면 인벤토리 값으로 대체하여 0원(누락/오류) 방지
-            if this_avg_p <= 0:
-                this_avg_p = float(inv_item.get('purchase_price') or 0)
+            position_ledger.update_price(symbol, this_curr_p)
+            pos = position_ledger.get(symbol)
+            if pos is None: continue
+            this_avg_p = pos['avg_price']
+            this_profit = position_ledger.profit_pct(pos)
+            this_profit_krw = pos['unrealized']
 
-            this_qty = float(data.get('total', 0))
-
-            # 평단가 보정을 통해 this_profit이 정상적으로 계산됨 (리스트 누락 방지)
-            this_profit = ((this_curr_p - this_avg_p) / this_avg_p * 100) if this_avg_p > 0 else 0
-            this_profit_krw = (this_curr_p - this_avg_p) * this_qty
-
-            # 인벤토리 데이터 매칭 (등급 및 매수시간)
-            this_grade = inv_item.get('grade', 'A')
+            # 장부 데이터 매칭 (등급 및 매수시간)
+            this_grade = pos['grade']
             # 실시간 경과 시간 추출
             this_elapsed_bars = 0
-            buy_time_str = inv_item.get('purchase_time')
+            buy_time_str = pos['opened_at']
             if buy_time_str:
                 try:
                     buy_time_dt = datetime.strptime(buy_time_str, '%Y-%m-%d %H:%M:%S')
@@ -990,9 +1472,9 @@ async def process_report_logic(update, context, query=None):
             raw_status = sell_mute_status.get(symbol, 'WATCH')
             status = 'AUTO' if is_night else raw_status
 
-            ohlcv = await asyncio.to_thread(exchange.fetch_ohlcv, symbol, '30m', limit=100)
-            df = pd.DataFrame(ohlcv, columns=['time', 'open', 'high', 'low', 'close', 'vol'])
-            ma40_line = df['close'].rolling(40).mean().iloc[-1]
+            ohlcv = await rate_governor.call(rate_governor.PRIORITY_ANALYTICS, exchange.fetch_ohlcv, symbol, '30m', limit=100)
+            df = Candles.from_ohlcv(ohlcv)
+            ma40_line = df.sma_last(40)
 
             # 전략 엔진 호출
             is_sell_signal, sell_reason = await strategy.check_sell_signal(
@@ -1000,7 +1482,7 @@ async def process_report_logic(update, context, query=None):
             )
             # [추가: 3번 타입 방어 로직 - 정기 리포트와 동일하게 맞춤] #####
             
-            this_buy_type = inv_item.get('buy_type', 1)
+            this_buy_type = pos['buy_type']
             if this_buy_type == 3:
                 # [1순위] 절대 손절선 감시
                 if this_profit <= -3.0:
@@ -1080,7 +1562,7 @@ async def process_report_logic(update, context, query=None):
 
         # 최종 메시지 조립
         night_tag = " (야간 AUTO)" if is_night else ""
-        msg_text = f"📊 [실시간 리포트]{night_tag}\n{summary}" + ("━━━━━━━━━━━━\n" + "\n".join(final_text_lines) if final_text_lines else "보유 종목 없음")
+        msg_text = f"📊 [실시간 리포트]{night_tag}\n{summary}{format_portfolio_line()}\n" + ("━━━━━━━━━━━━\n" + "\n".join(final_text_lines) if final_text_lines else "보유 종목 없음")
 
         # 전송 방식 분기 (수정 vs 신규)
         if query:
@@ -1103,11 +1585,11 @@ async def is_sell_still_valid(symbol):
     """
     try:
         # 1. 현재가 및 캔들 데이터 직접 확보 (30분봉 기준)
-        ticker = await asyncio.to_thread(exchange.fetch_ticker, symbol)
+        ticker = await rate_governor.call(rate_governor.PRIORITY_MONITOR, exchange.fetch_ticker, symbol)
         curr_p = float(ticker.get('last') or ticker.get('close') or 0)
 
         # get_candles 대신 직접 fetch_ohlcv 호출
-        ohlcv = await asyncio.to_thread(exchange.fetch_ohlcv, symbol, '30m', limit=50)
+        ohlcv = await rate_governor.call(rate_governor.PRIORITY_MONITOR, exchange.fetch_ohlcv, symbol, '30m', limit=50)
         if not ohlcv or curr_p == 0:
             return True, "데이터 부족으로 매도 진행"
 
@@ -1143,31 +1625,63 @@ def get_current_grade(symbol, df):
     try:
         # check_buy_signal이 4개 값을 리턴하도록 변경됨: (is_buy, reason, grade, data_dict)
         is_buy, reason, grade, data_dict = strategy.check_buy_signal(df, symbol, config.WARNING_LIST)
-
-        if is_buy:
-            # grade 값이 직접 반환됨 (예: "S+", "A+", "A", "S")
-            if grade:
-                # "S+" -> "S", "A+" -> "A"로 변환하여 반환
-                if grade.startswith("S"): return "S"
-                if grade.startswith("A"): return "A"
-                return grade
-            # grade가 없으면 reason에서 추출
-            if "S급" in reason or "[S" in reason: return "S"
-            if "A급" in reason or "[A" in reason: return "A"
-
-        return "B"  # 그 외 일반 등급
+        return grade_from_signal(is_buy, reason, grade)
     except Exception as e:
         logger.error(f"Grade check error: {e}")
         return "A"  # 에러 시 안전하게 자동매수 차단 등급 반환
 
+
+def grade_from_signal(is_buy, reason, grade):
+    """check_buy_signal 결과 → 주문/인벤토리용 등급 (S / A / B)"""
+    if is_buy:
+        # grade 값이 직접 반환됨 (예: "S+", "A+", "A", "S")
+        if grade:
+            # "S+" -> "S", "A+" -> "A"로 변환하여 반환
+            if grade.startswith("S"): return "S"
+            if grade.startswith("A"): return "A"
+            return grade
+        # grade가 없으면 reason에서 추출
+        if "S급" in (reason or "") or "[S" in (reason or ""): return "S"
+        if "A급" in (reason or "") or "[A" in (reason or ""): return "A"
+
+    return "B"  # 그 외 일반 등급
+
+
+def cached_grade(symbol):
+    """스캔·S급 추적이 마지막으로 판단한 등급 (GRADE_CACHE_SEC 이내만, 없으면 None)"""
+    entry = last_grades.get(symbol)
+    if entry and time.time() - entry[1] <= GRADE_CACHE_SEC:
+        return entry[0]
+    return None
+
 async def main():
+    log_pipeline.install(logger)  # 이후 로그는 큐 → 백그라운드 스레드에서 기록
+    if session_replay.CAPTURE_FILE:
+        # [세션 기록] 이후 모든 거래소 응답을 기록 (재생 시작 상태용으로 인벤토리·상태 파일도 함께)
+        session_replay.start_capture(session_replay.CAPTURE_FILE, files=(INV_FILE, state_store.STATE_FILE))
     print("🚀 가상화폐 자동 매매 시스템 가동...")
-    app = Application.builder().token(config.TELEGRAM_TOKEN).build()
+    restore_runtime_state()
+    # 업데이트(버튼 탭)를 동시에 처리 → 느린 처리 1건이 다음 탭의 응답을 막지 않음
+    app = Application.builder().token(config.TELEGRAM_TOKEN).concurrent_updates(True).build()
     app.add_handler(CallbackQueryHandler(handle_interaction))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_interaction))
 
+    # [멀티 노드] 첫 스캔 전에 샤드 리스를 받아둠
+    if node_lease.COORDINATION_ENABLED:
+        await asyncio.to_thread(node_lease.heartbeat)
+        asyncio.create_task(node_lease.heartbeat_task())
+    # 유의종목·마켓 목록은 첫 스캔 전에 1회 채워두고 이후 백그라운드에서 갱신
+    await strategy.refresh_warning_list()
+    await market_cache.init_markets()
+    asyncio.create_task(strategy.warning_list_refresh_task())
+    asyncio.create_task(market_cache.market_refresh_task())
+    asyncio.create_task(state_snapshot_task())
     asyncio.create_task(buy_scan_task(app))
+    asyncio.create_task(s_track_task(app))
+    asyncio.create_task(grace_task(app))
     asyncio.create_task(sell_monitor_task(app))
+    asyncio.create_task(order_book.book_sync_task())
+    asyncio.create_task(outcome_tracker.outcome_task())
 
     await app.initialize()
     await app.start()
@@ -1179,7 +1693,18 @@ async def main():
 
 
 if __name__ == "__main__":
+    # kill_ps.sh(SIGTERM)도 Ctrl+C와 같은 종료 처리(반복 구간·캔들 버퍼 기록, 상태 스냅샷)를 거치도록
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
+        analyzer.flush_missed_runs()
+        candle_store.flush()
+        payload = state_store.build_snapshot(collect_runtime_state())
+        if payload:
+            state_store.write_snapshot(payload)
+        if node_lease.COORDINATION_ENABLED:
+            node_lease.release_all()
+        session_replay.stop_capture()
+        log_pipeline.stop()
         print("\n👋 시스템을 종료합니다.")
\ No newline at end of file
@@ -0,0 +1,91 @@
+import asyncio
+import json
+import os
+import time
+from config import logger, exchange
+import rate_governor
+
+
+# [마켓 메타데이터 캐시] 로컬 파일로 즉시 웜스타트 + 장주기 백그라운드 갱신
+MARKETS_FILE = "markets_cache.json"
+MARKETS_REFRESH_SEC = 6 * 3600  # 마켓 목록은 하루 1회 수준으로만 변동
+
+krw_symbols = []  # 활성 KRW 마켓 심볼 (스캔 루프가 매 주기 재구성하지 않고 그대로 참조)
+_loaded_at = 0.0
+
+
+def _apply_markets(markets, loaded_at):
+    """마켓 목록을 거래소 객체와 KRW 심볼 목록에 반영"""
+    global krw_symbols, _loaded_at
+    try:
+        # load_markets 네트워크 호출 없이 fetch_ohlcv 등이 바로 동작하도록 주입
+        exchange.set_markets(markets)
+    except Exception as e:
+        logger.error(f"Market Apply Error: {e}")
+    krw_symbols = [
+        m['symbol'] for m in markets
+        if m.get('quote') == 'KRW' and m.get('active')
+    ]
+    _loaded_at = loaded_at
+
+
+def load_markets_from_file():
+    """저장된 마켓 캐시를 불러옵니다. 성공 시 True"""
+    if not os.path.exists(MARKETS_FILE):
+        return False
+    try:
+        with open(MARKETS_FILE, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        _apply_markets(saved['markets'], float(saved.get('saved_at', 0)))
+        logger.info(f"[마켓캐시] 파일 로드: KRW {len(krw_symbols)}종목 (저장 시각: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(_loaded_at))})")
+        return True
+    except Exception as e:
+        logger.error(f"Market Cache Load Error: {e}")
+        return False
+
+
+def save_markets_to_file(markets, saved_at):
+    """임시 파일에 쓴 뒤 교체하여 중간에 끊겨도 기존 캐시가 깨지지 않도록 저장"""
+    try:
+        tmp_file = MARKETS_FILE + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump({'saved_at': saved_at, 'markets': markets}, f, default=str)
+        os.replace(tmp_file, MARKETS_FILE)
+    except Exception as e:
+        logger.error(f"Market Cache Save Error: {e}")
+
+
+async def refresh_markets():
+    """거래소에서 마켓 목록을 다시 받아 반영·저장. 실패 시 기존 목록 유지 후 False"""
+    try:
+        markets = await rate_governor.call(rate_governor.PRIORITY_SCAN, exchange.fetch_markets)
+    except Exception as e:
+        logger.error(f"Market Refresh Error: {e} (기존 KRW {len(krw_symbols)}종목 유지)")
+        return False
+    now_ts = time.time()
+    _apply_markets(markets, now_ts)
+    await asyncio.to_thread(save_markets_to_file, markets, now_ts)
+    logger.info(f"[마켓캐시] 갱신 완료: KRW {len(krw_symbols)}종목")
+    return True
+
+
+async def init_markets():
+    """시작 시 1회: 파일 캐시가 신선하면 그대로 쓰고, 없거나 오래됐으면 거래소에서 갱신"""
+    has_file = load_markets_from_file()
+    if has_file and time.time() - _loaded_at < MARKETS_REFRESH_SEC:
+        return
+    await refresh_markets()
+
+
+async def market_refresh_task():
+    """마켓 캐시 백그라운드 갱신 루프"""
+    while True:
+        wait_sec = max(60, MARKETS_REFRESH_SEC - (time.time() - _loaded_at))
+        await asyncio.sleep(wait_sec)
+        if not await refresh_markets():
+            # 실패 시 다음 장주기까지 기다리지 않고 10분 뒤 재시도
+            await asyncio.sleep(600)
+
+
+def get_krw_symbols():
+    return krw_symbols
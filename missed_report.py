@@ -0,0 +1,240 @@
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+from analyzer import normalize_reason
+
+
+# [미지 기록 분석] missed_opportunities* (현재 파일 + 백업/회전본)을 읽어 탈락 사유·등급·패턴태그별 통계를 냅니다.
+# - 파일별 병렬 파싱, 파일 안에서는 청크 단위 스트리밍 (필요 컬럼만 읽고 문자열 컬럼은 category로 압축)
+# - 이후 수익률은 같은 기록 안의 다음 가격들로 계산 (종목별로 기록 시점 + horizon 시각의 가격)
+#   반복 구간 행은 최초~마지막시간 동안 가격이 허용 오차 안에 있었으므로 그 시각을 덮는 구간의 기록가를 쓰고,
+#   덮는 구간이 없으면 horizon 이후 FORWARD_SLACK_MIN 이내에 시작한 첫 기록가 (그보다 멀면 계산 안 함)
+# - 반복 구간 행(반복횟수 N)은 건수 집계에서 N건으로 셈 (반복횟수가 없는 이전 행은 1건)
+#   사용 예: python missed_report.py --days 7 --horizon 60
+MISSED_FILE_PATTERN = "missed_opportunities*"
+CHUNK_ROWS = 200_000
+BIG_MOVE_PCT = 3.0  # 이후 수익률이 이 이상이면 '큰 움직임'으로 집계
+FORWARD_SLACK_MIN = 15  # 스캔 주기(10분) + 여유: horizon 시각과 이만큼 떨어진 기록까지만 이후 가격으로 인정
+
+# 헤더는 건너뛰고 위치 기준으로 읽음 (패턴태그 컬럼 추가 전후 행이 한 파일에 섞여 있어도 처리)
+COLUMNS = [
+    '시간', '심볼', '탈락사유', '현재가',
+    'RSI', '거래량배수', 'MA40이격도(%)', 'MA185이격도(%)',
+    'MA40값', 'MA185값', '185선기울기(%)', '골든크로스봉수', '등급',
+    '패턴태그', '기록ID', '마지막시간', '반복횟수', '마지막사유'
+]
+
+def find_missed_files(directory="."):
+    return sorted(p for p in glob.glob(os.path.join(directory, MISSED_FILE_PATTERN)) if os.path.isfile(p))
+
+
+def _to_number(series):
+    """'1,234' 같은 천 단위 콤마 문자열 → float (빈칸은 NaN)"""
+    if series.dtype == object or pd.api.types.is_string_dtype(series):
+        series = series.str.replace(',', '', regex=False)
+    return pd.to_numeric(series, errors='coerce')
+
+
+def load_file(path, since=None):
+    """
+    파일 1개를 청크로 읽어 분석용 컬럼만 남긴 DataFrame 반환 (프로세스 풀에서 호출).
+    since(pd.Timestamp)가 있으면 그 이후 기록만.
+    """
+    parts = []
+    reader = pd.read_csv(
+        path, names=COLUMNS, header=None, skiprows=1, dtype=str,
+        chunksize=CHUNK_ROWS, on_bad_lines='skip', encoding='utf-8'
+    )
+    for chunk in reader:
+        ts = pd.to_datetime(chunk['시간'], errors='coerce', format='%Y-%m-%d %H:%M:%S')
+        last_ts = pd.to_datetime(chunk['마지막시간'], errors='coerce', format='%Y-%m-%d %H:%M:%S').fillna(ts)
+        keep = ts.notna() if since is None else ts >= since
+        if not keep.any():
+            continue
+        chunk = chunk[keep]
+        # 정규화는 고유 사유마다 한 번만 (category 단위 map)
+        raw_reason = chunk['탈락사유'].astype('category')
+        mapping = {c: normalize_reason(c) for c in raw_reason.cat.categories}
+        reason = raw_reason.map(mapping).astype(object).fillna('(사유없음)').astype('category')
+        parts.append(pd.DataFrame({
+            'time': ts[keep].values,
+            'last': last_ts[keep].values,
+            'symbol': chunk['심볼'].astype('category').values,
+            'reason': reason.values,
+            'price': _to_number(chunk['현재가']).astype('float32').values,
+            'has_rsi': chunk['RSI'].notna().values,
+            'has_disparity': chunk['MA40이격도(%)'].notna().values,
+            'grade': chunk['등급'].fillna('').astype('category').values,
+            'tag': chunk['패턴태그'].fillna('').astype('category').values,
+            'weight': pd.to_numeric(chunk['반복횟수'], errors='coerce').fillna(1).astype('int32').values,
+        }))
+    return _concat(parts)
+
+
+def _concat(frames):
+    """category 컬럼을 유지한 채 이어 붙임 (카테고리 합집합)"""
+    frames = [f for f in frames if f is not None and len(f)]
+    if not frames:
+        return None
+    if len(frames) == 1:
+        return frames[0].reset_index(drop=True)
+    data = {}
+    for col in frames[0].columns:
+        if isinstance(frames[0][col].dtype, pd.CategoricalDtype):
+            data[col] = union_categoricals([f[col] for f in frames])
+        else:
+            data[col] = np.concatenate([f[col].to_numpy() for f in frames])
+    return pd.DataFrame(data)
+
+
+def load_history(paths, since=None, workers=None):
+    """여러 파일을 프로세스 풀로 동시에 파싱해 하나로 합침"""
+    if len(paths) <= 1 or workers == 1:
+        frames = [load_file(p, since) for p in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers or min(len(paths), os.cpu_count() or 1)) as pool:
+            frames = list(pool.map(load_file, paths, [since] * len(paths)))
+    return _concat(frames)
+
+
+def add_forward_returns(df, horizon_min=60, slack_min=FORWARD_SLACK_MIN):
+    """
+    종목별로 각 기록 시점 + horizon_min 시각의 가격으로 이후 수익률(%) 계산 (없으면 NaN).
+    - 그 시각을 덮는 구간(시작 ≤ 목표 ≤ 마지막시간 + slack)이 있으면 그 구간 기록가
+    - 없으면 목표 이후 slack_min 이내에 시작한 첫 기록가 (몇 시간 뒤 기록을 60분 수익률로 쓰지 않도록)
+    회전 파일 경계를 넘어도 시각 기준으로 이어서 계산
+    """
+    df = df.sort_values(['symbol', 'time'], kind='stable').reset_index(drop=True)
+    times = df['time'].to_numpy().astype('datetime64[s]').astype(np.int64)
+    lasts = df['last'].to_numpy().astype('datetime64[s]').astype(np.int64)
+    prices = df['price'].to_numpy(dtype=np.float64)
+    codes = df['symbol'].cat.codes.to_numpy()
+    fwd = np.full(len(df), np.nan)
+
+    bounds = np.flatnonzero(np.diff(codes)) + 1
+    starts = np.concatenate(([0], bounds))
+    ends = np.concatenate((bounds, [len(df)]))
+    horizon = horizon_min * 60
+    slack = slack_min * 60
+    for s, e in zip(starts, ends):
+        t, last, n = times[s:e], lasts[s:e], e - s
+        target = t + horizon
+        cover = np.searchsorted(t, target, side='right') - 1  # 목표 시각 이전에 시작한 마지막 기록
+        covered = last[cover] + slack >= target
+        nxt = np.minimum(cover + 1, n - 1)
+        near_next = (cover + 1 < n) & (t[nxt] - target <= slack)
+        j = np.where(covered, cover, nxt)
+        ok = covered | near_next
+        base = prices[s:e]
+        later = np.where(ok, base[j], np.nan)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fwd[s:e] = np.where(base > 0, (later - base) / base * 100, np.nan)
+    df['fwd_ret'] = fwd
+    return df
+
+
+def _move_stats(group):
+    """그룹별 건수(반복 포함)·이후 수익률 평균/상위10%·큰 움직임 비율 (수익률은 기록 행 단위)"""
+    stats = group['fwd_ret'].agg(['count', 'mean', lambda s: s.quantile(0.9)])
+    stats.columns = ['수익률계산', '평균수익률(%)', '상위10%수익률(%)']
+    stats.insert(0, '건수', group['weight'].sum())
+    stats[f'+{BIG_MOVE_PCT:g}%이상비율(%)'] = group['fwd_ret'].apply(
+        lambda s: (s >= BIG_MOVE_PCT).sum() / s.count() * 100 if s.count() else np.nan
+    )
+    return stats
+
+
+def reason_histogram(df):
+    return _move_stats(df.groupby('reason', observed=True)).sort_values('건수', ascending=False)
+
+
+def funnel(df, by):
+    """
+    기록 → 지표 계산(RSI) → 이격도 계산(MA 조건 근접) → 등급 부여 → 패턴태그 단계별 통과 건수.
+    by: 'symbol' 또는 'grade'
+    """
+    w = df['weight']
+    g = df.assign(
+        w_rsi=w * df['has_rsi'], w_disparity=w * df['has_disparity'],
+        w_grade=w * (df['grade'] != ''), w_tag=w * (df['tag'] != ''),
+    ).groupby(by, observed=True)
+    result = pd.DataFrame({
+        '기록': g['weight'].sum(),
+        '지표계산': g['w_rsi'].sum(),
+        '이격도계산': g['w_disparity'].sum(),
+        '등급부여': g['w_grade'].sum(),
+        '패턴태그': g['w_tag'].sum(),
+    })
+    moves = _move_stats(g)[['평균수익률(%)', f'+{BIG_MOVE_PCT:g}%이상비율(%)']]
+    return result.join(moves).sort_values('기록', ascending=False)
+
+
+def tag_stats(df):
+    """패턴태그('정배열|단기역습' 등 복수 태그는 각각 집계)별 이후 수익률"""
+    tagged = df[df['tag'] != ''][['tag', 'fwd_ret', 'weight']]
+    if tagged.empty:
+        return pd.DataFrame()
+    exploded = tagged.assign(tag=tagged['tag'].astype(str).str.split('|')).explode('tag')
+    return _move_stats(exploded.groupby('tag')).sort_values('건수', ascending=False)
+
+
+def big_move_precursors(df, top=20):
+    """이후 수익률 상위 기록들의 직전 탈락 사유 분포 ('큰 움직임 앞에 어떤 사유가 있었나')"""
+    moved = df[df['fwd_ret'] >= BIG_MOVE_PCT]
+    if moved.empty:
+        return pd.DataFrame()
+    counts = moved.groupby('reason', observed=True)['weight'].sum().rename('큰움직임건수')
+    base = df.groupby('reason', observed=True)['weight'].sum()
+    result = counts.to_frame()
+    result['사유내비중(%)'] = counts / base.reindex(counts.index) * 100
+    return result.sort_values('큰움직임건수', ascending=False).head(top)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="missed_opportunities* 기록 분석")
+    parser.add_argument('--dir', default='.', help="기록 파일 폴더")
+    parser.add_argument('--days', type=float, default=None, help="최근 N일만 (기본: 전체)")
+    parser.add_argument('--horizon', type=int, default=60, help="이후 수익률 계산 구간(분)")
+    parser.add_argument('--slack', type=int, default=FORWARD_SLACK_MIN, help="horizon 시각과 기록 시각의 허용 차이(분)")
+    parser.add_argument('--top', type=int, default=20, help="표마다 출력할 행 수")
+    parser.add_argument('--workers', type=int, default=None, help="파싱 프로세스 수")
+    args = parser.parse_args()
+
+    paths = find_missed_files(args.dir)
+    if not paths:
+        print(f"기록 파일 없음: {os.path.join(args.dir, MISSED_FILE_PATTERN)}")
+        return
+    since = pd.Timestamp.now() - pd.Timedelta(days=args.days) if args.days else None
+
+    t0 = time.perf_counter()
+    df = load_history(paths, since, args.workers)
+    if df is None:
+        print("해당 기간 기록 없음")
+        return
+    df = add_forward_returns(df, args.horizon, args.slack)
+    elapsed = time.perf_counter() - t0
+
+    pd.set_option('display.width', 200)
+    pd.set_option('display.max_colwidth', 60)
+    pd.set_option('display.float_format', '{:.2f}'.format)
+    print(f"📂 파일 {len(paths)}개 | 기록 {len(df):,}행 (반복 포함 {df['weight'].sum():,}건) | 종목 {df['symbol'].nunique()}개 | "
+          f"{df['time'].min()} ~ {df['time'].max()} | 로드 {elapsed:.2f}초 | 이후수익률 {args.horizon}분")
+    sections = [
+        ("탈락 사유 분포", reason_histogram(df)),
+        (f"큰 움직임(+{BIG_MOVE_PCT:g}%) 직전 사유", big_move_precursors(df, args.top)),
+        ("등급별 퍼널", funnel(df, 'grade')),
+        ("종목별 퍼널", funnel(df, 'symbol')),
+        ("패턴태그", tag_stats(df)),
+    ]
+    for title, table in sections:
+        print(f"\n===== {title} =====")
+        print(table.head(args.top).to_string() if len(table) else "(없음)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import asyncio
+import math
+import os
+import socket
+import sqlite3
+import time
+import uuid
+import zlib
+from config import logger
+
+
+# [멀티 노드 조정] 공유 로컬 DB 파일의 리스(lease)로 종목 샤드를 노드별로 나눠 맡습니다.
+# - 노드는 HEARTBEAT_SEC마다 하트비트 + 보유 리스 연장, 죽은 노드의 샤드는 LEASE_TTL_SEC 후 다른 노드가 인수
+# - 주문은 종목별 주문 락으로 단일 작성자 보장 (획득마다 토큰 발급, 같은 노드 안에서도 재진입 불가)
+COORDINATION_ENABLED = False  # False면 단일 노드: 모든 종목 소유, 락은 항상 성공
+LEASE_DB_FILE = "bot_leases.db"
+NUM_SHARDS = 16
+HEARTBEAT_SEC = 2
+LEASE_TTL_SEC = 6
+ORDER_LOCK_TTL_SEC = 60
+
+NODE_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+owned_shards = frozenset()
+_owned_until = 0.0  # 마지막으로 리스를 연장한 만료 시각 (DB 접근 실패가 이어지면 이후 소유권 상실로 간주)
+
+
+def _connect():
+    conn = sqlite3.connect(LEASE_DB_FILE, timeout=5, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS nodes (node_id TEXT PRIMARY KEY, heartbeat REAL)")
+    conn.execute("CREATE TABLE IF NOT EXISTS shard_leases (shard INTEGER PRIMARY KEY, node_id TEXT, expires REAL)")
+    conn.execute("CREATE TABLE IF NOT EXISTS order_locks (symbol TEXT PRIMARY KEY, node_id TEXT, expires REAL, token TEXT)")
+    if 'token' not in {row[1] for row in conn.execute("PRAGMA table_info(order_locks)")}:
+        conn.execute("ALTER TABLE order_locks ADD COLUMN token TEXT")  # 토큰 컬럼 추가 전에 만든 DB
+    return conn
+
+
+def shard_of(symbol):
+    return zlib.crc32(symbol.encode()) % NUM_SHARDS
+
+
+def heartbeat():
+    """
+    하트비트 1회 (블로킹 - 스레드에서 호출).
+    내 리스 연장 → 만료된 노드/리스 정리 → 공정 몫(ceil(샤드수/생존노드수))까지 빈 샤드 획득, 초과분은 반납.
+    """
+    global owned_shards, _owned_until
+    now = time.time()
+    expires = now + LEASE_TTL_SEC
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("INSERT OR REPLACE INTO nodes (node_id, heartbeat) VALUES (?, ?)", (NODE_ID, now))
+        conn.execute("DELETE FROM nodes WHERE heartbeat < ?", (now - LEASE_TTL_SEC,))
+        conn.execute("DELETE FROM shard_leases WHERE expires < ?", (now,))
+        conn.execute("UPDATE shard_leases SET expires = ? WHERE node_id = ?", (expires, NODE_ID))
+
+        live_nodes = conn.execute("SELECT COUNT(*) FROM nodes").fetchone()[0]
+        fair_share = math.ceil(NUM_SHARDS / max(1, live_nodes))
+        mine = [row[0] for row in conn.execute("SELECT shard FROM shard_leases WHERE node_id = ? ORDER BY shard", (NODE_ID,))]
+
+        if len(mine) > fair_share:
+            # 새 노드 합류 시 초과분 반납 → 다음 하트비트에 해당 노드가 가져감
+            for shard in mine[fair_share:]:
+                conn.execute("DELETE FROM shard_leases WHERE shard = ? AND node_id = ?", (shard, NODE_ID))
+            mine = mine[:fair_share]
+        elif len(mine) < fair_share:
+            taken = {row[0] for row in conn.execute("SELECT shard FROM shard_leases")}
+            for shard in range(NUM_SHARDS):
+                if len(mine) >= fair_share:
+                    break
+                if shard not in taken:
+                    conn.execute("INSERT INTO shard_leases (shard, node_id, expires) VALUES (?, ?, ?)", (shard, NODE_ID, expires))
+                    mine.append(shard)
+        conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+    if set(mine) != set(owned_shards):
+        logger.info(f"[노드리스] {NODE_ID} 샤드 변경: {sorted(mine)} (생존 노드 {live_nodes})")
+    owned_shards = frozenset(mine)
+    _owned_until = expires
+
+
+def release_all():
+    """종료 시 보유 리스/노드 정보 즉시 반납 (다른 노드가 TTL을 기다리지 않고 인수)"""
+    global owned_shards
+    conn = _connect()
+    try:
+        conn.execute("DELETE FROM shard_leases WHERE node_id = ?", (NODE_ID,))
+        conn.execute("DELETE FROM order_locks WHERE node_id = ?", (NODE_ID,))
+        conn.execute("DELETE FROM nodes WHERE node_id = ?", (NODE_ID,))
+    finally:
+        conn.close()
+    owned_shards = frozenset()
+
+
+def owns_symbol(symbol):
+    """이 노드가 해당 종목을 스캔/감시/주문할 차례인지"""
+    if not COORDINATION_ENABLED:
+        return True
+    if time.time() > _owned_until:
+        return False  # 리스 연장 실패 상태: 다른 노드가 인수했을 수 있으므로 손을 뗌
+    return shard_of(symbol) in owned_shards
+
+
+def try_acquire_order_lock(symbol):
+    """
+    종목별 주문 락 획득 (블로킹). Returns: 해제용 토큰, 유효한 락이 이미 있으면(같은 노드 포함) None.
+    조정 비활성이면 항상 'local'
+    """
+    if not COORDINATION_ENABLED:
+        return 'local'
+    now = time.time()
+    token = uuid.uuid4().hex
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DELETE FROM order_locks WHERE symbol = ? AND expires < ?", (symbol, now))
+        if conn.execute("SELECT 1 FROM order_locks WHERE symbol = ?", (symbol,)).fetchone():
+            conn.execute("COMMIT")
+            return None
+        conn.execute("INSERT INTO order_locks (symbol, node_id, expires, token) VALUES (?, ?, ?, ?)",
+                     (symbol, NODE_ID, now + ORDER_LOCK_TTL_SEC, token))
+        conn.execute("COMMIT")
+        return token
+    except Exception as e:
+        logger.error(f"Order Lock Error ({symbol}): {e}")
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        return None
+    finally:
+        conn.close()
+
+
+def release_order_lock(symbol, token):
+    """획득 때 받은 토큰이 일치하는 락만 해제 (만료 후 다른 호출자가 잡은 락은 건드리지 않음)"""
+    if not COORDINATION_ENABLED:
+        return
+    conn = _connect()
+    try:
+        conn.execute("DELETE FROM order_locks WHERE symbol = ? AND token = ?", (symbol, token))
+    except Exception as e:
+        logger.error(f"Order Unlock Error ({symbol}): {e}")
+    finally:
+        conn.close()
+
+
+async def heartbeat_task():
+    """리스 하트비트 루프 (조정 비활성 시 즉시 종료)"""
+    if not COORDINATION_ENABLED:
+        return
+    while True:
+        try:
+            await asyncio.to_thread(heartbeat)
+        except Exception as e:
+            logger.error(f"Lease Heartbeat Error: {e}")
+        await asyncio.sleep(HEARTBEAT_SEC)
@@ -0,0 +1,232 @@
+import asyncio
+import json
+import time
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from config import logger, exchange
+import position_ledger
+import rate_governor
+
+
+# [로컬 호가 미러] 보유(감시) 종목의 L2 호가를 메모리에 유지해 손절 순간 REST 호가 조회 없이 깊이 판단
+# - 주기적 스냅샷(시퀀스 검사로 역순/중복 무시) 또는 델타(연속 시퀀스만 반영, 끊기면 재동기화) 갱신
+# - 양쪽 호가를 가격 오름차순 배열로 보관하고, 누적 수량·누적 금액 배열로 조회를 이분탐색 한 번에 처리
+BOOK_SYNC_SEC = 1.0  # 감시 종목 스냅샷 주기
+BOOK_DEPTH = 30
+BOOK_STALE_SEC = 3.0  # 마지막 갱신 후 이 시간이 지나면 미러를 신뢰하지 않음 (REST 조회로 대체)
+BOOK_RECORD_FILE = None  # 경로를 지정하면 수신한 스냅샷을 JSONL로 기록 (replay로 재생)
+
+books = {}  # symbol -> L2Book
+watched = frozenset()
+
+
+class L2Book:
+    """
+    종목 1개의 L2 호가.
+    - 매수/매도 호가 모두 가격 오름차순 리스트 (bids는 끝이 최우선, asks는 처음이 최우선)
+    - 조회용 누적 배열은 변경 후 첫 조회 때 한 번만 다시 계산
+    """
+    __slots__ = ('symbol', 'seq', 'updated_at', 'stale',
+                 '_bid_px', '_bid_qty', '_ask_px', '_ask_qty', '_cum')
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.seq = None
+        self.updated_at = 0.0
+        self.stale = True
+        self._bid_px, self._bid_qty = [], []
+        self._ask_px, self._ask_qty = [], []
+        self._cum = None
+
+    @classmethod
+    def from_snapshot(cls, symbol, snapshot):
+        book = cls(symbol)
+        book.apply_snapshot(snapshot)
+        return book
+
+    def apply_snapshot(self, snapshot):
+        """
+        ccxt fetch_order_book 형식 스냅샷으로 전체 교체.
+        nonce(없으면 timestamp)가 현재 시퀀스 이하이면 늦게 도착한 응답으로 보고 무시. 반영 여부 반환
+        """
+        seq = snapshot.get('nonce') or snapshot.get('timestamp')
+        if seq is not None and self.seq is not None and not self.stale and seq <= self.seq:
+            return False
+        bids = sorted((float(p), float(q)) for p, q, *_ in snapshot.get('bids') or [] if float(q) > 0)
+        asks = sorted((float(p), float(q)) for p, q, *_ in snapshot.get('asks') or [] if float(q) > 0)
+        self._bid_px, self._bid_qty = [p for p, _ in bids], [q for _, q in bids]
+        self._ask_px, self._ask_qty = [p for p, _ in asks], [q for _, q in asks]
+        self.seq = seq
+        self.updated_at = time.time()
+        self.stale = False
+        self._cum = None
+        return True
+
+    def apply_delta(self, seq, side, price, qty):
+        """
+        스트림 델타 1건 반영 (qty 0이면 해당 가격 삭제).
+        시퀀스가 연속이 아니면 미러를 stale로 표시하고 False → 다음 스냅샷으로 재동기화
+        """
+        if self.stale or self.seq is None or seq != self.seq + 1:
+            self.stale = True
+            return False
+        px, qtys = (self._bid_px, self._bid_qty) if side == 'bid' else (self._ask_px, self._ask_qty)
+        i = bisect_left(px, price)
+        if i < len(px) and px[i] == price:
+            if qty > 0:
+                qtys[i] = qty
+            else:
+                del px[i], qtys[i]
+        elif qty > 0:
+            px.insert(i, price)
+            qtys.insert(i, qty)
+        self.seq = seq
+        self.updated_at = time.time()
+        self._cum = None
+        return True
+
+    def is_fresh(self, max_age=BOOK_STALE_SEC):
+        return not self.stale and time.time() - self.updated_at <= max_age
+
+    def best_bid(self):
+        return self._bid_px[-1] if self._bid_px else None
+
+    def best_ask(self):
+        return self._ask_px[0] if self._ask_px else None
+
+    def mid_price(self):
+        bid, ask = self.best_bid(), self.best_ask()
+        return (bid + ask) / 2 if bid and ask else bid or ask
+
+    def _cumulative(self):
+        """
+        최우선호가부터의 (가격, 탐색키, 누적수량, 누적금액) — 매도 체결은 bids를, 매수 체결은 asks를 소진.
+        탐색키는 최우선에서 멀어질수록 커지도록 (매도는 가격 부호 반전) 만들어 bisect로 바로 찾음
+        """
+        if self._cum is None:
+            bid_px = self._bid_px[::-1]
+            bid_qty = self._bid_qty[::-1]
+            self._cum = {
+                'sell': (bid_px, [-p for p in bid_px], list(accumulate(bid_qty)),
+                         list(accumulate(p * q for p, q in zip(bid_px, bid_qty)))),
+                'buy': (self._ask_px, self._ask_px, list(accumulate(self._ask_qty)),
+                        list(accumulate(p * q for p, q in zip(self._ask_px, self._ask_qty)))),
+            }
+        return self._cum
+
+    def depth_to_price(self, side, price):
+        """side('sell'|'buy') 주문이 price까지(포함) 소진할 수 있는 누적 수량"""
+        _, keys, cum_qty, _ = self._cumulative()[side]
+        n = bisect_right(keys, -price if side == 'sell' else price)
+        return cum_qty[n - 1] if n else 0.0
+
+    def vwap_for_qty(self, side, qty):
+        """
+        qty를 시장가로 체결할 때 (예상 평균가, 최우선호가, 예상 슬리피지 %). 매도는 음수일수록 불리.
+        호가 깊이를 넘는 수량은 마지막 호가에 체결된다고 가정. 호가가 비었으면 None
+        """
+        px, _, cum_qty, cum_cost = self._cumulative()[side]
+        if not px or not qty or qty <= 0:
+            return None
+        i = bisect_left(cum_qty, qty)
+        if i >= len(px):
+            cost = cum_cost[-1] + (qty - cum_qty[-1]) * px[-1]
+        else:
+            prev_qty = cum_qty[i - 1] if i else 0.0
+            prev_cost = cum_cost[i - 1] if i else 0.0
+            cost = prev_cost + (qty - prev_qty) * px[i]
+        avg = cost / qty
+        return avg, px[0], (avg - px[0]) / px[0] * 100
+
+    def max_qty_within_impact(self, side, threshold_pct):
+        """예상 슬리피지가 threshold_pct 이내로 유지되는 최대 수량"""
+        px, _, cum_qty, cum_cost = self._cumulative()[side]
+        if not px:
+            return 0.0
+        limit = px[0] * (1 - threshold_pct / 100) if side == 'sell' else px[0] * (1 + threshold_pct / 100)
+        for i in range(1, len(px)):
+            avg = cum_cost[i] / cum_qty[i]
+            if (side == 'sell' and avg < limit) or (side == 'buy' and avg > limit):
+                # 이 호가 일부만 먹어 평균가가 정확히 한도에 닿는 수량
+                return cum_qty[i - 1] + max(0.0, (cum_cost[i - 1] - limit * cum_qty[i - 1]) / (limit - px[i]))
+        return cum_qty[-1]
+
+
+def set_watched(symbols):
+    """미러를 유지할 종목 지정 (빠진 종목의 미러는 정리)"""
+    global watched
+    watched = frozenset(symbols)
+    for symbol in list(books):
+        if symbol not in watched:
+            del books[symbol]
+
+
+def get_book(symbol, max_age=BOOK_STALE_SEC):
+    """신뢰할 수 있는 로컬 미러가 있으면 반환, 없으면 None"""
+    book = books.get(symbol)
+    return book if book and book.is_fresh(max_age) else None
+
+
+def apply_snapshot(symbol, snapshot):
+    book = books.get(symbol)
+    if book is None:
+        book = books[symbol] = L2Book(symbol)
+    applied = book.apply_snapshot(snapshot)
+    if applied:
+        position_ledger.update_price(symbol, book.mid_price())  # [포지션장부] 평가손익 틱 갱신
+    return applied
+
+
+def _record(symbol, snapshot):
+    try:
+        with open(BOOK_RECORD_FILE, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'symbol': symbol, 'type': 'snapshot', 'data': {
+                k: snapshot.get(k) for k in ('bids', 'asks', 'nonce', 'timestamp')
+            }}) + '\n')
+    except Exception as e:
+        logger.error(f"Book Record Error ({symbol}): {e}")
+
+
+def replay(path, on_update=None):
+    """
+    기록된 호가 업데이트(JSONL)를 순서대로 재생해 미러를 재구성합니다.
+    한 줄: {"symbol", "type": "snapshot", "data": {...}} 또는 {"symbol", "type": "delta", "seq", "side", "price", "qty"}
+    on_update(book, applied)가 있으면 매 줄마다 호출. Returns: {symbol: L2Book}
+    """
+    replayed = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            msg = json.loads(line)
+            book = replayed.get(msg['symbol'])
+            if book is None:
+                book = replayed[msg['symbol']] = L2Book(msg['symbol'])
+            if msg['type'] == 'snapshot':
+                applied = book.apply_snapshot(msg['data'])
+            else:
+                applied = book.apply_delta(msg['seq'], msg['side'], float(msg['price']), float(msg['qty']))
+            if on_update:
+                on_update(book, applied)
+    return replayed
+
+
+async def book_sync_task():
+    """감시 종목 호가 스냅샷 동기화 루프 (종목별 조회는 동시에)"""
+    while True:
+        try:
+            symbols = list(watched)
+            if symbols:
+                results = await asyncio.gather(
+                    *(rate_governor.call(rate_governor.PRIORITY_MONITOR, exchange.fetch_order_book, s, BOOK_DEPTH) for s in symbols),
+                    return_exceptions=True
+                )
+                for symbol, snapshot in zip(symbols, results):
+                    if isinstance(snapshot, Exception):
+                        logger.warning(f"[호가미러] {symbol} 스냅샷 실패: {snapshot}")
+                        continue
+                    if symbol in watched and apply_snapshot(symbol, snapshot) and BOOK_RECORD_FILE:
+                        _record(symbol, snapshot)
+        except Exception as e:
+            logger.error(f"Book Sync Error: {e}")
+        await asyncio.sleep(BOOK_SYNC_SEC)
@@ -0,0 +1,365 @@
+import asyncio
+import itertools
+import time
+from config import logger, exchange
+import analyzer
+import node_lease
+import order_book
+import position_ledger
+import rate_governor
+
+
+# [주문 엔진] 모든 주문을 큐로 받아 종목별 직렬화 + 종목 간 동시 집행, 체결은 주기 폴링(회차별 fetch_order 동시 호출)으로 확인
+# 주문 상태: QUEUED → SUBMITTED → FILLED | UNCONFIRMED(시간 내 체결 확인 실패) | CANCELED, 또는 FAILED
+ORDER_WORKERS = 8  # 동시에 집행할 수 있는 종목 수 (야간 일괄 청산 병렬도)
+FILL_POLL_SEC = 1.0
+FILL_TIMEOUT_SEC = 30
+BALANCE_TTL_SEC = 2.0  # 잔고 스냅샷 공유 시간 (동시 청산 시 fetch_balance 1회로 처리)
+INTENT_HOLD_SEC = 60  # 같은 의도(예: 종목 전량 청산) 재요청을 체결 후에도 이 시간 동안 기존 주문으로 돌려줌
+ORDER_KEEP_SEC = 3600  # 완료 주문 기록 보관 시간
+
+# [호가 기반 분할] 최근 호가(로컬 미러 우선)로 예상 체결가를 계산해 충격이 크면 여러 번에 나눠 집행
+ORDERBOOK_TTL_SEC = 1.0  # 이 시간 내 받아 둔 호가는 재사용
+ORDERBOOK_DEPTH = 30
+IMPACT_THRESHOLD_PCT = 1.0  # 최우선호가 대비 예상 평균 체결가 괴리가 이보다 크면 분할
+MAX_SLICES = 5  # 분할 상한 (마지막 회차는 잔량 전부)
+SLICE_GAP_SEC = 1.0  # 분할 간격 (호가 회복 대기 후 재조회)
+
+_orders = {}  # client_id -> 주문 dict
+_intents = {}  # intent 키 -> client_id (중복 주문 방지)
+_symbol_locks = {}
+_seq = itertools.count(1)
+_queue = None
+
+_balance = None
+_balance_at = 0.0
+_stale_bases = set()  # 주문 후 잔고가 바뀐 코인 → 다음 조회 시 스냅샷 재조회
+_balance_lock = None
+
+_books = {}  # symbol -> (조회 시각, 호가)
+
+_ACTIVE = ('QUEUED', 'SUBMITTED')
+
+
+def _ensure_started():
+    global _queue, _balance_lock
+    if _queue is not None:
+        return
+    _queue = asyncio.Queue()
+    _balance_lock = asyncio.Lock()
+    for _ in range(ORDER_WORKERS):
+        asyncio.create_task(_order_worker())
+    asyncio.create_task(_fill_poller())
+
+
+def _new_client_id():
+    return f"mct{int(time.time() * 1000)}{next(_seq) % 10000:04d}"
+
+
+def _resolve(future, value):
+    if not future.done():
+        future.set_result(value)
+
+
+def _finish(order, status, error=None):
+    order['status'] = status
+    order['done_at'] = time.time()
+    if error:
+        order['error'] = str(error)
+    if status in ('FILLED', 'UNCONFIRMED', 'CANCELED') and order['filled']:
+        analyzer.record_trade(order)
+        position_ledger.apply_fill(order)
+    _resolve(order['acked'], order)
+    _resolve(order['finished'], order)
+
+
+def _apply_exchange_result(order, leg, res):
+    """create_order/fetch_order 응답을 분할 주문 1건(leg)에 반영하고 주문 전체 체결 수량·평균가를 재계산. 전 회차 체결이면 True"""
+    if res:
+        filled = res.get('filled')
+        average = res.get('average') or res.get('price')
+        if filled:
+            leg['filled'] = float(filled)
+        if average and (filled or res.get('status') == 'closed'):
+            leg['average'] = float(average)
+        leg['closed'] = res.get('status') == 'closed'
+
+    filled_legs = [l for l in order['legs'] if l['filled'] and l['average']]
+    total = sum(l['filled'] for l in filled_legs)
+    if total:
+        order['filled'] = total
+        order['average'] = sum(l['filled'] * l['average'] for l in filled_legs) / total
+    return all(l['closed'] for l in order['legs'])
+
+
+async def get_orderbook(symbol, refresh=False):
+    """
+    집행 판단용 호가 (L2Book). 감시 종목은 로컬 미러를 그대로 쓰고,
+    미러가 없거나 오래됐으면 REST 스냅샷(ORDERBOOK_TTL_SEC 내 조회분 재사용). 조회 실패 시 None
+    """
+    if not refresh:
+        book = order_book.get_book(symbol)
+        if book:
+            return book
+        cached = _books.get(symbol)
+        if cached and time.time() - cached[0] <= ORDERBOOK_TTL_SEC:
+            return cached[1]
+    try:
+        snapshot = await rate_governor.call(rate_governor.PRIORITY_ORDER, exchange.fetch_order_book, symbol, ORDERBOOK_DEPTH)
+    except Exception as e:
+        logger.warning(f"[주문엔진] {symbol} 호가 조회 실패: {e}")
+        return None
+    if symbol in order_book.watched:
+        order_book.apply_snapshot(symbol, snapshot)
+    book = order_book.L2Book.from_snapshot(symbol, snapshot)
+    _books[symbol] = (time.time(), book)
+    return book
+
+
+def update_balance(balance):
+    """다른 경로(보유 자산 조회 등)에서 받은 fetch_balance 결과로 스냅샷 갱신 (고속 매수용 사전 준비)"""
+    global _balance, _balance_at
+    # 조회 결과는 동시 호출자와 공유될 수 있으므로 주문 시 차감하는 free만 복사해 보관
+    _balance = {**balance, 'free': dict(balance.get('free') or {})}
+    _balance_at = time.time()
+    _stale_bases.clear()
+
+
+async def get_free_balance(base):
+    """코인 가용 수량. 잔고 스냅샷을 여러 주문이 공유하고, 주문이 나간 코인만 재조회 대상으로 표시"""
+    _ensure_started()
+    async with _balance_lock:
+        if _balance is None or base in _stale_bases or time.time() - _balance_at > BALANCE_TTL_SEC:
+            update_balance(await rate_governor.call(rate_governor.PRIORITY_ORDER, exchange.fetch_balance))
+        return float(_balance['free'].get(base, 0) or 0)
+
+
+def cached_free_balance(base):
+    """
+    API 호출 없이 마지막 스냅샷의 가용 수량 (스냅샷이 없으면 None).
+    엔진이 낸 매수 금액은 즉시 차감해 두므로 같은 스냅샷으로 연속 매수해도 초과 주문하지 않음
+    """
+    if _balance is None:
+        return None
+    return float(_balance['free'].get(base, 0) or 0)
+
+
+async def submit(symbol, side, amount=None, reason="", intent=None, params=None, fast=False):
+    """
+    주문을 큐에 등록하고 주문 dict를 즉시 반환합니다. (집행 결과는 wait_ack / wait_fill로 대기)
+    - amount=None인 매도: 집행 시점 가용 수량 전량, amount가 있으면 min(amount, 가용 수량)
+    - intent: 같은 의도 키로 진행 중(또는 INTENT_HOLD_SEC 내 체결)인 주문이 있으면 새 주문 없이 그 주문을 반환
+    - fast: 집행 전 REST 호가 조회 생략 (로컬 호가 미러가 있을 때만 충격 추정) → 주문까지 API 왕복 1회
+    """
+    _ensure_started()
+    if intent:
+        prev = _orders.get(_intents.get(intent))
+        if prev and (prev['status'] in _ACTIVE or
+                     (prev['status'] in ('FILLED', 'UNCONFIRMED') and time.time() - prev['done_at'] < INTENT_HOLD_SEC)):
+            logger.info(f"[주문엔진] 중복 주문 차단: {intent} → 기존 주문 {prev['client_id']}({prev['status']})")
+            return prev
+
+    loop = asyncio.get_running_loop()
+    client_id = _new_client_id()
+    order = {
+        'client_id': client_id,
+        'symbol': symbol,
+        'side': side,
+        'amount': amount,
+        'params': params or {},
+        'reason': reason,
+        'intent': intent,
+        'fast': fast,
+        'status': 'QUEUED',
+        'exchange_id': None,
+        'legs': [],  # 분할 회차별 {'id', 'amount', 'filled', 'average', 'closed'}
+        'filled': 0.0,
+        'average': None,
+        'ref_price': None,  # 집행 직전 최우선호가
+        'est_price': None,  # 호가 기반 예상 평균 체결가
+        'est_slippage_pct': None,
+        'error': None,
+        'created_at': time.time(),
+        'sent_at': None,  # 첫 create_order 호출 직전
+        'submitted_at': None,  # 첫 create_order 응답 수신
+        'done_at': None,
+        'acked': loop.create_future(),
+        'finished': loop.create_future(),
+    }
+    _orders[client_id] = order
+    if intent:
+        _intents[intent] = client_id
+    _queue.put_nowait(client_id)
+    return order
+
+
+async def wait_ack(order):
+    """거래소 접수(SUBMITTED/FILLED) 또는 실패(FAILED)까지 대기"""
+    return await asyncio.shield(order['acked'])
+
+
+async def wait_fill(order, timeout=None):
+    """체결 확정까지 대기. timeout이 지나면 그 시점 주문 상태 그대로 반환"""
+    try:
+        return await asyncio.wait_for(asyncio.shield(order['finished']), timeout)
+    except asyncio.TimeoutError:
+        return order
+
+
+async def exit_position(symbol, reason, max_qty=None):
+    """종목 전량(또는 max_qty 한도) 시장가 청산. 종목당 동시에 1건만 나가도록 intent로 묶고 접수까지 대기"""
+    order = await submit(symbol, 'sell', max_qty, reason=reason, intent=f"exit:{symbol}")
+    return await wait_ack(order)
+
+
+def is_accepted(order):
+    return order is not None and order['status'] in ('SUBMITTED', 'FILLED', 'UNCONFIRMED')
+
+
+def realized_slippage_pct(order):
+    """집행 직전 최우선호가 대비 실제 평균 체결가 괴리 % (예상 슬리피지와 같은 부호). 미확인 시 None"""
+    if not order or not order['ref_price'] or not order['average']:
+        return None
+    return (order['average'] - order['ref_price']) / order['ref_price'] * 100
+
+
+async def _order_worker():
+    while True:
+        client_id = await _queue.get()
+        order = _orders.get(client_id)
+        try:
+            if order:
+                await _execute(order)
+        except Exception as e:
+            logger.error(f"[주문엔진] {order['symbol']} {order['side']} 집행 오류: {e}")
+            _finish(order, 'FAILED', e)
+        finally:
+            _queue.task_done()
+
+
+async def _execute(order):
+    symbol, side = order['symbol'], order['side']
+    base = symbol.split('/')[0]
+    lock = _symbol_locks.setdefault(symbol, asyncio.Lock())
+    async with lock:
+        # [멀티 노드] 종목별 단일 주문자 보장
+        lock_token = await asyncio.to_thread(node_lease.try_acquire_order_lock, symbol)
+        if lock_token is None:
+            _finish(order, 'FAILED', "다른 노드에서 주문 진행 중")
+            return
+        try:
+            amount = order['amount']
+            if side == 'sell':
+                free_qty = await get_free_balance(base)
+                amount = free_qty if amount is None else min(float(amount), free_qty)
+                if amount <= 0:
+                    _finish(order, 'FAILED', "잔고 없음")
+                    return
+            order['amount'] = amount
+
+            remaining = amount
+            while remaining > 0:
+                if order['fast'] and not order['legs']:
+                    book = order_book.get_book(symbol)
+                else:
+                    book = await get_orderbook(symbol, refresh=bool(order['legs']))
+                est = book.vwap_for_qty(side, remaining) if book else None
+                if est and not order['legs']:
+                    order['est_price'], order['ref_price'], order['est_slippage_pct'] = est
+                qty = remaining
+                if est and abs(est[2]) > IMPACT_THRESHOLD_PCT and len(order['legs']) < MAX_SLICES - 1:
+                    # 한도 내 수량만 먼저 집행하되, 남은 회차 안에 끝나도록 최소 분량 보장
+                    qty = min(remaining, max(book.max_qty_within_impact(side, IMPACT_THRESHOLD_PCT),
+                                             remaining / (MAX_SLICES - len(order['legs']))))
+
+                params = dict(order['params'])
+                if 'cost' in params:
+                    params['cost'] = params['cost'] * qty / amount
+                order['sent_at'] = order['sent_at'] or time.time()
+                try:
+                    res = await rate_governor.call(rate_governor.PRIORITY_ORDER, exchange.create_order, symbol, 'market', side, qty, None, params)
+                except Exception as e:
+                    if not order['legs']:
+                        raise
+                    # 앞 회차는 이미 거래소에 접수됨 → 실패로 끝내지 않고 접수분을 체결 폴링에 넘김
+                    logger.error(f"[주문엔진] {symbol} {side} 분할 {len(order['legs']) + 1}회차 주문 오류: {e}")
+                    order['error'] = f"분할 {len(order['legs']) + 1}회차 주문 오류: {e}"
+                    break
+                finally:
+                    _stale_bases.update(symbol.split('/'))  # 매수/매도 모두 코인·원화 잔고가 바뀜
+                if not res or not res.get('id'):
+                    if not order['legs']:
+                        _finish(order, 'FAILED', f"응답 없음: {res}")
+                        return
+                    order['error'] = f"분할 {len(order['legs']) + 1}회차 응답 없음: {res}"
+                    break
+
+                if side == 'buy' and _balance is not None and 'cost' in params:
+                    quote = symbol.split('/')[1]
+                    _balance['free'][quote] = float(_balance['free'].get(quote, 0) or 0) - params['cost']
+                leg = {'id': res['id'], 'amount': qty, 'filled': 0.0, 'average': None, 'closed': False}
+                order['legs'].append(leg)
+                order['exchange_id'] = order['exchange_id'] or res['id']
+                order['submitted_at'] = order['submitted_at'] or time.time()
+                order['status'] = 'SUBMITTED'
+                _apply_exchange_result(order, leg, res)
+                remaining -= qty
+                logger.info(f"[주문엔진] {symbol} {side} 접수 | 수량: {qty} | cid: {order['client_id']} | id: {res['id']} | {order['reason']}"
+                            + (f" | 분할 {len(order['legs'])}회차 (잔량 {remaining:g})" if len(order['legs']) > 1 or remaining > 0 else ""),
+                            extra={'fields': {'symbol': symbol, 'side': side, 'qty': qty, 'client_id': order['client_id'],
+                                              'exchange_id': res['id'], 'leg': len(order['legs'])}})
+                if remaining > 0:
+                    await asyncio.sleep(SLICE_GAP_SEC)
+
+            if order['est_slippage_pct'] is not None:
+                logger.info(f"[주문엔진] {symbol} 예상 슬리피지: {order['est_slippage_pct']:.2f}% | 분할: {len(order['legs'])}회")
+            if _apply_exchange_result(order, order['legs'][-1], None):
+                _finish(order, 'FILLED')
+            else:
+                _resolve(order['acked'], order)
+        finally:
+            await asyncio.to_thread(node_lease.release_order_lock, symbol, lock_token)
+
+
+async def _fill_poller():
+    """접수된 주문의 체결을 주기마다 모아 조회 (거래소 일괄 조회 API가 아니라 미체결 회차마다 fetch_order 1회를 동시 호출)"""
+    while True:
+        await asyncio.sleep(FILL_POLL_SEC)
+        try:
+            now = time.time()
+            # 분할 집행 중(acked 전)인 주문은 집행 워커가 마무리하므로 접수 완료된 주문만 조회
+            pending = [(o, leg) for o in _orders.values() if o['status'] == 'SUBMITTED' and o['acked'].done()
+                       for leg in o['legs'] if not leg['closed']]
+            if pending:
+                results = await asyncio.gather(
+                    *(rate_governor.call(rate_governor.PRIORITY_ORDER, exchange.fetch_order, leg['id'], o['symbol']) for o, leg in pending),
+                    return_exceptions=True
+                )
+                last_error = {}
+                for (order, leg), res in zip(pending, results):
+                    if isinstance(res, Exception):
+                        last_error[order['client_id']] = res
+                    elif res.get('status') in ('canceled', 'rejected', 'expired'):
+                        leg['closed'] = True  # 취소된 회차는 체결분만 반영하고 종료 처리
+                        _apply_exchange_result(order, leg, None)
+                        order['error'] = res.get('status')
+                    else:
+                        _apply_exchange_result(order, leg, res)
+
+                for order in {id(o): o for o, _ in pending}.values():
+                    if order['status'] != 'SUBMITTED':
+                        continue
+                    if all(leg['closed'] for leg in order['legs']):
+                        _finish(order, 'FILLED' if order['filled'] else 'CANCELED')
+                    elif now - order['submitted_at'] > FILL_TIMEOUT_SEC:
+                        logger.error(f"[주문엔진] {order['symbol']} 체결 확인 실패 ({FILL_TIMEOUT_SEC}초): {last_error.get(order['client_id'], 'open')}")
+                        _finish(order, 'UNCONFIRMED')
+
+            # 오래된 완료 주문 정리
+            for client_id, order in list(_orders.items()):
+                if order['done_at'] and now - order['done_at'] > ORDER_KEEP_SEC:
+                    del _orders[client_id]
+                    if order['intent'] and _intents.get(order['intent']) == client_id:
+                        del _intents[order['intent']]
+        except Exception as e:
+            logger.error(f"[주문엔진] 체결 폴링 오류: {e}")
@@ -0,0 +1,117 @@
+import asyncio
+import heapq
+import time
+from datetime import datetime
+from config import logger, exchange
+import analyzer
+import rate_governor
+
+
+# [사후 수익률 추적] 미지 기록마다 (만기 시각) 힙에 등록 → 만기 정각에 깨어나 같은 시점 만기분을 티커 일괄 조회 1회로 처리
+# 같은 종목이 60분 안에 다시 기록돼도 기록 ID별로 따로 추적 (덮어쓰기 없음)
+OUTCOME_HORIZON_SEC = 3600
+BATCH_WINDOW_SEC = 1.0  # 가장 이른 만기 뒤 이 간격 안에 만기되는 건은 그중 마지막 만기까지 기다려 한 번에 조회 (만기 전 조회 없음)
+RETRY_SEC = 10  # 티커 조회 실패 시 재시도 간격
+MAX_RETRIES = 3
+
+_heap = []  # (만기 ts, 순번, record_id, symbol, 기록 ts, 기록가, 재시도 횟수)
+_seq = 0
+_wakeup = None
+
+
+def _push(due_ts, record_id, symbol, recorded_ts, price, retries=0):
+    global _seq
+    _seq += 1
+    heapq.heappush(_heap, (due_ts, _seq, record_id, symbol, recorded_ts, price, retries))
+    if _wakeup is not None and _heap[0][1] == _seq:
+        _wakeup.set()  # 가장 이른 만기가 바뀌었으면 대기 중인 루프를 깨움
+
+
+def schedule(record_id, symbol, price, recorded_ts=None, horizon_sec=OUTCOME_HORIZON_SEC):
+    """미지 기록 1건의 사후 수익률 확인 예약"""
+    if not price:
+        return
+    recorded_ts = recorded_ts or time.time()
+    _push(recorded_ts + horizon_sec, record_id, symbol, recorded_ts, float(price))
+
+
+def pending():
+    """상태 스냅샷용 대기 목록 [[만기 ts, record_id, symbol, 기록 ts, 기록가], ...] (만기순)"""
+    return [[e[0], e[2], e[3], e[4], e[5]] for e in sorted(_heap)]
+
+
+def restore(entries):
+    """스냅샷 복구. 다운타임 중 만기가 지난 건은 시작 직후 일괄 처리 (구버전 {symbol: (기록시각, 기록가)} 형식도 수용)"""
+    _heap.clear()
+    if isinstance(entries, dict):
+        for symbol, (rec_at, price) in entries.items():
+            rec_ts = rec_at.timestamp() if isinstance(rec_at, datetime) else float(rec_at)
+            schedule('', symbol, price, rec_ts)
+        return
+    for due_ts, record_id, symbol, rec_ts, price in entries or []:
+        _push(due_ts, record_id, symbol, rec_ts, price)
+
+
+async def _fetch_prices(symbols):
+    """만기 종목 현재가 일괄 조회 (fetch_tickers 1회)"""
+    tickers = await rate_governor.call(rate_governor.PRIORITY_ANALYTICS, exchange.fetch_tickers, symbols)
+    prices = {}
+    for symbol in symbols:
+        t = tickers.get(symbol) or {}
+        price = t.get('last') or t.get('close')
+        if price:
+            prices[symbol] = float(price)
+    return prices
+
+
+async def outcome_task():
+    """만기 정각 처리 루프"""
+    global _wakeup
+    _wakeup = asyncio.Event()
+    while True:
+        try:
+            _wakeup.clear()
+            if not _heap:
+                await _wakeup.wait()
+                continue
+            delay = _heap[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(_wakeup.wait(), timeout=delay)
+                    continue  # 더 이른 만기가 들어옴 → 다시 계산
+                except asyncio.TimeoutError:
+                    pass
+
+            # 묶음의 마지막 만기까지 기다린 뒤 조회 → 모든 건이 만기 이후 가격 (앞선 건은 최대 BATCH_WINDOW_SEC 늦게)
+            window_end = _heap[0][0] + BATCH_WINDOW_SEC
+            batch_end = max(e[0] for e in _heap if e[0] <= window_end)
+            if batch_end > time.time():
+                await asyncio.sleep(batch_end - time.time())
+            due = []
+            while _heap and _heap[0][0] <= batch_end:
+                due.append(heapq.heappop(_heap))
+
+            symbols = sorted({e[3] for e in due})
+            try:
+                prices = await _fetch_prices(symbols)
+            except Exception as e:
+                logger.error(f"Outcome Ticker Fetch Error ({len(symbols)}종목): {e}")
+                prices = {}
+
+            checked_ts = time.time()
+            for due_ts, _, record_id, symbol, rec_ts, price_at, retries in due:
+                price_later = prices.get(symbol)
+                if price_later is None:
+                    if retries < MAX_RETRIES:
+                        _push(checked_ts + RETRY_SEC, record_id, symbol, rec_ts, price_at, retries + 1)
+                    else:
+                        logger.error(f"60m return check error {symbol}: 가격 조회 실패 ({record_id})")
+                    continue
+                analyzer.update_missed_opportunity_return(
+                    symbol, datetime.fromtimestamp(rec_ts).strftime('%Y-%m-%d %H:%M:%S'), price_at, price_later,
+                    record_id=record_id, horizon_min=round((due_ts - rec_ts) / 60),
+                    check_delay_sec=checked_ts - due_ts
+                )
+        except Exception as e:
+            logger.error(f"Outcome Task Error: {e}")
+            await asyncio.sleep(RETRY_SEC)
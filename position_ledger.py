@@ -0,0 +1,186 @@
+import time
+from datetime import datetime
+from config import logger
+
+
+# [포지션 장부] 보유 종목별 평단·수량·실현/평가 손익·등급을 메모리에 유지 (감시 루프·리포트가 종목마다 다시 계산하지 않음)
+# - 우리 주문의 체결은 주문 엔진 완료 시점에 바로 반영하고, 잔고 조회(get_my_assets, 감시 주기)로 느리게 대조
+# - 가격 틱(호가 미러 중간가, 티커 현재가)마다 그 종목 평가손익과 포트폴리오 합계를 차액만큼 갱신 → 합계 조회 O(1)
+QTY_EPS = 0.0001  # 이 이하 수량은 보유 아님 (get_my_assets와 같은 기준)
+RECONCILE_GRACE_SEC = 10  # 체결 반영 직후 이 시간 동안은 잔고 대조로 덮어쓰지 않음 (거래소 잔고 반영 지연)
+
+positions = {}  # symbol -> {'qty', 'avg_price', 'realized', 'last_price', 'unrealized', 'grade', 'buy_type', 'opened_at', 'filled_at'}
+_totals = {'cost': 0.0, 'unrealized': 0.0, 'realized': 0.0}
+
+
+def _new_position(grade="A", buy_type=1, opened_at=None):
+    return {
+        'qty': 0.0,
+        'avg_price': 0.0,
+        'realized': 0.0,
+        'last_price': None,
+        'unrealized': 0.0,
+        'grade': grade,
+        'buy_type': buy_type,
+        'opened_at': opened_at,  # 'YYYY-mm-dd HH:MM:SS' (인벤토리 purchase_time과 같은 형식), 모르면 None
+        'filled_at': 0.0,  # 마지막 체결 반영 시각 ts
+    }
+
+
+def _mark(pos, price):
+    """평가손익을 price 기준으로 다시 계산하고 합계에는 차액만 반영"""
+    new = (price - pos['avg_price']) * pos['qty'] if price and pos['avg_price'] > 0 else 0.0
+    _totals['unrealized'] += new - pos['unrealized']
+    pos['unrealized'] = new
+    pos['last_price'] = price
+
+
+def _set(pos, qty, avg_price):
+    _totals['cost'] += qty * avg_price - pos['qty'] * pos['avg_price']
+    pos['qty'], pos['avg_price'] = qty, avg_price
+    _mark(pos, pos['last_price'])
+
+
+def _drop(symbol):
+    pos = positions.pop(symbol)
+    _totals['cost'] -= pos['qty'] * pos['avg_price']
+    _totals['unrealized'] -= pos['unrealized']
+
+
+def apply_fill(order):
+    """주문 엔진 완료 주문의 체결분 반영 (매수: 가중평균 평단, 매도: 실현손익 확정 후 수량 차감)"""
+    qty = float(order.get('filled') or 0)
+    price = float(order.get('average') or 0)
+    if qty <= 0 or price <= 0:
+        return
+    symbol = order['symbol']
+    pos = positions.get(symbol)
+    if order['side'] == 'buy':
+        if pos is None:
+            pos = positions[symbol] = _new_position(opened_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        total = pos['qty'] + qty
+        _set(pos, total, (pos['qty'] * pos['avg_price'] + qty * price) / total)
+    else:
+        if pos is None:
+            logger.warning(f"[포지션장부] {symbol} 장부에 없는 종목 매도 체결 {qty:g} (다음 잔고 대조 때 정리)")
+            return
+        sold = min(qty, pos['qty'])
+        if pos['avg_price'] > 0:
+            realized = (price - pos['avg_price']) * sold
+            pos['realized'] += realized
+            _totals['realized'] += realized
+        if pos['qty'] - sold <= QTY_EPS:
+            _drop(symbol)
+            return
+        _set(pos, pos['qty'] - sold, pos['avg_price'])
+    pos['filled_at'] = time.time()
+    _mark(pos, price)
+
+
+def update_price(symbol, price):
+    """가격 틱 1건 반영 (보유 종목이 아니면 무시)"""
+    pos = positions.get(symbol)
+    if pos is not None and price:
+        _mark(pos, float(price))
+
+
+def set_meta(symbol, grade=None, buy_type=None):
+    """매수 기록 시 진입 등급·매수 타입 보충 (체결 반영은 apply_fill이 먼저 끝낸 상태)"""
+    pos = positions.get(symbol)
+    if pos is None:
+        return
+    if grade is not None:
+        pos['grade'] = grade
+    if buy_type is not None:
+        pos['buy_type'] = buy_type
+
+
+def set_avg_price(symbol, avg_price):
+    """사용자가 직접 입력한 평단가로 교체"""
+    pos = positions.get(symbol)
+    if pos is not None and avg_price > 0:
+        _set(pos, pos['qty'], float(avg_price))
+
+
+def reconcile(assets, inventory=None):
+    """
+    잔고 조회 결과(get_my_assets 형식 {symbol: {'avg_price', 'total', ...}})와 대조.
+    - 장부에 없는 보유분은 인벤토리(평단·등급·매수 시각) → 거래소 평단 순으로 채워 편입
+    - 수량이 다르면(거래소 앱 수동 매매 등) 잔고 수량으로 맞추고, 평단을 모르면 보충
+    - 잔고에 없는 종목은 장부에서 제거 (실현손익 합계는 유지)
+    """
+    inventory = inventory or {}
+    now = time.time()
+    for symbol, data in assets.items():
+        qty = float(data.get('total') or 0)
+        inv_item = inventory.get(symbol) or inventory.get(symbol.split('/')[0]) or {}
+        known_avg = float(inv_item.get('purchase_price') or inv_item.get('avg_price') or 0) or float(data.get('avg_price') or 0)
+        pos = positions.get(symbol)
+        if pos is None:
+            pos = positions[symbol] = _new_position(
+                inv_item.get('grade', 'A'), inv_item.get('buy_type', 1),
+                inv_item.get('purchase_time') or inv_item.get('buy_time') or inv_item.get('last_update')
+            )
+            _set(pos, qty, known_avg)
+            continue
+        if now - pos['filled_at'] < RECONCILE_GRACE_SEC:
+            continue
+        avg_price = pos['avg_price'] or known_avg
+        if abs(pos['qty'] - qty) > QTY_EPS:
+            logger.info(f"[포지션장부] {symbol} 잔고 대조 수량 {pos['qty']:g} → {qty:g}")
+            _set(pos, qty, avg_price)
+        elif avg_price != pos['avg_price']:
+            _set(pos, pos['qty'], avg_price)
+    for symbol in [s for s, p in positions.items() if s not in assets and now - p['filled_at'] >= RECONCILE_GRACE_SEC]:
+        _drop(symbol)
+    _recompute()
+
+
+def _recompute():
+    """합계를 종목별 값으로 다시 더함 (증분 갱신의 부동소수 오차가 쌓이지 않도록 대조 때마다)"""
+    _totals['cost'] = sum(p['qty'] * p['avg_price'] for p in positions.values())
+    _totals['unrealized'] = sum(p['unrealized'] for p in positions.values())
+
+
+def get(symbol):
+    return positions.get(symbol)
+
+
+def profit_pct(pos):
+    """평단 대비 마지막 가격 수익률(%) (평단·가격을 모르면 0)"""
+    if not pos or pos['avg_price'] <= 0 or not pos['last_price']:
+        return 0
+    return (pos['last_price'] - pos['avg_price']) / pos['avg_price'] * 100
+
+
+def portfolio():
+    """포트폴리오 합계 (종목 수와 무관하게 상수 시간)"""
+    cost = _totals['cost']
+    return {
+        'positions': len(positions),
+        'cost': cost,
+        'value': cost + _totals['unrealized'],
+        'unrealized': _totals['unrealized'],
+        'unrealized_pct': _totals['unrealized'] / cost * 100 if cost > 0 else 0,
+        'realized': _totals['realized'],
+    }
+
+
+def snapshot():
+    """상태 스냅샷용 (가격 틱마다 바뀌는 평가손익은 제외 → 체결·대조 때만 내용이 바뀜)"""
+    return {
+        'realized': _totals['realized'],
+        'positions': {
+            s: {k: p[k] for k in ('qty', 'avg_price', 'realized', 'grade', 'buy_type', 'opened_at')}
+            for s, p in positions.items()
+        },
+    }
+
+
+def restore(saved):
+    positions.clear()
+    _totals.update(cost=0.0, unrealized=0.0, realized=float((saved or {}).get('realized') or 0))
+    for symbol, p in ((saved or {}).get('positions') or {}).items():
+        pos = positions[symbol] = _new_position(p.get('grade', 'A'), p.get('buy_type', 1), p.get('opened_at'))
+        pos['realized'] = float(p.get('realized') or 0)
+        _set(pos, float(p.get('qty') or 0), float(p.get('avg_price') or 0))
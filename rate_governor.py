@@ -0,0 +1,301 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import Counter
+from config import logger
+import session_replay
+
+
+# [API 호출 조율] 모든 거래소 호출을 엔드포인트 종류별 토큰 버킷 하나씩으로 통과시킴
+# - 버킷마다 대기열은 우선순위 힙: 주문 > 보유 감시(손절·텔레그램 응답) > 매수 스캔 > 분석/리포트 (같은 순위는 먼저 온 순)
+# - 429/스로틀 응답을 받으면 해당 버킷을 잠시 멈추고 속도를 절반으로 낮춘 뒤, 성공할 때마다 원래 속도로 조금씩 회복
+# - 우선순위별 대기 시간(건수/평균/최대)을 집계 → 스캔 종료 때 로그
+# - 조회(fetch_*) 호출은 같은 (메서드, 인자)로 이미 진행 중인 요청이 있으면 새로 보내지 않고 그 결과를 함께 받음 (single-flight)
+#   단, 진행 중 요청이 아직 토큰 대기 중이고 우선순위가 더 낮으면 합류하지 않음 (손절 조회가 분석 요청 뒤에 묶이지 않도록)
+# - 메서드별 차단기: 연속 실패가 쌓이면 일정 시간 호출을 보내지 않음. 스캔·분석 호출에는 마지막 정상 결과(잔고·티커 등)를
+#   대신 돌려주고, 주문·감시 호출(손절 판단·주문 잔고·장부 대조)과 캐시가 없는 경우는 CircuitOpenError로 즉시 실패.
+#   주문 메서드는 차단하지 않음
+PRIORITY_ORDER = 0
+PRIORITY_MONITOR = 1
+PRIORITY_SCAN = 2
+PRIORITY_ANALYTICS = 3
+PRIORITY_NAMES = {PRIORITY_ORDER: '주문', PRIORITY_MONITOR: '감시', PRIORITY_SCAN: '스캔', PRIORITY_ANALYTICS: '분석'}
+
+BUCKET_LIMITS = {  # 엔드포인트 종류 -> (초당 호출 수, 버스트)
+    'public': (30.0, 10),
+    'private': (8.0, 4),
+    'order': (8.0, 4),
+}
+ORDER_METHODS = frozenset({'create_order', 'cancel_order', 'create_market_buy_order', 'create_market_sell_order'})
+PRIVATE_METHODS = frozenset({'fetch_balance', 'fetch_order', 'fetch_orders', 'fetch_open_orders',
+                             'fetch_closed_orders', 'fetch_my_trades'})
+BACKOFF_BASE_SEC = 1.0
+BACKOFF_MAX_SEC = 30.0
+MIN_RATE_RATIO = 0.1  # 연속 스로틀 시 속도 하한 (기본 속도 대비)
+RECOVER_STEP_RATIO = 0.05  # 성공 1회당 회복량 (기본 속도 대비)
+BREAKER_FAIL_THRESHOLD = 5  # 연속 실패 횟수 → 차단
+BREAKER_OPEN_SEC = 30  # 차단 유지 시간. 지나면 1건만 시험 호출 (성공 시 해제, 실패 시 다시 차단)
+BREAKER_CACHE_METHODS = frozenset({'fetch_balance', 'fetch_tickers', 'fetch_ticker', 'fetch_markets'})
+BREAKER_CACHE_MAX_AGE_SEC = 600  # 이보다 오래된 캐시는 대신 쓰지 않음
+BREAKER_CACHE_MIN_PRIORITY = PRIORITY_SCAN  # 이 순위 이하(스캔·분석)에만 캐시로 대신 응답 (오래된 값이 손절·주문 판단에 섞이지 않도록)
+# 종목·요청 단위 오류는 거래소 장애가 아니므로 차단기 집계에서 제외
+REQUEST_ERRORS = ('BadSymbol', 'BadRequest', 'ArgumentsRequired', 'InvalidOrder', 'OrderNotFound', 'InsufficientFunds')
+
+_seq = itertools.count()
+_wait_stats = {}  # priority -> [건수, 합계 초, 최대 초]
+_inflight = {}  # (메서드, 인자) -> {'future', 'priority', 'started'}
+_dedup_counts = Counter()  # '메서드 첫인자' -> 합류로 아낀 호출 수
+_breakers = {}  # 메서드 -> {'fails', 'opened_at', 'trial'}
+_last_good = {}  # (메서드, 인자) -> (시각, 결과): 차단 중 대신 돌려줄 마지막 정상 결과
+
+
+class CircuitOpenError(Exception):
+    """차단기가 열려 있고 대신 쓸 캐시도 없음"""
+
+
+class _Bucket:
+    __slots__ = ('name', 'base_rate', 'rate', 'burst', 'tokens', 'updated', 'paused_until', 'strikes', 'waiters', 'task')
+
+    def __init__(self, name, rate, burst):
+        self.name = name
+        self.base_rate = self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.strikes = 0  # 연속 스로틀 횟수
+        self.waiters = []  # (priority, seq, future, 대기 시작)
+        self.task = None
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+_buckets = {name: _Bucket(name, rate, burst) for name, (rate, burst) in BUCKET_LIMITS.items()}
+
+
+def endpoint_of(fn):
+    name = getattr(fn, '__name__', '')
+    if name in ORDER_METHODS:
+        return 'order'
+    if name in PRIVATE_METHODS:
+        return 'private'
+    return 'public'
+
+
+def _record_wait(priority, waited):
+    stats = _wait_stats.setdefault(priority, [0, 0.0, 0.0])
+    stats[0] += 1
+    stats[1] += waited
+    stats[2] = max(stats[2], waited)
+
+
+async def _dispatch(bucket):
+    """대기열이 빌 때까지 토큰이 생기는 대로 가장 높은 우선순위부터 통과시킴"""
+    try:
+        while bucket.waiters:
+            if bucket.waiters[0][2].done():  # 취소된 대기자
+                heapq.heappop(bucket.waiters)
+                continue
+            now = time.monotonic()
+            if now < bucket.paused_until:
+                await asyncio.sleep(bucket.paused_until - now)
+                continue
+            bucket.refill(now)
+            if bucket.tokens >= 1:
+                priority, _, fut, enqueued = heapq.heappop(bucket.waiters)
+                bucket.tokens -= 1
+                _record_wait(priority, now - enqueued)
+                fut.set_result(None)
+                continue
+            await asyncio.sleep((1 - bucket.tokens) / bucket.rate)
+    finally:
+        bucket.task = None
+
+
+async def acquire(endpoint, priority):
+    """endpoint 버킷 토큰 1개를 priority 순서로 받음"""
+    bucket = _buckets[endpoint]
+    now = time.monotonic()
+    if not bucket.waiters and now >= bucket.paused_until:
+        bucket.refill(now)
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            _record_wait(priority, 0.0)
+            return
+    fut = asyncio.get_running_loop().create_future()
+    heapq.heappush(bucket.waiters, (priority, next(_seq), fut, now))
+    if bucket.task is None:
+        bucket.task = asyncio.create_task(_dispatch(bucket))
+    await fut
+
+
+def _is_throttle(e):
+    name = type(e).__name__
+    text = str(e)
+    return name in ('RateLimitExceeded', 'DDoSProtection') or '429' in text or 'Too Many Requests' in text
+
+
+def _on_throttled(bucket, e):
+    bucket.strikes += 1
+    backoff = min(BACKOFF_MAX_SEC, BACKOFF_BASE_SEC * 2 ** (bucket.strikes - 1))
+    bucket.paused_until = time.monotonic() + backoff
+    bucket.rate = max(bucket.base_rate * MIN_RATE_RATIO, bucket.rate / 2)
+    bucket.tokens = 0.0
+    bucket.updated = bucket.paused_until  # 정지 중에는 토큰이 쌓이지 않음 (재개 직후 몰아치기 방지)
+    logger.warning(f"[API조율] {bucket.name} 스로틀 감지 → {backoff:.0f}초 정지, 초당 {bucket.rate:.1f}회로 감속: {e}")
+
+
+def _on_success(bucket):
+    bucket.strikes = 0
+    if bucket.rate < bucket.base_rate:
+        bucket.rate = min(bucket.base_rate, bucket.rate + bucket.base_rate * RECOVER_STEP_RATIO)
+
+
+def _is_request_error(e):
+    return any(cls.__name__ in REQUEST_ERRORS for cls in type(e).__mro__)
+
+
+def _breaker_admit(name, key, priority):
+    """
+    차단 여부 판단. 열려 있으면 스캔·분석 호출은 (True, 캐시 결과)로 대신 응답, 그 밖에는 CircuitOpenError.
+    차단 시간이 지났으면 시험 호출 1건만 통과. 통과 시 (False, None)
+    """
+    breaker = _breakers.get(name)
+    if breaker is None or breaker['opened_at'] is None:
+        return False, None
+    now = time.monotonic()
+    if now - breaker['opened_at'] >= BREAKER_OPEN_SEC and not breaker['trial']:
+        breaker['trial'] = True
+        return False, None
+    cached = _last_good.get(key) if key is not None and priority >= BREAKER_CACHE_MIN_PRIORITY else None
+    if cached is not None and time.time() - cached[0] <= BREAKER_CACHE_MAX_AGE_SEC:
+        return True, cached[1]
+    retry_in = max(0.0, BREAKER_OPEN_SEC - (now - breaker['opened_at']))
+    raise CircuitOpenError(f"{name} 차단 중 (연속 실패 {breaker['fails']}회, {retry_in:.0f}초 후 재시도)")
+
+
+def _breaker_result(name, key, error=None, result=None):
+    breaker = _breakers.setdefault(name, {'fails': 0, 'opened_at': None, 'trial': False})
+    if error is None:
+        if breaker['opened_at'] is not None:
+            logger.info(f"[차단기] {name} 복구 → 정상 호출 재개")
+        breaker.update(fails=0, opened_at=None, trial=False)
+        if key is not None and name in BREAKER_CACHE_METHODS:
+            _last_good[key] = (time.time(), result)
+        return
+    if _is_throttle(error) or _is_request_error(error):
+        if breaker['trial']:
+            breaker['trial'] = False  # 시험 호출 결과로 판단 불가 → 다음 호출이 다시 시험
+        return
+    breaker['fails'] += 1
+    if breaker['trial'] or (breaker['opened_at'] is None and breaker['fails'] >= BREAKER_FAIL_THRESHOLD):
+        breaker.update(opened_at=time.monotonic(), trial=False)
+        logger.warning(f"[차단기] {name} 연속 실패 {breaker['fails']}회 → {BREAKER_OPEN_SEC}초 차단: {error}")
+
+
+async def _governed(bucket, priority, fn, args, kwargs, flight=None, key=None):
+    name = getattr(fn, '__name__', '')
+    breaking = name not in ORDER_METHODS
+    if breaking:
+        served, cached = _breaker_admit(name, key, priority)
+        if served:
+            return cached
+    await acquire(bucket.name, priority)
+    if flight is not None:
+        flight['started'] = True
+    started = time.time()
+    try:
+        result = await asyncio.to_thread(fn, *args, **kwargs)
+    except Exception as e:
+        if session_replay.capturing():
+            session_replay.record(name, args, kwargs, started, error=e)
+        if _is_throttle(e):
+            _on_throttled(bucket, e)
+        if breaking:
+            _breaker_result(name, key, error=e)
+        raise
+    if session_replay.capturing():
+        session_replay.record(name, args, kwargs, started, result=result)
+    _on_success(bucket)
+    if breaking:
+        _breaker_result(name, key, result=result)
+    return result
+
+
+def _flight_key(fn, args, kwargs):
+    """조회 메서드만 합류 대상. 인자가 해시 불가(dict 등)면 None"""
+    name = getattr(fn, '__name__', '')
+    if not name.startswith('fetch_'):
+        return None
+    try:
+        key = (name, id(getattr(fn, '__self__', None)), args, tuple(sorted(kwargs.items())))
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+async def call(priority, fn, *args, endpoint=None, **kwargs):
+    """
+    토큰을 받은 뒤 fn(*args, **kwargs)을 스레드에서 실행. endpoint 미지정 시 메서드 이름으로 판별.
+    같은 조회가 이미 진행 중이면 그 결과를 공유 (반환 객체도 같으므로 호출부에서 수정하지 말 것).
+    차단기가 열려 있으면 스캔·분석 호출은 마지막 정상 결과, 주문·감시 호출은 CircuitOpenError.
+    스로틀 오류는 버킷 감속 후 그대로 다시 던짐 (재시도 여부는 호출부 판단)
+    """
+    bucket = _buckets[endpoint or endpoint_of(fn)]
+    key = _flight_key(fn, args, kwargs)
+    if key is None:
+        return await _governed(bucket, priority, fn, args, kwargs)
+
+    flight = _inflight.get(key)
+    if flight is not None and (flight['started'] or flight['priority'] <= priority):
+        _dedup_counts[f"{key[0]} {args[0]}" if args else key[0]] += 1
+        return await asyncio.shield(flight['future'])
+
+    flight = {'future': None, 'priority': priority, 'started': False}
+    flight['future'] = asyncio.ensure_future(_governed(bucket, priority, fn, args, kwargs, flight, key))
+    flight['future'].add_done_callback(lambda fut: _land(key, flight, fut))
+    _inflight[key] = flight
+    return await asyncio.shield(flight['future'])
+
+
+def _land(key, flight, fut):
+    """요청 종료 시 진행 목록에서 제거 (호출자가 모두 취소돼도 요청 자체는 끝까지 진행)"""
+    if _inflight.get(key) is flight:
+        del _inflight[key]
+    if not fut.cancelled():
+        fut.exception()  # 모든 호출자가 떠난 뒤 실패해도 미수신 예외 경고가 나지 않도록
+
+
+def wait_stats(reset=False):
+    """우선순위별 대기 {이름: {'count', 'avg_ms', 'max_ms'}}"""
+    result = {
+        PRIORITY_NAMES.get(p, str(p)): {'count': n, 'avg_ms': total / n * 1000 if n else 0.0, 'max_ms': peak * 1000}
+        for p, (n, total, peak) in sorted(_wait_stats.items())
+    }
+    if reset:
+        _wait_stats.clear()
+    return result
+
+
+def dedup_stats(reset=False):
+    """키('메서드 첫인자')별 합류로 아낀 호출 수 {키: 건수} (많은 순)"""
+    result = dict(_dedup_counts.most_common())
+    if reset:
+        _dedup_counts.clear()
+    return result
+
+
+def format_wait_stats(reset=False):
+    stats = wait_stats(reset)
+    saved = dedup_stats(reset)
+    if not stats:
+        return "호출 없음"
+    text = " | ".join(f"{name} {s['count']}건 평균 {s['avg_ms']:.0f}ms 최대 {s['max_ms']:.0f}ms" for name, s in stats.items())
+    if saved:
+        top = ", ".join(f"{k} {n}" for k, n in list(saved.items())[:5])
+        text += f" | 중복 합류 {sum(saved.values())}건 ({top})"
+    return text
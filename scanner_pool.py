@@ -0,0 +1,143 @@
+import asyncio
+import multiprocessing
+import queue
+import time
+import zlib
+from config import logger
+
+
+# [멀티프로세스 스캔] 종목 유니버스를 N개 워커 프로세스에 나눠 캔들 조회/지표 계산/신호 판단을 병렬 수행
+# 텔레그램·주문·상태 관리는 메인 프로세스에 그대로 남고, 워커는 판단 결과만 스트리밍합니다.
+SCAN_WORKERS = 0  # 0이면 기존처럼 메인 프로세스 이벤트 루프에서 스캔
+SCAN_SLEEP_SEC = 0.05  # 워커별 종목 간 간격 (기존 스캔 루프와 동일)
+WORKER_RESULT_TIMEOUT_SEC = 300  # 이 시간 동안 결과가 없으면 워커 이상으로 보고 해당 스캔 종료
+
+_ctx = multiprocessing.get_context('spawn')  # 워커마다 config를 새로 import → 거래소 클라이언트 독립
+_workers = []
+_task_queues = []
+_result_queue = None
+_sweep_id = 0
+last_memo_hits = 0
+
+
+def _worker_main(worker_id, task_q, result_q):
+    """워커 프로세스 본체: (sweep_id, 종목목록, 유의목록) 작업을 받아 종목별 결과를 result_q로 전송"""
+    import strategy, market_cache, candle_store
+    from candles import Candles
+    from config import exchange
+
+    # 마켓 정보는 메인이 저장해 둔 캐시 파일로 웜스타트 (워커별 load_markets 호출 방지)
+    market_cache.load_markets_from_file()
+
+    while True:
+        job = task_q.get()
+        if job is None:
+            break
+        sweep_id, symbols, warning_list = job
+        w_version = strategy.get_warning_version(warning_list)
+        memo_hits = 0
+        for symbol in symbols:
+            try:
+                bar_ts = strategy.get_last_closed_bar_ts()
+                # 1분봉은 매 스캔 조회 (3분 내 급등 판단 + 진행 중 30분봉 합성), 30분봉 200개는 봉마다 1회
+                time.sleep(SCAN_SLEEP_SEC)
+                ohlcv_1m = None
+                try:
+                    ohlcv_1m = exchange.fetch_ohlcv(symbol, '1m', limit=strategy.LIVE_1M_LIMIT)
+                    candle_store.append(symbol, '1m', ohlcv_1m)
+                except Exception:
+                    pass
+
+                candles = strategy.get_scan_candles(symbol, bar_ts)
+                if candles is not None:
+                    candles = strategy.with_live_bar(candles, ohlcv_1m, bar_ts)
+                if candles is None:
+                    ohlcv = exchange.fetch_ohlcv(symbol, '30m', limit=200)
+                    candle_store.append(symbol, '30m', ohlcv)
+                    if len(ohlcv) < 185:
+                        continue
+                    candles = Candles.from_ohlcv(ohlcv)
+                    strategy.put_scan_candles(symbol, bar_ts, candles)
+
+                memo_key = strategy.make_buy_signal_key(symbol, bar_ts, w_version, strategy.live_signature(candles, ohlcv_1m))
+                if strategy.get_memo_buy_signal(memo_key) is not None:
+                    memo_hits += 1
+                    continue
+
+                df_1m = Candles.from_ohlcv(ohlcv_1m) if ohlcv_1m and len(ohlcv_1m) >= 21 else None
+                is_buy, reason, grade, data_dict = strategy.check_buy_signal(candles, symbol, warning_list, df_1m)
+                strategy.put_memo_buy_signal(memo_key, (is_buy, reason, grade, data_dict))
+                result_q.put((sweep_id, symbol, is_buy, reason, grade, data_dict, candles.last_close()))
+            except Exception as e:
+                logger.error(f"Scan Worker {worker_id} Error ({symbol}): {e}")
+        candle_store.flush()
+        # 샤드 완료 신호
+        result_q.put((sweep_id, None, worker_id, memo_hits))
+
+
+def ensure_workers():
+    """워커 프로세스 기동 (죽은 워커는 같은 번호로 재기동해 샤드 배정 유지)"""
+    global _result_queue
+    if _result_queue is None:
+        _result_queue = _ctx.Queue()
+    for worker_id in range(SCAN_WORKERS):
+        if worker_id < len(_workers) and _workers[worker_id].is_alive():
+            continue
+        task_q = _ctx.Queue()
+        proc = _ctx.Process(target=_worker_main, args=(worker_id, task_q, _result_queue), daemon=True)
+        proc.start()
+        if worker_id < len(_workers):
+            logger.error(f"Scan Worker {worker_id} 재기동 (이전 종료코드: {_workers[worker_id].exitcode})")
+            _workers[worker_id], _task_queues[worker_id] = proc, task_q
+        else:
+            _workers.append(proc)
+            _task_queues.append(task_q)
+
+
+def stop_workers():
+    for task_q in _task_queues:
+        task_q.put(None)
+    for proc in _workers:
+        proc.join(timeout=5)
+    _workers.clear()
+    _task_queues.clear()
+
+
+def shard_of(symbol):
+    """종목 → 워커 번호. 고정 해시라 매 스캔 같은 워커가 담당해 워커 내 메모/캔들 캐시가 유지됨"""
+    return zlib.crc32(symbol.encode()) % SCAN_WORKERS
+
+
+async def scan(symbols, warning_list):
+    """
+    종목을 워커에 분배하고 결과가 도착하는 대로 내보내는 비동기 제너레이터.
+
+    Yields:
+        tuple: (symbol, is_buy, reason, grade, data_dict, current_price)
+    """
+    global _sweep_id, last_memo_hits
+    ensure_workers()
+    _sweep_id += 1
+    sweep_id = _sweep_id
+
+    shards = [[] for _ in range(SCAN_WORKERS)]
+    for symbol in symbols:
+        shards[shard_of(symbol)].append(symbol)
+    for task_q, shard in zip(_task_queues, shards):
+        task_q.put((sweep_id, shard, warning_list))
+
+    remaining = SCAN_WORKERS
+    last_memo_hits = 0
+    while remaining:
+        try:
+            item = await asyncio.to_thread(_result_queue.get, True, WORKER_RESULT_TIMEOUT_SEC)
+        except queue.Empty:
+            logger.error(f"Scan Worker 응답 없음: {remaining}개 샤드 미완료 상태로 스캔 종료")
+            break
+        if item[0] != sweep_id:
+            continue  # 이전(중단된) 스캔의 늦은 결과는 버림
+        if item[1] is None:
+            remaining -= 1
+            last_memo_hits += item[3]
+            continue
+        yield item[1:]
@@ -0,0 +1,444 @@
+import argparse
+import asyncio
+import atexit
+import bisect
+import gzip
+import hashlib
+import json
+import os
+import queue
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from datetime import datetime
+
+
+# [세션 기록/재생] 실전 세션의 거래소 응답을 전부 기록해 두고, 같은 하루를 코드 변경 전후로 그대로 다시 돌려 비교
+# - 기록: rate_governor를 거치는 모든 호출(마켓·캔들·티커·잔고·주문 접수·체결 조회)의 요청/응답/오류를 시각과 함께 gzip JSONL로
+#   (파일 쓰기·압축은 백그라운드 스레드, 첫 줄에 시작 시점 inventory.json·runtime_state.json 포함)
+# - 재생: 기록 응답을 돌려주는 가짜 거래소로 buy_scan_task·sell_monitor_task(+S급 추적·매도 유예·호가·사후추적 타이머)를 실행.
+#   --speed 1은 실제 시간 그대로, --speed 0은 가상 시계로 대기 시간을 건너뛰어 최대 속도 (time.time/monotonic·datetime.now 모두 가상 시각)
+# - 결과: 실행 시간, 메서드별 호출 수, 기록에 없던 호출 수, 결정(텔레그램 메시지·주문) 목록 → --baseline 요약과 비교
+#   사용 예: python session_replay.py capture_20261019.jsonl.gz --speed 0 --out after
+#           python session_replay.py capture_20261019.jsonl.gz --speed 0 --out after --baseline before.summary.json
+# 기록은 main.py 스캔이 메인 프로세스에서 돌 때만 완전함 (scanner_pool 워커 프로세스의 직접 호출은 기록되지 않음)
+CAPTURE_FILE = None  # 경로를 지정하면 main() 시작 시 기록 시작 (예: "capture_20261019.jsonl.gz")
+CAPTURE_QUEUE_SIZE = 100_000
+VIRTUAL_TICK_SEC = 1e-6  # 가상 시계 모드에서 이벤트 루프 한 바퀴가 쓰는 시간
+
+_capture_q = None
+_capture_thread = None
+_capture_dropped = 0
+
+
+# ---------------------------------------------------------------- 기록
+def start_capture(path=None, files=()):
+    """기록 시작. files의 현재 내용을 첫 줄(start)에 함께 저장. 여러 번 호출해도 1회만"""
+    global _capture_q, _capture_thread
+    if _capture_q is not None:
+        return
+    path = path or CAPTURE_FILE
+    contents = {}
+    for name in files:
+        if os.path.exists(name):
+            with open(name, encoding='utf-8') as f:
+                contents[os.path.basename(name)] = f.read()
+    _capture_q = queue.Queue(CAPTURE_QUEUE_SIZE)
+    _capture_q.put({'type': 'start', 't': time.time(), 'files': contents})
+    _capture_thread = threading.Thread(target=_capture_writer, args=(path, _capture_q), name='capture-writer', daemon=True)
+    _capture_thread.start()
+    atexit.register(stop_capture)
+
+
+def _capture_writer(path, q):
+    with gzip.open(path, 'at', encoding='utf-8', compresslevel=6) as f:
+        while True:
+            entry = q.get()
+            if entry is None:
+                return
+            f.write(json.dumps(entry, ensure_ascii=False, default=_json_default, separators=(',', ':')) + '\n')
+
+
+def _json_default(obj):
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj, key=str)  # 유의종목 집합 등
+    return str(obj)
+
+
+def capturing():
+    return _capture_q is not None
+
+
+def record(method, args, kwargs, started, result=None, error=None):
+    """거래소 호출 1건 (rate_governor에서 호출). 큐가 가득 차면 버림"""
+    global _capture_dropped
+    entry = {'type': 'call', 't': started, 'dt': round(time.time() - started, 4), 'm': method, 'a': args, 'k': kwargs}
+    if error is not None:
+        entry['e'] = [type(error).__name__, str(error)]
+    else:
+        entry['r'] = result
+    try:
+        _capture_q.put_nowait(entry)
+    except queue.Full:
+        _capture_dropped += 1
+
+
+def stop_capture():
+    global _capture_q, _capture_thread
+    if _capture_q is None:
+        return
+    _capture_q.put(None)
+    _capture_thread.join()
+    _capture_q = _capture_thread = None
+    if _capture_dropped:
+        print(f"[세션기록] 큐 포화로 버린 호출: {_capture_dropped}건")
+
+
+# ---------------------------------------------------------------- 재생용 거래소
+def _call_key(method, args, kwargs):
+    return json.dumps([method, args, kwargs], ensure_ascii=False, default=str, sort_keys=True, separators=(',', ':'))
+
+
+def _rebuild_error(name, message):
+    try:
+        import ccxt
+        cls = getattr(ccxt, name, None)
+    except ImportError:
+        cls = None
+    if not (isinstance(cls, type) and issubclass(cls, Exception)):
+        cls = type(name, (Exception,), {})  # 이름 기준 판별(차단기·스로틀)이 그대로 동작하도록
+    return cls(message)
+
+
+class ReplayExchange:
+    """
+    기록된 응답을 순서대로 돌려주는 거래소 대역.
+    같은 (메서드, 인자) 호출은 기록 순서대로 소비하고, 다 쓰면 마지막 응답을 반복.
+    인자가 다른 호출(결정이 달라져 수량이 바뀐 주문 등)은 같은 메서드·첫 인자(종목) 기록 중 재생 시각(time.time)에
+    가장 가까운 기록을 사용 (소비하지 않음). 첫 인자까지 다르면 다른 종목 응답을 주지 않고 '기록 없음' 오류
+    """
+
+    def __init__(self, calls):
+        self.exact = defaultdict(deque)
+        self.by_first = defaultdict(lambda: ([], []))  # (메서드, 첫 인자) -> (기록 시각 목록, 응답 목록), 시각 순
+        for c in calls:
+            payload = c.get('e') or json.dumps(c.get('r'), ensure_ascii=False)
+            item = (bool(c.get('e')), payload)
+            self.exact[_call_key(c['m'], c['a'], c['k'])].append(item)
+            times, items = self.by_first[(c['m'], json.dumps(c['a'][:1], default=str))]
+            times.append(c['t'])
+            items.append(item)
+        self.calls = Counter()
+        self.misses = Counter()
+        self._methods = {}
+        self._lock = threading.Lock()  # 호출은 rate_governor가 스레드에서 실행
+
+    def _answer(self, method, args, kwargs):
+        key = _call_key(method, list(args), kwargs)
+        with self._lock:
+            self.calls[method] += 1
+            q = self.exact.get(key)
+            if q:
+                item = q.popleft() if len(q) > 1 else q[0]
+            else:
+                self.misses[method] += 1
+                nearby = self.by_first.get((method, json.dumps(list(args[:1]), default=str)))
+                if not nearby:
+                    raise _rebuild_error('ExchangeNotAvailable', f"기록 없음: {method} {args}")
+                item = nearby[1][self._nearest(nearby[0], time.time())]
+        is_error, payload = item
+        if is_error:
+            raise _rebuild_error(*payload)
+        return json.loads(payload)  # 호출마다 새 객체 (호출부가 수정해도 다음 응답에 영향 없음)
+
+    @staticmethod
+    def _nearest(times, now):
+        i = bisect.bisect_left(times, now)
+        if i == len(times) or (i > 0 and now - times[i - 1] <= times[i] - now):
+            return i - 1
+        return i
+
+    def __getattr__(self, method):
+        if method.startswith('_'):
+            raise AttributeError(method)
+        return self.recorded(method)
+
+    def recorded(self, method):
+        """기록된 호출 이름(거래소 메서드가 아닌 함수 포함)으로 응답을 돌려주는 함수"""
+        fn = self._methods.get(method)
+        if fn is None:
+            def fn(*args, **kwargs):
+                return self._answer(method, args, kwargs)
+            fn.__name__ = method  # rate_governor가 메서드 이름으로 버킷·합류·차단기를 판별
+            self._methods[method] = fn
+        return fn
+
+    def set_markets(self, markets, currencies=None):
+        pass
+
+
+def load_capture(path):
+    """Returns: (start 줄 dict, 호출 목록). 기록 중 끊긴 마지막 줄은 무시"""
+    start, calls = None, []
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        try:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get('type') == 'start':
+                    start = start or entry
+                elif entry.get('type') == 'call':
+                    calls.append(entry)
+        except EOFError:
+            pass  # 종료 처리 없이 끝난 기록 (gzip 꼬리 없음)
+    calls.sort(key=lambda c: c['t'])
+    return start, calls
+
+
+# ---------------------------------------------------------------- 가상 시계
+class _VirtualSelector:
+    """대기할 I/O가 없으면 실제로 기다리지 않고 가상 시각을 다음 타이머까지 당김"""
+
+    def __init__(self, selector, loop):
+        self._selector = selector
+        self._loop = loop
+
+    def select(self, timeout=None):
+        events = self._selector.select(0)
+        if events or timeout == 0:
+            # 루프 한 바퀴마다 최소 한 틱 진행 (부동소수 자릿수보다 짧은 대기만 남은 타이머가 제자리에서 도는 것 방지)
+            self._loop.vtime += VIRTUAL_TICK_SEC
+            return events
+        if timeout is None:
+            return self._selector.select(timeout)
+        self._loop.vtime += timeout
+        return []
+
+    def __getattr__(self, name):
+        return getattr(self._selector, name)
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    """
+    가상 시계 이벤트 루프 (speed 0 재생용).
+    asyncio.to_thread 작업은 스레드 대신 그 자리에서 실행 → 완료 순서가 스레드 스케줄링에 흔들리지 않아 재생 결과가 매번 같음
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.vtime = time.monotonic()  # 실제 단조 시계에서 이어감 (임포트 때 잡아 둔 monotonic 기준값들과 연속)
+        self._selector = _VirtualSelector(self._selector, self)
+
+    def time(self):
+        return self.vtime
+
+    def run_in_executor(self, executor, func, *args):
+        fut = self.create_future()
+        try:
+            fut.set_result(func(*args))
+        except Exception as e:
+            fut.set_exception(e)
+        return fut
+
+
+class _Clock:
+    """재생 중 벽시계: 기록 시작 시각 + 재생 경과 (speed 0이면 가상 시계 기준)"""
+
+    def __init__(self, start_ts, loop_time):
+        self.start_ts = start_ts
+        self.loop_time = loop_time
+        self.loop_start = loop_time()
+
+    def wall(self):
+        return self.start_ts + (self.loop_time() - self.loop_start)
+
+
+def _install_clock(clock, virtual, modules):
+    """time.time(가상 모드면 time.monotonic도)과 모듈들의 datetime.now를 재생 시계로 교체"""
+    time.time = clock.wall
+    if virtual:
+        time.monotonic = clock.loop_time
+
+    class ReplayDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return cls.fromtimestamp(time.time(), tz)
+
+    for module in modules:
+        if getattr(module, 'datetime', None) is datetime:
+            module.datetime = ReplayDatetime
+
+
+# ---------------------------------------------------------------- 재생
+class _ReplayBot:
+    def __init__(self, decisions, clock):
+        self.decisions = decisions
+        self.clock = clock
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.decisions.append({'t': round(self.clock.wall(), 3), 'kind': 'message', 'text': text})
+
+
+async def _run_session(start, exchange, decisions, until_ts, speed):
+    # 재생 대상 모듈은 작업 폴더·가짜 거래소·시계가 준비된 뒤 import (모듈 상수·파일 경로가 작업 폴더 기준이 되도록)
+    import config
+    config.exchange = exchange
+    import main, strategy, analyzer, market_cache, order_book, order_engine, outcome_tracker, state_store
+    import node_lease, scanner_pool, position_ledger
+    modules = (config, main, strategy, analyzer, market_cache, order_book, order_engine, outcome_tracker, state_store, position_ledger)
+    for module in modules:
+        if hasattr(module, 'exchange'):
+            module.exchange = exchange
+    # 거래소 객체 밖에서 rate_governor로 호출하던 함수도 기록 응답으로 대체
+    warning_set = exchange.recorded('_fetch_warning_set')
+    strategy._fetch_warning_set = lambda: frozenset(warning_set())
+    node_lease.COORDINATION_ENABLED = False
+    scanner_pool.SCAN_WORKERS = 0
+
+    loop = asyncio.get_running_loop()
+    clock = _Clock(start['t'], loop.time)
+    _install_clock(clock, speed == 0, modules)
+
+    original_submit = order_engine.submit
+
+    async def recording_submit(symbol, side, amount=None, reason="", **kwargs):
+        decisions.append({'t': round(clock.wall(), 3), 'kind': 'order', 'symbol': symbol, 'side': side,
+                          'amount': amount, 'reason': reason, 'cost': (kwargs.get('params') or {}).get('cost')})
+        return await original_submit(symbol, side, amount, reason, **kwargs)
+    order_engine.submit = recording_submit
+
+    app = type('ReplayApp', (), {'bot': _ReplayBot(decisions, clock)})()
+    main.restore_runtime_state()
+    await strategy.refresh_warning_list()
+    await market_cache.init_markets()
+    tasks = [asyncio.ensure_future(coro) for coro in (
+        main.buy_scan_task(app), main.sell_monitor_task(app), main.s_track_task(app), main.grace_task(app),
+        order_book.book_sync_task(), outcome_tracker.outcome_task(),
+    )]
+    await asyncio.sleep(max(0.0, until_ts - clock.wall()))
+    # 감시 루프와 그 밖에서 떠 있는 작업(주문 워커·체결 폴러·디스패처 등)까지 정리
+    tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    analyzer.flush_missed_runs()
+
+
+def replay(path, speed=0, out=None, workdir=None, minutes=None):
+    """
+    기록 파일 1개를 재생. speed: 1이면 실제 시간, 0이면 최대 속도(가상 시계).
+    Returns: 요약 dict (결정 목록은 out + '.decisions.jsonl')
+    """
+    start, calls = load_capture(path)
+    if start is None:
+        raise ValueError(f"start 줄 없는 기록: {path}")
+    until_ts = calls[-1]['t'] if calls else start['t']
+    if minutes:
+        until_ts = min(until_ts, start['t'] + minutes * 60)
+    exchange = ReplayExchange(calls)
+    decisions = []
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    workdir = workdir or tempfile.mkdtemp(prefix='replay_')
+    os.makedirs(workdir, exist_ok=True)
+    for name, content in (start.get('files') or {}).items():
+        with open(os.path.join(workdir, name), 'w', encoding='utf-8') as f:
+            f.write(content)
+    sys.path.insert(0, here)
+    cwd = os.getcwd()
+    os.chdir(workdir)  # 재생 중 기록 파일(미지 기록·체결·캔들 등)은 작업 폴더에만 씀
+    real_time, real_monotonic = time.time, time.monotonic
+    t0 = time.perf_counter()
+    loop = VirtualTimeLoop() if speed == 0 else asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(_run_session(start, exchange, decisions, until_ts, speed))
+    finally:
+        loop.close()
+        time.time, time.monotonic = real_time, real_monotonic
+        os.chdir(cwd)
+    wall_sec = time.perf_counter() - t0
+
+    # 해시는 결정 내용·순서만으로 (시각은 스레드 작업 완료 시점에 따라 수십 ms 흔들림)
+    digest = hashlib.sha1(json.dumps([_strip_time(d) for d in decisions], ensure_ascii=False, sort_keys=True).encode()).hexdigest()
+    summary = {
+        'capture': os.path.abspath(path),
+        'speed': speed,
+        'session_sec': round(until_ts - start['t'], 1),
+        'wall_sec': round(wall_sec, 2),
+        'recorded_calls': len(calls),
+        'calls': dict(exchange.calls.most_common()),
+        'misses': dict(exchange.misses.most_common()),
+        'decisions': len(decisions),
+        'decisions_sha1': digest,
+        'workdir': workdir,
+    }
+    if out:
+        summary['decisions_file'] = os.path.abspath(out + '.decisions.jsonl')
+        with open(summary['decisions_file'], 'w', encoding='utf-8') as f:
+            f.writelines(json.dumps(d, ensure_ascii=False) + '\n' for d in decisions)
+        with open(out + '.summary.json', 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+    return summary
+
+
+def _strip_time(decision):
+    return {k: v for k, v in decision.items() if k != 't'}
+
+
+def compare(before, after):
+    """두 재생 요약 비교 → 출력 줄 목록 (실행 시간, 메서드별 호출 수 차이, 첫 번째로 달라진 결정)"""
+    lines = [f"실행 시간: {before['wall_sec']:.2f}초 → {after['wall_sec']:.2f}초"]
+    for method in sorted(set(before['calls']) | set(after['calls'])):
+        b, a = before['calls'].get(method, 0), after['calls'].get(method, 0)
+        if a != b:
+            lines.append(f"  호출 {method}: {b} → {a} ({a - b:+d})")
+    if before['decisions_sha1'] == after['decisions_sha1']:
+        lines.append(f"결정 {after['decisions']}건 동일")
+        return lines
+    lines.append(f"결정 다름: {before['decisions']}건 → {after['decisions']}건")
+    try:
+        with open(before['decisions_file'], encoding='utf-8') as fb, open(after['decisions_file'], encoding='utf-8') as fa:
+            b_list, a_list = [json.loads(l) for l in fb], [json.loads(l) for l in fa]
+    except (KeyError, OSError):
+        return lines
+    for i in range(max(len(b_list), len(a_list))):
+        b = b_list[i] if i < len(b_list) else None
+        a = a_list[i] if i < len(a_list) else None
+        if (b and _strip_time(b)) != (a and _strip_time(a)):
+            lines.append(f"  첫 차이 #{i + 1}\n    전: {b}\n    후: {a}")
+            break
+    return lines
+
+
+def main():
+    if os.environ.get('PYTHONHASHSEED') is None:
+        # 문자열 해시 시드를 고정해 다시 실행 (set 순회 순서 → 스캔·결정 순서가 실행마다 달라지지 않도록)
+        os.execve(sys.executable, [sys.executable] + sys.argv, {**os.environ, 'PYTHONHASHSEED': '0'})
+    parser = argparse.ArgumentParser(description="기록된 세션 재생 (성능·결정 회귀 비교)")
+    parser.add_argument('capture', help="CAPTURE_FILE로 기록한 .jsonl.gz")
+    parser.add_argument('--speed', type=float, default=0, choices=(0, 1), help="1: 실제 시간, 0: 최대 속도")
+    parser.add_argument('--minutes', type=float, default=None, help="앞에서부터 N분만 재생")
+    parser.add_argument('--out', default=None, help="결과 접두어 (→ .summary.json, .decisions.jsonl)")
+    parser.add_argument('--workdir', default=None, help="재생 중 파일을 쓸 폴더 (기본: 임시 폴더)")
+    parser.add_argument('--baseline', default=None, help="비교할 이전 .summary.json")
+    parser.add_argument('--keep', action='store_true', help="임시 작업 폴더 유지")
+    args = parser.parse_args()
+
+    summary = replay(args.capture, args.speed, args.out, args.workdir, args.minutes)
+    print(f"▶️ 재생 {summary['session_sec'] / 60:.0f}분 세션 | 실행 {summary['wall_sec']:.2f}초 | "
+          f"호출 {sum(summary['calls'].values()):,}건 (기록 {summary['recorded_calls']:,}건, 기록 불일치 {sum(summary['misses'].values())}건) | "
+          f"결정 {summary['decisions']}건 ({summary['decisions_sha1'][:10]})")
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            print("\n".join(compare(json.load(f), summary)))
+    if not args.workdir and not args.keep:
+        shutil.rmtree(summary['workdir'], ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
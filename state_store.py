@@ -0,0 +1,74 @@
+import json
+import os
+import time
+from datetime import datetime
+from config import logger
+
+
+# [상태 스냅샷] 재시작/크래시 후 즉시 복구용 런타임 상태 파일
+STATE_FILE = "runtime_state.json"
+SNAPSHOT_INTERVAL_SEC = 5
+
+_last_written = {}  # 섹션명 -> 마지막으로 기록한 직렬화 문자열 (변경분 판단용)
+
+
+def _encode(obj):
+    if isinstance(obj, datetime):
+        return {'__dt__': obj.timestamp()}
+    raise TypeError(f"직렬화 불가 타입: {type(obj).__name__}")
+
+
+def _decode(d):
+    if len(d) == 1 and '__dt__' in d:
+        return datetime.fromtimestamp(d['__dt__'])
+    return d
+
+
+def build_snapshot(sections):
+    """
+    섹션별로 직렬화해서 직전 기록과 비교, 바뀐 섹션이 있을 때만 파일 본문을 만듭니다.
+    바뀐 게 없으면 None (디스크 쓰기 생략).
+    """
+    encoded = {
+        name: json.dumps(value, default=_encode, separators=(',', ':'), ensure_ascii=False)
+        for name, value in sections.items()
+    }
+    if encoded == _last_written:
+        return None
+    _last_written.clear()
+    _last_written.update(encoded)
+    body = ','.join(f'"{name}":{value}' for name, value in encoded.items())
+    return f'{{"saved_at":{time.time()},"sections":{{{body}}}}}'
+
+
+def write_snapshot(payload):
+    """임시 파일 기록 후 교체 (쓰는 도중 종료돼도 이전 스냅샷은 온전히 남음)"""
+    try:
+        tmp_file = STATE_FILE + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, STATE_FILE)
+        return True
+    except Exception as e:
+        # 다음 주기에 다시 쓰도록 비교 기준 초기화
+        _last_written.clear()
+        logger.error(f"State Snapshot Save Error: {e}")
+        return False
+
+
+def load_snapshot():
+    """
+    Returns:
+        tuple: (saved_at epoch 또는 None, {섹션명: 값})
+    """
+    if not os.path.exists(STATE_FILE):
+        return None, {}
+    try:
+        with open(STATE_FILE, "r", encoding="utf-8") as f:
+            snap = json.load(f, object_hook=_decode)
+        return float(snap['saved_at']), snap.get('sections', {})
+    except Exception as e:
+        logger.error(f"State Snapshot Load Error: {e}")
+        return None, {}
@@ -2,8 +2,12 @@ import asyncio
 import pandas as pd
 import numpy as np
 import requests
+import time
+from collections import OrderedDict
 from datetime import datetime
 from config import logger
+from candles import Candles, as_frame
+import rate_governor
 
 
 def get_bithumb_tick_size(price):
@@ -25,15 +29,124 @@ def calculate_rsi(df, period=14):
     return 100 - (100 / (1 + (ema_up / ema_down)))
 
 
-def get_warning_list():
+# [가격 필터] 10원 미만 또는 10,000원 이상 → BTC 마켓 동전주/비정상 차단
+MIN_BUY_PRICE = 10
+MAX_BUY_PRICE = 10000
+# [사전 스크리닝] 24시간 거래대금 하한 (원)
+PRESCREEN_MIN_QUOTE_VOLUME = 50_000_000
+
+# 누적 사전 스크리닝 탈락 카운터 (투자유의 외 탈락 1건당 30분봉+1분봉 OHLCV 최대 2회 절약)
+prescreen_counters = {'가격필터': 0, '투자유의': 0, '거래대금부족': 0, '무변동': 0, '통과': 0}
+PRESCREEN_OHLCV_PER_SYMBOL = 2
+PRESCREEN_PRICE_REASON = "가격필터(BTC마켓)"  # check_buy_signal 가격 필터와 같은 탈락 사유 (미지 기록용)
+
+
+def prescreen_symbols(symbols, tickers, warning_list):
+    """
+    전 종목 티커 스냅샷 1회로 캔들 조회 전에 탈락 종목을 걸러냅니다.
+    check_buy_signal의 가격/유의종목 필터와 같은 기준 + 거래대금 하한 + 무변동 종목 제외.
+    티커가 없는 종목은 가격 관련 판단을 건너뛰고 통과시킵니다(본 검사에서 재확인).
+
+    Returns:
+        tuple: (통과 심볼 리스트, 이번 스캔 필터별 탈락 카운트 dict,
+                가격필터 탈락 {심볼: 현재가} - 본 검사에서처럼 미지 기록을 남기기 위함)
+    """
+    stats = {key: 0 for key in prescreen_counters}
+    passed = []
+    price_filtered = {}
+    for symbol in symbols:
+        if symbol.split('/')[0] in warning_list:
+            stats['투자유의'] += 1
+            continue
+
+        ticker = tickers.get(symbol) if tickers else None
+        if ticker:
+            last = ticker.get('last') or ticker.get('close')
+            if last is not None and (float(last) < MIN_BUY_PRICE or float(last) >= MAX_BUY_PRICE):
+                stats['가격필터'] += 1
+                price_filtered[symbol] = float(last)
+                continue
+
+            quote_volume = ticker.get('quoteVolume')
+            if quote_volume is not None and float(quote_volume) < PRESCREEN_MIN_QUOTE_VOLUME:
+                stats['거래대금부족'] += 1
+                continue
+
+            high, low = ticker.get('high'), ticker.get('low')
+            if high is not None and low is not None and float(high) <= float(low):
+                stats['무변동'] += 1
+                continue
+
+        stats['통과'] += 1
+        passed.append(symbol)
+
+    for key, cnt in stats.items():
+        prescreen_counters[key] += cnt
+    return passed, stats, price_filtered
+
+
+def prescreen_saved_requests(stats):
+    """사전 스크리닝으로 새로 아낀 OHLCV 조회 수 (투자유의는 사전 스크리닝 전에도 캔들 조회 없이 제외됐으므로 제외)"""
+    return sum(cnt for key, cnt in stats.items() if key not in ('투자유의', '통과')) * PRESCREEN_OHLCV_PER_SYMBOL
+
+
+# ---------- [유의종목 캐시] 백그라운드 갱신 + 실패 시 마지막 정상값 유지 ----------
+# 마지막 정상값은 상태 스냅샷에도 저장 → 재시작 직후 첫 조회가 실패해도 필터가 꺼지지 않음
+WARNING_LIST_URL = "https://api.bithumb.com/public/assetsstatus/ALL"
+WARNING_LIST_TTL_SEC = 300  # 갱신 주기
+WARNING_LIST_RETRY_SEC = 15  # 이번 실행에서 아직 한 번도 받지 못했으면 이 간격으로 재시도
+_warning_set = frozenset()
+_warning_fetched_at = 0.0
+_warning_live = False  # 이번 실행에서 조회에 성공했는지 (False면 스냅샷 복구값 또는 빈 목록)
+
+
+def _fetch_warning_set():
+    """빗썸 입출금 중단(유의) 종목 조회 (블로킹 - 반드시 스레드에서 호출)"""
+    res = requests.get(WARNING_LIST_URL, timeout=5).json()
+    if res.get('status') != '0000':
+        raise ValueError(f"status={res.get('status')} message={res.get('message')}")
+    data = res.get('data', {})
+    return frozenset(coin for coin, info in data.items() if info.get('halt_status', 0) != 0)
+
+
+async def refresh_warning_list():
+    """유의종목을 비동기로 갱신합니다. 실패 시 이전 목록을 그대로 유지하고 False 반환."""
+    global _warning_set, _warning_fetched_at, _warning_live
     try:
-        url = "https://api.bithumb.com/public/assetsstatus/ALL"
-        res = requests.get(url, timeout=5).json()
-        data = res.get('data', {})
-        return [coin for coin, info in data.items() if info.get('halt_status', 0) != 0]
+        _warning_set = await rate_governor.call(rate_governor.PRIORITY_SCAN, _fetch_warning_set, endpoint='public')
+        _warning_fetched_at = time.time()
+        _warning_live = True
+        return True
     except Exception as e:
-        logger.error(f"Warning List Fetch Error: {e}")
-        return []
+        age = int(time.time() - _warning_fetched_at) if _warning_fetched_at else -1
+        logger.error(f"Warning List Fetch Error: {e} (이전 목록 {len(_warning_set)}종목 유지, 경과: {age}초)")
+        return False
+
+
+async def warning_list_refresh_task():
+    """유의종목 캐시 백그라운드 갱신 루프 (첫 성공 전에는 WARNING_LIST_RETRY_SEC 간격)"""
+    while True:
+        await asyncio.sleep(WARNING_LIST_TTL_SEC if _warning_live else WARNING_LIST_RETRY_SEC)
+        await refresh_warning_list()
+
+
+def warning_list_snapshot():
+    """상태 스냅샷용 마지막 정상 유의종목 목록 (정렬된 list, 받은 적 없으면 None)"""
+    return sorted(_warning_set) if _warning_live or _warning_set else None
+
+
+def restore_warning_list(saved):
+    """스냅샷의 유의종목 목록 복구. 이번 실행에서 이미 조회에 성공했으면 무시"""
+    global _warning_set
+    if saved is None or _warning_live:
+        return
+    _warning_set = frozenset(saved)
+    logger.info(f"[유의종목] 스냅샷 목록 {len(_warning_set)}종목으로 시작 (조회 성공 시 교체)")
+
+
+def get_warning_list():
+    """캐시된 유의종목 집합(frozenset)을 즉시 반환합니다. 네트워크 호출 없음."""
+    return _warning_set
 
 
 # [사용자 원본 버전 1]
@@ -187,6 +300,111 @@ def _get_pattern_labels(df, curr, curr_price, rsi_val, ma5_val, ma20_val, ma185_
     return labels
 
 
+# ---------- [신호 메모] 판단 입력이 바뀌지 않은 종목은 check_buy_signal 재평가 생략 ----------
+# check_buy_signal은 확정봉뿐 아니라 진행 중 봉(df.iloc[-1])과 1분봉(3분 내 3% 급등)도 보므로,
+# 메모 키에 확정봉 시각 + 진행 중 봉(가격·거래량 반올림) + 1분봉 수급 돌파 전제 조건을 넣고 1분봉은 매 스캔 조회합니다.
+# 1분봉은 수급 돌파 전제(거래량 300% + 3분 내 3%)가 성립할 때만 판단에 쓰이므로, 성립하지 않으면 키에서 내용을 뺍니다
+# (현재 1분봉은 조회마다 바뀌어 그대로 넣으면 같은 분 안에서만 적중).
+# 30분봉 200개는 봉마다 1회만 받아 두고, 같은 봉 안의 스캔은 1분봉으로 진행 중 봉만 다시 합성합니다.
+# 판단 로직/임계값을 바꾸면 이 값을 올려서 기존 메모를 무효화합니다.
+BUY_SIGNAL_PARAM_VERSION = 3
+BUY_SIGNAL_MEMO_MAX = 1024  # LRU 최대 보관 개수 (KRW 전 종목 수 대비 여유)
+BAR_SEC_30M = 1800
+LIVE_1M_LIMIT = 31  # 진행 중 30분봉 전체(1분봉 최대 30개) + 현재 1분봉
+LIVE_PRICE_SIG_DIGITS = 4  # 진행 중 봉 가격 유효숫자 (빗썸 호가 단위 수준, 오차 0.05% 이내)
+LIVE_VOL_SIG_DIGITS = 3  # 진행 중 봉 거래량 유효숫자 (거래량 배수 판단 오차 0.5% 이내)
+_buy_signal_memo = OrderedDict()
+_scan_candles = {}  # symbol -> (받은 시점의 마지막 확정봉 시각, Candles)
+_scan_candles_bar_ts = None  # _scan_candles를 마지막으로 정리한 확정봉 시각
+
+
+def get_last_closed_bar_ts(timeframe_sec=BAR_SEC_30M, now_ts=None):
+    """마지막 확정봉의 시작 시각(ms). 거래소 캔들 시각과 같은 epoch 기준입니다."""
+    now_ts = time.time() if now_ts is None else now_ts
+    current_open = int(now_ts // timeframe_sec) * timeframe_sec
+    return (current_open - timeframe_sec) * 1000
+
+
+def get_warning_version(warning_list):
+    """유의종목 목록 내용이 같으면 같은 버전 값을 돌려줍니다."""
+    return hash(frozenset(warning_list or ()))
+
+
+def make_buy_signal_key(symbol, bar_ts, warning_version, live_sig=None):
+    return (symbol, bar_ts, warning_version, BUY_SIGNAL_PARAM_VERSION, live_sig)
+
+
+def _round_sig(value, digits):
+    return float(f"{value:.{digits}g}")
+
+
+def surge_1m_possible(curr_price, ohlcv_1m):
+    """check_buy_signal의 1분봉 수급 돌파 전제(1분봉 거래량 20봉 평균 300% + 3분 내 3% 급등) 성립 여부"""
+    if not ohlcv_1m or len(ohlcv_1m) < 21:
+        return False
+    vol_avg_20 = sum(r[5] for r in ohlcv_1m[-20:]) / 20
+    price_3bars_ago = ohlcv_1m[-4][4]
+    return (vol_avg_20 > 0 and ohlcv_1m[-1][5] >= vol_avg_20 * 3
+            and price_3bars_ago > 0 and (curr_price - price_3bars_ago) / price_3bars_ago >= 0.03)
+
+
+def live_signature(candles, ohlcv_1m):
+    """
+    메모 키용 진행 중 봉 요약: (봉 시각, 반올림한 OHLC, 반올림한 거래량, 1분봉 부분).
+    1분봉 부분은 수급 돌파 전제가 성립할 때만 1분봉 전체(RSI까지 판단에 쓰이므로), 아니면 None
+    """
+    o, h, l, c, v = candles.values[-1].tolist()
+    prices = tuple(_round_sig(x, LIVE_PRICE_SIG_DIGITS) for x in (o, h, l, c))
+    one_min = tuple(tuple(r) for r in ohlcv_1m) if surge_1m_possible(c, ohlcv_1m) else None
+    return int(candles.time[-1]), prices, _round_sig(v, LIVE_VOL_SIG_DIGITS), one_min
+
+
+def get_scan_candles(symbol, bar_ts):
+    """같은 확정봉 구간에 받아 둔 30분봉 (없거나 봉이 바뀌었으면 None)"""
+    cached = _scan_candles.get(symbol)
+    return cached[1] if cached and cached[0] == bar_ts else None
+
+
+def put_scan_candles(symbol, bar_ts, candles):
+    global _scan_candles_bar_ts
+    if bar_ts != _scan_candles_bar_ts:
+        # 새 확정봉 구간: 지난 구간 캔들은 다시 쓰지 않으므로 정리 (스캔에서 빠진 종목이 계속 쌓이지 않게)
+        for sym in [s for s, (ts, _) in _scan_candles.items() if ts != bar_ts]:
+            del _scan_candles[sym]
+        _scan_candles_bar_ts = bar_ts
+    _scan_candles[symbol] = (bar_ts, candles)
+
+
+def with_live_bar(candles, ohlcv_1m, bar_ts, timeframe_sec=BAR_SEC_30M):
+    """
+    받아 둔 30분봉의 진행 중 봉을 1분봉으로 다시 합성한 Candles.
+    1분봉이 진행 중 봉 시작부터 덮지 못하면(조회 실패·개수 부족) None → 호출부가 30분봉을 새로 조회
+    """
+    open_ts = bar_ts + timeframe_sec * 1000
+    if not ohlcv_1m or ohlcv_1m[0][0] > open_ts:
+        return None
+    rows = [r for r in ohlcv_1m if r[0] >= open_ts]
+    if not rows:  # 봉 시작 후 체결 없음
+        return candles if candles.time[-1] < open_ts else None
+    live = [open_ts, rows[0][1], max(r[2] for r in rows), min(r[3] for r in rows), rows[-1][4], sum(r[5] for r in rows)]
+    return candles.with_tail([live])
+
+
+def get_memo_buy_signal(key):
+    """메모 적중 시 (is_buy, reason, grade, data_dict) 반환, 없으면 None"""
+    result = _buy_signal_memo.get(key)
+    if result is not None:
+        _buy_signal_memo.move_to_end(key)
+    return result
+
+
+def put_memo_buy_signal(key, result):
+    _buy_signal_memo[key] = result
+    _buy_signal_memo.move_to_end(key)
+    while len(_buy_signal_memo) > BUY_SIGNAL_MEMO_MAX:
+        _buy_signal_memo.popitem(last=False)
+
+
 # [사용자 원본 버전 2 - 메인 사용 중인 로직]
 # [확장] 하락장 대응 + 정배열 전환 + 급등 추적 모두 반영. 기존 로직 삭제 없이 주석/분기로 보강.
 def check_buy_signal(df, symbol, warning_list, df_1m=None):
@@ -205,6 +423,16 @@ def check_buy_signal(df, symbol, warning_list, df_1m=None):
     if len(df) < 185:
         return False, "데이터부족", "", data_dict
 
+    # [가격 필터] 10원 미만 또는 10,000원 이상 → BTC 마켓 동전주/비정상 차단
+    # (지표 계산 전에 먼저 검사: 탈락 종목은 DataFrame 뷰/지표 컬럼 생성 자체를 생략)
+    last_close = df.last_close() if isinstance(df, Candles) else float(df['close'].iloc[-1])
+    if last_close < MIN_BUY_PRICE or last_close >= MAX_BUY_PRICE:
+        return False, "가격필터(BTC마켓)", "", data_dict
+
+    # Candles(경량 캔들)로 받은 경우 복사 없는 DataFrame 뷰로 변환
+    df = as_frame(df)
+    df_1m = as_frame(df_1m)
+
     # [기존 유지] 40/185일선 + RSI
     df['ma40'] = df['close'].rolling(40).mean()
     df['ma185'] = df['close'].rolling(185).mean()
@@ -219,18 +447,15 @@ def check_buy_signal(df, symbol, warning_list, df_1m=None):
     prev = df.iloc[-2]
     curr_price = float(curr['close'])
 
-    # [가격 필터] 10원 미만 또는 10,000원 이상 → BTC 마켓 동전주/비정상 차단
-    if curr_price < 10 or curr_price >= 10000:
-        return False, "가격필터(BTC마켓)", "", data_dict
-
     # [유의 종목] 수급 돌파(S/S+) 포함 모든 매수 신호에서 투자유의 종목 제외 (먼저 검사)
-    if symbol.split('/')[0] in warning_list:
+    is_warning = symbol.split('/')[0] in warning_list
+    if is_warning:
         return False, "투자유의", "F", data_dict
 
     # ---------- [개선] 수급 돌파: 1분봉 기준 (RSI 과열 및 고점 추격 방지 추가) ----------
     if df_1m is not None and len(df_1m) >= 21:
         # 유의종목이면 수급 로직 타기 전에 즉시 차단
-        if symbol.split('/')[0] in warning_list:
+        if is_warning:
             return False, "유의종목차단(S)", "", data_dict
 
         vol_avg_20 = df_1m['vol'].tail(20).mean()
@@ -260,7 +485,7 @@ def check_buy_signal(df, symbol, warning_list, df_1m=None):
 # ---------- [기존 유지 및 보강] 30분봉 기준 S+ 수급 ----------
     if len(df) >= 5:
         # 유의종목 차단
-        if symbol.split('/')[0] in warning_list:
+        if is_warning:
             return False, "유의종목차단(S+)", "", data_dict
 
         # [추가] 골크 전조 10봉 포함, 최근 15봉 내 최고가 계산 (설거지 방지용 기준점)
@@ -504,6 +729,7 @@ def check_2_negative_candles(df):
 # ---------------------------------------------------------
 async def check_sell_signal(exchange, df, symbol, purchase_price, symbol_inventory_age=99, status=None):
     global emergency_mode
+    df = as_frame(df)
     
     # [유지] 지표 계산
     df['ma40'] = df['close'].rolling(40).mean()
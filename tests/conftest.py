@@ -0,0 +1,15 @@
+import logging
+import os
+import sys
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import config  # noqa: F401
+except ImportError:
+    # config.py(API 키·텔레그램 토큰)는 저장소에 없음 → 모듈 import에 필요한 로거·거래소 자리만 채움
+    config = types.ModuleType('config')
+    config.logger = logging.getLogger('trading_bot_test')
+    config.exchange = None
+    sys.modules['config'] = config
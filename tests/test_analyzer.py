@@ -0,0 +1,64 @@
+import csv
+
+import pytest
+
+import analyzer
+
+OLD_HEADER = analyzer.MISSED_HEADER[:14]
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(analyzer, '_missed_header_checked', False)
+    monkeypatch.setattr(analyzer, '_open_runs', {})
+    return tmp_path
+
+
+def read_rows():
+    with open(analyzer.CSV_FILE, newline='', encoding='utf-8') as f:
+        return list(csv.reader(f))
+
+
+def record(reason, price=1000, rsi=40.0):
+    return analyzer.record_missed_opportunity('A/KRW', reason, price, {'rsi': rsi, 'grade': 'B'})
+
+
+def test_old_header_is_migrated_and_rows_kept(workdir):
+    old_row = ['2024-01-01 00:00:00', 'A/KRW', 'old', '1,000'] + [''] * 10
+    with open(analyzer.CSV_FILE, 'w', newline='', encoding='utf-8') as f:
+        csv.writer(f).writerows([OLD_HEADER, old_row])
+    record('거래량 부족(0.5배)')
+    analyzer.flush_missed_runs()
+    rows = read_rows()
+    assert rows[0] == analyzer.MISSED_HEADER
+    assert rows[1] == old_row
+    assert len(rows[2]) == len(analyzer.MISSED_HEADER)
+
+
+def test_repeats_collapse_into_one_row_with_first_and_last_reason(workdir):
+    assert record('거래량 부족(0.5배)') is not None
+    assert record('거래량 부족(0.6배)', price=1001) is None  # 같은 범주·허용 오차 이내 → 구간 반복
+    assert record('거래량 부족(0.7배)', price=1002) is None
+    analyzer.flush_missed_runs()
+    header, row = read_rows()
+    row = dict(zip(header, row))
+    assert (row['탈락사유'], row['마지막사유'], row['반복횟수']) == ('거래량 부족(0.5배)', '거래량 부족(0.7배)', '3')
+
+
+def test_state_change_closes_run(workdir):
+    record('거래량 부족(0.5배)')
+    record('거래량 부족(0.5배)', rsi=50.0)  # RSI 변화가 허용 오차 초과 → 새 구간
+    analyzer.flush_missed_runs()
+    rows = read_rows()[1:]
+    assert [r[-2] for r in rows] == ['1', '1']
+
+
+def test_open_runs_survive_snapshot_restore(workdir):
+    record('거래량 부족(0.5배)')
+    saved = {s: {**r, 'key': list(r['key'])} for s, r in analyzer.missed_runs_snapshot().items()}  # JSON 왕복 모사
+    analyzer.restore_missed_runs(saved)
+    assert record('거래량 부족(0.9배)') is None
+    analyzer.flush_missed_runs()
+    header, row = read_rows()
+    assert dict(zip(header, row))['반복횟수'] == '2'
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import label_signals
+
+
+def candles(symbol, start, closes, tf=30):
+    """시가 시각(UTC) 기준 봉. 고가=종가+1, 저가=종가-1"""
+    times = pd.date_range(pd.Timestamp(start) - label_signals.LOCAL_UTC_OFFSET, periods=len(closes), freq=f'{tf}min')
+    df = pd.DataFrame({'symbol': symbol, 'time': times, 'open': closes, 'high': np.add(closes, 1),
+                       'low': np.subtract(closes, 1), 'close': closes, 'vol': 1.0})
+    return df
+
+
+def frame(*parts):
+    df = pd.concat(parts, ignore_index=True)
+    df['symbol'] = df['symbol'].astype('category')
+    return df.sort_values(['symbol', 'time'], ignore_index=True)
+
+
+def records(rows):
+    return pd.DataFrame([{'symbol': s, 'time': pd.Timestamp(t), 'entry_price': p} for s, t, p in rows])
+
+
+def test_no_lookahead_into_unclosed_bar():
+    # 봉 시각은 시가 시각: 08:00 봉 종가 140은 08:30에야 확정 → 07:50 기록의 15분 뒤(08:05)는 07:30 봉(08:00 마감) 종가
+    c = frame(candles('A/KRW', '2024-01-01 07:00', [100, 130, 140, 150]))
+    out = label_signals.label(records([('A/KRW', '2024-01-01 07:50', 100)]), c, 30, {'15m': 15, '60m': 60})
+    row = out.iloc[0]
+    assert (row['ret_15m'], row['mfe_15m'], row['mae_15m']) == (pytest.approx(30.0), pytest.approx(31.0), pytest.approx(29.0))
+    # 08:50까지 마감된 마지막 봉은 08:00 봉(08:30 마감)
+    assert row['ret_60m'] == pytest.approx(40.0)
+    assert (row['mfe_60m'], row['mae_60m']) == (pytest.approx(41.0), pytest.approx(29.0))
+
+
+def test_horizon_without_a_newly_closed_bar_is_nan_for_all_labels():
+    c = frame(candles('A/KRW', '2024-01-01 07:00', [100, 130, 140]))
+    out = label_signals.label(records([('A/KRW', '2024-01-01 07:35', 100)]), c, 30, {'15m': 15})
+    row = out.iloc[0]
+    assert np.isnan(row['ret_15m']) and np.isnan(row['mfe_15m']) and np.isnan(row['mae_15m'])
+
+
+def test_bar_closing_exactly_at_record_time_is_base():
+    c = frame(candles('A/KRW', '2024-01-01 07:00', [100, 110, 120]))
+    out = label_signals.label(records([('A/KRW', '2024-01-01 07:30', 100)]), c, 30, {'30m': 30})
+    row = out.iloc[0]
+    assert row['ret_30m'] == pytest.approx(10.0)
+    assert (row['mfe_30m'], row['mae_30m']) == (pytest.approx(11.0), pytest.approx(9.0))
+
+
+def test_symbols_do_not_mix_and_missing_candles_give_nan():
+    c = frame(candles('A/KRW', '2024-01-01 07:00', [100, 100, 100]),
+              candles('B/KRW', '2024-01-01 07:00', [10, 20, 30]))
+    out = label_signals.label(records([('A/KRW', '2024-01-01 07:30', 100), ('B/KRW', '2024-01-01 07:30', 10),
+                                       ('B/KRW', '2024-01-01 09:00', 30), ('C/KRW', '2024-01-01 07:30', 1)]),
+                              c, 30, {'30m': 30})
+    by_symbol = out.set_index(['symbol', 'time'])['ret_30m']
+    assert by_symbol[('A/KRW', pd.Timestamp('2024-01-01 07:30'))] == pytest.approx(0.0)
+    assert by_symbol[('B/KRW', pd.Timestamp('2024-01-01 07:30'))] == pytest.approx(100.0)
+    assert np.isnan(by_symbol[('B/KRW', pd.Timestamp('2024-01-01 09:00'))])  # 이후 봉 없음
+    assert 'C/KRW' not in set(out['symbol'])  # 캔들 없는 종목은 제외
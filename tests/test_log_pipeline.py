@@ -0,0 +1,34 @@
+import io
+import json
+import logging
+
+import log_pipeline
+
+
+def test_sampling_applies_to_json_log_only(tmp_path):
+    target = logging.getLogger('log_pipeline_test')
+    target.setLevel(logging.INFO)
+    target.propagate = False
+    text = io.StringIO()
+    target.addHandler(logging.StreamHandler(text))
+    json_file = tmp_path / 'bot.jsonl'
+    log_pipeline.install(target, json_file=str(json_file), sample_every={'분석기록': 10})
+    try:
+        for i in range(20):
+            target.info(f"[분석기록] A/KRW {i}")
+        target.warning("[분석기록] 경고는 항상 기록")
+        target.info("[주문엔진] 접수")
+    finally:
+        log_pipeline.stop()
+        for h in list(target.handlers):
+            target.removeHandler(h)
+
+    lines = text.getvalue().splitlines()
+    assert len(lines) == 22  # 텍스트 로그는 전부
+    entries = [json.loads(l) for l in json_file.read_text(encoding='utf-8').splitlines()]
+    assert [(e['cat'], e['msg'], e.get('sampled')) for e in entries] == [
+        ('분석기록', '[분석기록] A/KRW 0', 10),
+        ('분석기록', '[분석기록] A/KRW 10', 10),
+        ('분석기록', '[분석기록] 경고는 항상 기록', None),
+        ('주문엔진', '[주문엔진] 접수', None),
+    ]
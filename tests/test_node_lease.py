@@ -0,0 +1,47 @@
+import sqlite3
+
+import pytest
+
+import node_lease
+
+
+@pytest.fixture
+def coordinated(tmp_path, monkeypatch):
+    monkeypatch.setattr(node_lease, 'COORDINATION_ENABLED', True)
+    monkeypatch.setattr(node_lease, 'LEASE_DB_FILE', str(tmp_path / 'leases.db'))
+
+
+def test_order_lock_is_not_reentrant_and_release_needs_token(coordinated):
+    first = node_lease.try_acquire_order_lock('A/KRW')
+    assert first
+    assert node_lease.try_acquire_order_lock('A/KRW') is None  # 같은 노드의 두 번째 호출자도 대기
+    node_lease.release_order_lock('A/KRW', 'someone-else')
+    assert node_lease.try_acquire_order_lock('A/KRW') is None  # 다른 토큰으로는 해제 안 됨
+    node_lease.release_order_lock('A/KRW', first)
+    assert node_lease.try_acquire_order_lock('A/KRW')
+
+
+def test_stale_holder_cannot_release_successor_lock(coordinated):
+    old = node_lease.try_acquire_order_lock('A/KRW')
+    conn = sqlite3.connect(node_lease.LEASE_DB_FILE)
+    conn.execute("UPDATE order_locks SET expires = 0")  # 만료 재현
+    conn.commit()
+    conn.close()
+    new = node_lease.try_acquire_order_lock('A/KRW')  # 만료된 락을 인수
+    assert new and new != old
+    node_lease.release_order_lock('A/KRW', old)  # 늦게 끝난 이전 보유자
+    assert node_lease.try_acquire_order_lock('A/KRW') is None
+
+
+def test_old_schema_gets_token_column(coordinated):
+    conn = sqlite3.connect(node_lease.LEASE_DB_FILE)
+    conn.execute("CREATE TABLE order_locks (symbol TEXT PRIMARY KEY, node_id TEXT, expires REAL)")
+    conn.close()
+    token = node_lease.try_acquire_order_lock('A/KRW')
+    node_lease.release_order_lock('A/KRW', token)
+    assert node_lease.try_acquire_order_lock('A/KRW')
+
+
+def test_disabled_coordination_always_grants(monkeypatch):
+    monkeypatch.setattr(node_lease, 'COORDINATION_ENABLED', False)
+    assert node_lease.try_acquire_order_lock('A/KRW') and node_lease.try_acquire_order_lock('A/KRW')
@@ -0,0 +1,81 @@
+import os
+
+import pytest
+
+import order_book
+
+UPDATES = os.path.join(os.path.dirname(__file__), 'data', 'book_updates.jsonl')
+
+
+def levels(book):
+    return list(zip(book._bid_px, book._bid_qty)), list(zip(book._ask_px, book._ask_qty))
+
+
+@pytest.fixture
+def replayed():
+    applied = []
+    books = order_book.replay(UPDATES, on_update=lambda book, ok: applied.append((book.symbol, book.seq, ok)))
+    return books, applied
+
+
+def test_replay_rebuilds_final_book(replayed):
+    books, _ = replayed
+    a = books['A/KRW']
+    assert levels(a) == ([(97, 5), (98, 4), (99, 2), (100, 1)], [(101, 1), (102, 3), (105, 10)])
+    assert (a.best_bid(), a.best_ask(), a.seq, a.stale) == (100, 101, 112, False)
+    # 수량 0 호가는 스냅샷에서 제외, nonce가 없으면 timestamp를 시퀀스로
+    b = books['B/KRW']
+    assert levels(b) == ([(9, 3)], [(11, 2)])
+    assert b.seq == 1700000000500 and b.mid_price() == 10
+
+
+def test_sequence_gap_goes_stale_until_next_snapshot(replayed):
+    _, applied = replayed
+    a_updates = [(seq, ok) for symbol, seq, ok in applied if symbol == 'A/KRW']
+    # 101·102 연속 반영 → 104(103 누락)부터 stale로 무시 → 110 스냅샷으로 재동기화 → 늦게 온 108 스냅샷 무시 → 111·112 반영
+    assert [ok for _, ok in a_updates] == [True, True, True, False, False, True, False, True, True]
+    assert a_updates[3] == (102, False)  # 끊긴 델타는 시퀀스를 올리지 않음
+
+
+def test_delta_gap_marks_book_stale():
+    book = order_book.L2Book.from_snapshot('X/KRW', {'bids': [[1, 1]], 'asks': [[2, 1]], 'nonce': 5})
+    assert book.apply_delta(6, 'bid', 1.5, 2)
+    assert not book.apply_delta(8, 'ask', 1.8, 1)
+    assert book.stale and not book.is_fresh()
+    assert not book.apply_delta(9, 'ask', 1.8, 1)  # 스냅샷 전까지 연속이어도 반영 안 함
+    assert book.apply_snapshot({'bids': [[1, 1]], 'asks': [[2, 1]], 'nonce': 3})  # stale이면 시퀀스가 낮아도 재동기화
+    assert book.is_fresh()
+
+
+def test_depth_to_price(replayed):
+    a = replayed[0]['A/KRW']
+    assert a.depth_to_price('buy', 102) == 4
+    assert a.depth_to_price('buy', 101.5) == 1
+    assert a.depth_to_price('buy', 100) == 0
+    assert a.depth_to_price('sell', 98) == 7
+    assert a.depth_to_price('sell', 100.5) == 0
+
+
+def test_vwap_for_qty(replayed):
+    a = replayed[0]['A/KRW']
+    avg, best, slip = a.vwap_for_qty('buy', 4)
+    assert (avg, best) == (101.75, 101)
+    assert slip == pytest.approx(0.75 / 101 * 100)
+    assert a.vwap_for_qty('buy', 5)[0] == pytest.approx(512 / 5)
+    # 깊이를 넘는 수량은 마지막 호가로 체결 가정
+    assert a.vwap_for_qty('buy', 20)[0] == pytest.approx((1457 + 6 * 105) / 20)
+    avg, best, slip = a.vwap_for_qty('sell', 3)
+    assert best == 100 and avg == pytest.approx(298 / 3)
+    assert slip == pytest.approx(-2 / 3)
+    assert a.vwap_for_qty('sell', 0) is None
+
+
+def test_max_qty_within_impact(replayed):
+    a = replayed[0]['A/KRW']
+    # 100x1 + 99x2 + 98x1 → 평균 99 (최우선 100 대비 -1%)
+    assert a.max_qty_within_impact('sell', 1.0) == pytest.approx(4)
+    qty = a.max_qty_within_impact('buy', 1.0)
+    assert 4 < qty < 5
+    assert a.vwap_for_qty('buy', qty)[2] == pytest.approx(1.0)
+    assert a.max_qty_within_impact('buy', 50) == 14
+    assert order_book.L2Book('E/KRW').max_qty_within_impact('sell', 1.0) == 0.0
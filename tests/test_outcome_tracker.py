@@ -0,0 +1,36 @@
+import asyncio
+import time
+
+import analyzer
+import outcome_tracker
+
+
+def test_batched_entries_are_never_checked_before_due(monkeypatch):
+    monkeypatch.setattr(outcome_tracker, '_heap', [])
+    monkeypatch.setattr(outcome_tracker, 'BATCH_WINDOW_SEC', 0.3)
+    fetches, checks = [], []
+
+    async def fetch_prices(symbols):
+        fetches.append((time.time(), symbols))
+        return {s: 110.0 for s in symbols}
+
+    def record(symbol, rec_time, price_at, price_later, record_id, horizon_min, check_delay_sec):
+        checks.append((record_id, check_delay_sec))
+
+    monkeypatch.setattr(outcome_tracker, '_fetch_prices', fetch_prices)
+    monkeypatch.setattr(analyzer, 'update_missed_opportunity_return', record)
+
+    async def run():
+        now = time.time()
+        for record_id, symbol, after in (('a', 'A/KRW', 0.05), ('b', 'B/KRW', 0.25), ('c', 'C/KRW', 0.6)):
+            outcome_tracker.schedule(record_id, symbol, 100.0, recorded_ts=now, horizon_sec=after)
+        task = asyncio.ensure_future(outcome_tracker.outcome_task())
+        await asyncio.sleep(0.9)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+    assert [symbols for _, symbols in fetches] == [['A/KRW', 'B/KRW'], ['C/KRW']]  # a·b는 한 번에, c는 창 밖
+    assert [record_id for record_id, _ in checks] == ['a', 'b', 'c']
+    assert all(delay >= 0 for _, delay in checks)
+    assert checks[0][1] >= 0.19  # a는 b의 만기까지 기다림
@@ -0,0 +1,108 @@
+import random
+
+import pytest
+
+import position_ledger as ledger
+
+
+@pytest.fixture(autouse=True)
+def empty_ledger():
+    ledger.restore(None)
+    yield
+    ledger.restore(None)
+
+
+def fill(symbol, side, qty, price):
+    ledger.apply_fill({'symbol': symbol, 'side': side, 'filled': qty, 'average': price})
+
+
+def recomputed():
+    """장부 종목 값으로 처음부터 다시 계산한 합계"""
+    cost = sum(p['qty'] * p['avg_price'] for p in ledger.positions.values())
+    unrealized = sum((p['last_price'] - p['avg_price']) * p['qty']
+                     for p in ledger.positions.values() if p['last_price'] and p['avg_price'] > 0)
+    return cost, unrealized
+
+
+@pytest.mark.parametrize('fills, qty, avg_price, realized, held', [
+    ([('buy', 10, 100)], 10, 100, 0, True),
+    ([('buy', 10, 100), ('buy', 30, 200)], 40, 175, 0, True),  # 가중평균
+    ([('buy', 10, 100), ('sell', 4, 150)], 6, 100, 200, True),  # 평단 유지, 실현손익 확정
+    ([('buy', 10, 100), ('sell', 10, 90)], None, None, -100, False),  # 전량 매도 → 장부에서 제거
+    ([('buy', 10, 100), ('sell', 20, 110)], None, None, 100, False),  # 보유분 초과 체결은 보유분만 실현
+    ([('buy', 10, 100), ('sell', 10 - ledger.QTY_EPS / 2, 100)], None, None, 0, False),  # 잔량이 QTY_EPS 이하
+    ([('sell', 5, 100)], None, None, 0, False),  # 장부에 없는 종목 매도는 무시
+    ([('buy', 0, 100), ('buy', 5, 0)], None, None, 0, False),  # 체결 없음
+])
+def test_apply_fill(fills, qty, avg_price, realized, held):
+    for side, q, p in fills:
+        fill('A/KRW', side, q, p)
+    pos = ledger.get('A/KRW')
+    assert (pos is not None) is held
+    if held:
+        assert pos['qty'] == pytest.approx(qty)
+        assert pos['avg_price'] == pytest.approx(avg_price)
+        assert pos['last_price'] == fills[-1][2]
+    assert ledger.portfolio()['realized'] == pytest.approx(realized)
+    cost, unrealized = recomputed()
+    assert ledger.portfolio()['cost'] == pytest.approx(cost)
+    assert ledger.portfolio()['unrealized'] == pytest.approx(unrealized)
+
+
+@pytest.mark.parametrize('inventory, balance_avg, expected_avg, grade', [
+    ({'A/KRW': {'purchase_price': 120, 'grade': 'S', 'purchase_time': '2024-01-01 00:00:00'}}, 100, 120, 'S'),
+    ({'A': {'avg_price': 130}}, 100, 130, 'A'),  # 코인명 키 인벤토리
+    ({}, 100, 100, 'A'),  # 인벤토리 없으면 거래소 평단
+])
+def test_reconcile_adds_new_position_from_inventory(inventory, balance_avg, expected_avg, grade):
+    ledger.reconcile({'A/KRW': {'total': 3, 'avg_price': balance_avg}}, inventory)
+    pos = ledger.get('A/KRW')
+    assert (pos['qty'], pos['avg_price'], pos['grade']) == (3, expected_avg, grade)
+    assert ledger.portfolio()['cost'] == pytest.approx(3 * expected_avg)
+
+
+def test_reconcile_skips_recent_fill_then_adjusts(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ledger.time, 'time', lambda: now[0])
+    fill('A/KRW', 'buy', 10, 100)
+    ledger.reconcile({'A/KRW': {'total': 4, 'avg_price': 90}})  # 거래소 잔고 반영 지연 구간
+    assert ledger.get('A/KRW')['qty'] == 10
+    ledger.reconcile({})  # 잔고에 없어도 유예 중이면 유지
+    assert ledger.get('A/KRW') is not None
+
+    now[0] += ledger.RECONCILE_GRACE_SEC
+    ledger.reconcile({'A/KRW': {'total': 4, 'avg_price': 90}})
+    pos = ledger.get('A/KRW')
+    assert (pos['qty'], pos['avg_price']) == (4, 100)  # 수량만 잔고로, 아는 평단은 유지
+    assert ledger.portfolio()['cost'] == pytest.approx(400)
+
+
+def test_reconcile_drops_symbols_missing_from_balance_and_keeps_realized(monkeypatch):
+    monkeypatch.setattr(ledger.time, 'time', lambda: 1000.0)
+    fill('A/KRW', 'buy', 10, 100)
+    fill('A/KRW', 'sell', 5, 120)
+    ledger.reconcile({'B/KRW': {'total': 1, 'avg_price': 50}})
+    monkeypatch.setattr(ledger.time, 'time', lambda: 1000.0 + ledger.RECONCILE_GRACE_SEC)
+    ledger.reconcile({'B/KRW': {'total': 1, 'avg_price': 50}})
+    assert set(ledger.positions) == {'B/KRW'}
+    book = ledger.portfolio()
+    assert (book['positions'], book['cost'], book['realized']) == (1, pytest.approx(50), pytest.approx(100))
+
+
+def test_portfolio_totals_match_full_recompute_after_many_ticks():
+    rng = random.Random(7)
+    symbols = [f"C{i}/KRW" for i in range(20)]
+    for s in symbols:
+        fill(s, 'buy', rng.uniform(1, 100), rng.uniform(10, 5000))
+    for i in range(20_000):
+        s = rng.choice(symbols)
+        if i % 1000 == 0 and ledger.get(s):
+            fill(s, 'sell', ledger.get(s)['qty'] / 2, rng.uniform(10, 5000))
+        ledger.update_price(s, rng.uniform(10, 5000))
+    ledger.update_price('NOT/KRW', 123)  # 보유하지 않은 종목 틱은 무시
+    cost, unrealized = recomputed()
+    book = ledger.portfolio()
+    assert book['cost'] == pytest.approx(cost, rel=1e-9)
+    assert book['unrealized'] == pytest.approx(unrealized, rel=1e-9, abs=1e-6)
+    assert book['value'] == pytest.approx(cost + unrealized, rel=1e-9)
+    assert book['unrealized_pct'] == pytest.approx(unrealized / cost * 100, rel=1e-9, abs=1e-9)
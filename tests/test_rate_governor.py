@@ -0,0 +1,171 @@
+import types
+
+import pytest
+
+import rate_governor as rg
+import session_replay
+
+
+class RateLimitExceeded(Exception):
+    pass
+
+
+class BadSymbol(Exception):
+    pass
+
+
+@pytest.fixture
+def loop(monkeypatch):
+    """가상 시계 루프 + 같은 시계를 쓰는 rate_governor (대기 시간을 실제로 기다리지 않고 결과가 매번 같음)"""
+    vloop = session_replay.VirtualTimeLoop()
+    monkeypatch.setattr(rg, 'time', types.SimpleNamespace(monotonic=vloop.time, time=lambda: 1_700_000_000 + vloop.time()))
+    monkeypatch.setattr(rg, '_buckets', {n: rg._Bucket(n, rate, burst) for n, (rate, burst) in rg.BUCKET_LIMITS.items()})
+    for name in ('_breakers', '_last_good', '_inflight', '_wait_stats'):
+        monkeypatch.setattr(rg, name, {})
+    yield vloop
+    vloop.close()
+
+
+def named(name, fn):
+    fn.__name__ = name
+    return fn
+
+
+def run(loop, coro):
+    return loop.run_until_complete(coro)
+
+
+def test_waiters_are_served_by_priority_then_arrival(loop):
+    bucket = rg._buckets['public']
+    bucket.tokens, bucket.updated = 0.0, loop.time()
+    served = []
+
+    async def scenario():
+        import asyncio
+        calls = [(rg.PRIORITY_ANALYTICS, 'a'), (rg.PRIORITY_SCAN, 's1'), (rg.PRIORITY_MONITOR, 'm'),
+                 (rg.PRIORITY_ORDER, 'o'), (rg.PRIORITY_SCAN, 's2')]
+        await asyncio.gather(*(rg.call(p, named(f"get_{tag}", lambda tag=tag: served.append(tag))) for p, tag in calls))
+
+    start = loop.time()
+    run(loop, scenario())
+    assert served == ['o', 'm', 's1', 's2', 'a']
+    # 토큰 0개에서 5건 → 초당 rate로 한 건씩
+    assert loop.time() - start == pytest.approx(5 / bucket.rate, rel=0.01)
+    stats = rg.wait_stats()
+    assert stats['분석']['max_ms'] > stats['주문']['max_ms']
+
+
+def test_throttle_pauses_halves_rate_and_recovers(loop):
+    bucket = rg._buckets['private']
+    fail = named('fetch_balance', lambda: (_ for _ in ()).throw(RateLimitExceeded("429 Too Many Requests")))
+    ok = named('fetch_balance', lambda: {'ok': True})
+
+    pauses, rates = [], []
+    for _ in range(5):
+        with pytest.raises(RateLimitExceeded):
+            run(loop, rg.call(rg.PRIORITY_MONITOR, fail))
+        pauses.append(round(bucket.paused_until - loop.time(), 3))
+        rates.append(bucket.rate)
+        assert bucket.tokens == 0.0
+    assert pauses == [1.0, 2.0, 4.0, 8.0, 16.0]
+    assert rates == [4.0, 2.0, 1.0, pytest.approx(0.8), pytest.approx(0.8)]  # 하한: 기본 속도의 MIN_RATE_RATIO
+
+    before = loop.time()
+    assert run(loop, rg.call(rg.PRIORITY_MONITOR, ok)) == {'ok': True}
+    assert loop.time() - before >= 16.0  # 정지가 끝난 뒤에야 통과
+    assert bucket.strikes == 0
+    assert bucket.rate == pytest.approx(0.8 + bucket.base_rate * rg.RECOVER_STEP_RATIO)
+    # 스로틀은 차단기 실패로 세지 않음
+    assert rg._breakers['fetch_balance']['opened_at'] is None
+
+
+def open_breaker(loop, name='fetch_ticker'):
+    state = {'fail': False}
+
+    def fn(symbol):
+        if state['fail']:
+            raise ConnectionError("exchange down")
+        return {'symbol': symbol, 'last': 100}
+    fn = named(name, fn)
+    assert run(loop, rg.call(rg.PRIORITY_SCAN, fn, 'A/KRW'))['last'] == 100  # 마지막 정상 결과 캐시
+    state['fail'] = True
+    for _ in range(rg.BREAKER_FAIL_THRESHOLD):
+        with pytest.raises(ConnectionError):
+            run(loop, rg.call(rg.PRIORITY_MONITOR, fn, 'A/KRW'))
+    assert rg._breakers[name]['opened_at'] is not None
+    return fn, state
+
+
+def test_open_breaker_serves_cache_only_to_scan_and_analytics(loop):
+    fn, _ = open_breaker(loop)
+    for priority in (rg.PRIORITY_SCAN, rg.PRIORITY_ANALYTICS):
+        assert run(loop, rg.call(priority, fn, 'A/KRW')) == {'symbol': 'A/KRW', 'last': 100}
+    for priority in (rg.PRIORITY_ORDER, rg.PRIORITY_MONITOR):
+        with pytest.raises(rg.CircuitOpenError):
+            run(loop, rg.call(priority, fn, 'A/KRW'))
+    with pytest.raises(rg.CircuitOpenError):  # 캐시가 없는 인자
+        run(loop, rg.call(rg.PRIORITY_SCAN, fn, 'B/KRW'))
+
+
+def test_stale_cache_is_not_served(loop, monkeypatch):
+    fn, _ = open_breaker(loop)
+    monkeypatch.setattr(rg, 'BREAKER_CACHE_MAX_AGE_SEC', 0)
+    loop.vtime += 1
+    with pytest.raises(rg.CircuitOpenError):
+        run(loop, rg.call(rg.PRIORITY_SCAN, fn, 'A/KRW'))
+
+
+@pytest.mark.parametrize('trial_ok', [True, False])
+def test_half_open_allows_one_trial(loop, trial_ok):
+    fn, state = open_breaker(loop, 'fetch_markets')
+    loop.vtime += rg.BREAKER_OPEN_SEC
+    state['fail'] = not trial_ok
+    breaker = rg._breakers['fetch_markets']
+    if trial_ok:
+        assert run(loop, rg.call(rg.PRIORITY_MONITOR, fn, 'A/KRW'))['last'] == 100
+        assert breaker['opened_at'] is None and breaker['fails'] == 0
+    else:
+        with pytest.raises(ConnectionError):
+            run(loop, rg.call(rg.PRIORITY_MONITOR, fn, 'A/KRW'))
+        assert breaker['opened_at'] == pytest.approx(loop.time(), abs=0.01)  # 시험 실패 → 다시 차단
+        with pytest.raises(rg.CircuitOpenError):
+            run(loop, rg.call(rg.PRIORITY_MONITOR, fn, 'A/KRW'))
+
+
+def test_request_errors_do_not_trip_breaker(loop):
+    fn = named('fetch_ticker', lambda symbol: (_ for _ in ()).throw(BadSymbol(symbol)))
+    for _ in range(rg.BREAKER_FAIL_THRESHOLD + 2):
+        with pytest.raises(BadSymbol):
+            run(loop, rg.call(rg.PRIORITY_SCAN, fn, 'X/KRW'))
+    assert rg._breakers['fetch_ticker']['opened_at'] is None
+
+
+def test_order_methods_are_never_blocked(loop):
+    calls = []
+    fn = named('create_order', lambda *a: calls.append(a) or (_ for _ in ()).throw(ConnectionError("down")))
+    for _ in range(rg.BREAKER_FAIL_THRESHOLD + 2):
+        with pytest.raises(ConnectionError):
+            run(loop, rg.call(rg.PRIORITY_ORDER, fn, 'A/KRW'))
+    assert len(calls) == rg.BREAKER_FAIL_THRESHOLD + 2
+
+
+def test_single_flight_shares_result_but_not_behind_lower_priority(loop):
+    import asyncio
+    calls = []
+    fn = named('fetch_ohlcv', lambda symbol: calls.append(symbol) or [[1]])
+    bucket = rg._buckets['public']
+
+    async def same_priority():
+        return await asyncio.gather(rg.call(rg.PRIORITY_SCAN, fn, 'A/KRW'), rg.call(rg.PRIORITY_SCAN, fn, 'A/KRW'))
+    first, second = run(loop, same_priority())
+    assert first is second and calls == ['A/KRW']
+
+    calls.clear()
+    bucket.tokens, bucket.updated = 0.0, loop.time()  # 첫 요청이 토큰 대기 중인 상태
+
+    async def higher_priority_joins_later():
+        low = asyncio.ensure_future(rg.call(rg.PRIORITY_ANALYTICS, fn, 'A/KRW'))
+        await asyncio.sleep(0)
+        return await asyncio.gather(low, rg.call(rg.PRIORITY_MONITOR, fn, 'A/KRW'))
+    run(loop, higher_priority_joins_later())
+    assert calls == ['A/KRW', 'A/KRW']  # 감시 요청은 분석 요청 뒤에 묶이지 않고 따로 보냄
@@ -0,0 +1,40 @@
+import time
+
+import pytest
+
+import session_replay
+
+
+def call(t, method, args, result):
+    return {'type': 'call', 't': t, 'm': method, 'a': args, 'k': {}, 'r': result}
+
+
+@pytest.fixture
+def exchange():
+    return session_replay.ReplayExchange([
+        call(100, 'fetch_ticker', ['A/KRW'], {'last': 1}),
+        call(200, 'fetch_ticker', ['A/KRW'], {'last': 2}),
+        call(300, 'fetch_ticker', ['A/KRW'], {'last': 3}),
+        call(150, 'fetch_ohlcv', ['A/KRW', '30m'], [[1]]),
+        call(250, 'fetch_ohlcv', ['A/KRW', '30m'], [[2]]),
+    ])
+
+
+def test_exact_calls_are_consumed_in_order_then_repeat_last(exchange):
+    answers = [exchange.fetch_ticker('A/KRW')['last'] for _ in range(4)]
+    assert answers == [1, 2, 3, 3]
+    assert not exchange.misses
+
+
+@pytest.mark.parametrize('now, expected', [(0, [[1]]), (190, [[1]]), (210, [[2]]), (999, [[2]])])
+def test_argument_miss_uses_record_nearest_to_replay_time(exchange, monkeypatch, now, expected):
+    monkeypatch.setattr(time, 'time', lambda: now)
+    assert exchange.fetch_ohlcv('A/KRW', '30m', limit=5) == expected
+    assert exchange.fetch_ohlcv('A/KRW', '30m', limit=5) == expected  # 근접 기록은 소비하지 않음
+    assert exchange.misses['fetch_ohlcv'] == 2
+
+
+def test_other_symbol_is_never_served(exchange):
+    with pytest.raises(Exception, match="기록 없음"):
+        exchange.fetch_ticker('B/KRW')
+    assert exchange.misses['fetch_ticker'] == 1
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+import strategy
+from candles import Candles
+
+BAR_TS = 1_700_000_000_000
+
+
+def bars(live_close=1000.0, live_vol=3000.0):
+    rows = [[BAR_TS - (199 - i) * 1_800_000, 1000, 1001, 999, 1000, 3000] for i in range(199)]
+    return Candles.from_ohlcv(rows + [[BAR_TS + 1_800_000, 1000, 1001, 999, live_close, live_vol]])
+
+
+def one_min(n=31, last_vol=100.0, last_close=1000.0, start=0):
+    rows = [[BAR_TS + (start + i) * 60_000, 1000, 1000, 1000, 1000, 100.0] for i in range(n)]
+    rows[-1][4:] = [last_close, last_vol]
+    return rows
+
+
+def test_current_minute_row_does_not_change_key_without_surge():
+    a = strategy.live_signature(bars(), one_min(last_vol=10))
+    b = strategy.live_signature(bars(), one_min(last_vol=40, start=1))
+    assert a == b
+
+
+def test_surge_precondition_keys_on_1m_rows():
+    surging = one_min(last_vol=1000, last_close=1040)
+    assert strategy.surge_1m_possible(1040, surging)
+    sig = strategy.live_signature(bars(live_close=1040), surging)
+    assert sig[3] is not None
+    assert sig != strategy.live_signature(bars(live_close=1040), one_min(last_vol=10, last_close=1040))
+
+
+@pytest.mark.parametrize('close, vol, same', [
+    (1000.2, 3000, True),  # 유효숫자 4자리 안의 변화
+    (1001, 3000, False),
+    (1000, 3004, True),  # 유효숫자 3자리 안의 변화
+    (1000, 3020, False),
+])
+def test_live_bar_rounding(close, vol, same):
+    assert (strategy.live_signature(bars(), None) == strategy.live_signature(bars(close, vol), None)) is same
+
+
+def test_scan_candles_evicted_on_new_bar(monkeypatch):
+    monkeypatch.setattr(strategy, '_scan_candles', {})
+    monkeypatch.setattr(strategy, '_scan_candles_bar_ts', None)
+    strategy.put_scan_candles('A/KRW', BAR_TS, bars())
+    strategy.put_scan_candles('B/KRW', BAR_TS, bars())
+    strategy.put_scan_candles('A/KRW', BAR_TS + 1_800_000, bars())
+    assert set(strategy._scan_candles) == {'A/KRW'}
+    assert strategy.get_scan_candles('A/KRW', BAR_TS + 1_800_000) is not None
+    assert strategy.get_scan_candles('B/KRW', BAR_TS + 1_800_000) is None
+
+
+def test_warning_list_survives_failed_first_fetch_after_restore(monkeypatch):
+    monkeypatch.setattr(strategy, '_warning_set', frozenset())
+    monkeypatch.setattr(strategy, '_warning_live', False)
+    monkeypatch.setattr(strategy, '_warning_fetched_at', 0.0)
+    results = [ValueError("timeout"), frozenset({'NEW'})]
+
+    async def call(priority, fn, *args, **kwargs):
+        result = results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+    monkeypatch.setattr(strategy.rate_governor, 'call', call)
+
+    strategy.restore_warning_list(['OLD', 'RISK'])
+    assert not asyncio.run(strategy.refresh_warning_list())
+    assert strategy.get_warning_list() == {'OLD', 'RISK'}  # 조회 실패 → 스냅샷 목록 유지
+    assert strategy.warning_list_snapshot() == ['OLD', 'RISK']
+
+    assert asyncio.run(strategy.refresh_warning_list())
+    assert strategy.get_warning_list() == {'NEW'}
+    strategy.restore_warning_list(['OLD'])  # 조회 성공 뒤의 복구는 무시
+    assert strategy.get_warning_list() == {'NEW'}
+
+
+def test_prescreen_counts_only_newly_avoided_fetches_and_returns_price_drops():
+    tickers = {
+        'LOW/KRW': {'last': 5, 'quoteVolume': 1e9, 'high': 6, 'low': 4},
+        'HIGH/KRW': {'last': 50_000, 'quoteVolume': 1e9, 'high': 51_000, 'low': 49_000},
+        'THIN/KRW': {'last': 100, 'quoteVolume': 1, 'high': 101, 'low': 99},
+        'FLAT/KRW': {'last': 100, 'quoteVolume': 1e9, 'high': 100, 'low': 100},
+        'OK/KRW': {'last': 100, 'quoteVolume': 1e9, 'high': 101, 'low': 99},
+        'WARN/KRW': {'last': 100, 'quoteVolume': 1e9, 'high': 101, 'low': 99},
+    }
+    passed, stats, price_filtered = strategy.prescreen_symbols(list(tickers) + ['NOTICK/KRW'], tickers, {'WARN'})
+    assert passed == ['OK/KRW', 'NOTICK/KRW']
+    assert price_filtered == {'LOW/KRW': 5.0, 'HIGH/KRW': 50_000.0}
+    assert stats['투자유의'] == 1
+    assert strategy.prescreen_saved_requests(stats) == 4 * strategy.PRESCREEN_OHLCV_PER_SYMBOL